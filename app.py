@@ -137,11 +137,17 @@ class MainWindow(QtWidgets.QMainWindow, mainWindow.Ui_MainWindow):
         n_res = query_results['n_res']
         retrieved = len(query_results['docs'])
 
+        cache = self.wiki_index.getCacheInfo()
+
         self.info_search_label.setText('Time : {}s        |        '\
-                                       'Retrieved {} of {} matched'\
+                                       'Retrieved {} of {} matched        |        '\
+                                       'Cache : {} hit / {} miss{}'\
                                        .format(round(seconds, 4),
                                                retrieved, 
-                                               n_res))
+                                               n_res,
+                                               cache['hits'],
+                                               cache['misses'],
+                                               ' (cached)' if query_results.get('cached') else ''))
 
 
     def updateExpandedTerms(self, settings, query_results):
@@ -175,7 +181,9 @@ def main(args_paths):
     if wiki_index.openOrBuild():
         main = MainWindow(wiki_index)
         main.show()
-        sys.exit(app.exec_())
+        ret = app.exec_()
+        wiki_index.close()
+        sys.exit(ret)
 
 
 if __name__ == '__main__':
@@ -190,7 +198,18 @@ if __name__ == '__main__':
         '--corpus',
         type=str,
         default='files/filtered.xml',
-        help='File xml filtrato.')
+        help='File xml filtrato (anche compresso \'.bz2\' o \'.gz\').')
+    p.add_argument(
+        '--corpus_index',
+        type=str,
+        default=None,
+        help='File di indice del dump multistream: gli stream vengono letti uno alla volta, con --workers in parallelo.')
+    p.add_argument(
+        '--reader',
+        type=str,
+        default='sax',
+        choices=['sax', 'expat', 'lxml'],
+        help='Backend usato per la lettura del dump.')
     p.add_argument(
         '--google_links',
         type=str,
@@ -206,6 +225,92 @@ if __name__ == '__main__':
         type=str,
         default='files/table.rank',
         help='File dove salvo il pagerank calcolato')
+    p.add_argument(
+        '--pagerank_engine',
+        type=str,
+        default='snap',
+        choices=['snap', 'numpy'],
+        help='Calcolo del pagerank con snap oppure con NumPy/SciPy sulla matrice CSR del grafo.')
+    p.add_argument(
+        '--graph',
+        type=str,
+        default='files/graph.state',
+        help='File dove salvo lo stato del grafo, necessario per l\'aggiornamento incrementale dell\'indice.')
+    p.add_argument(
+        '--cache_size',
+        type=int,
+        default=1024,
+        help='Numero max di risultati salvati nella cache delle ricerche (0 per disabilitarla).')
+    p.add_argument(
+        '--cache_ttl',
+        type=float,
+        default=300.0,
+        help='Secondi dopo i quali un risultato della cache scade.')
+    p.add_argument(
+        '--expansion_table',
+        type=str,
+        default='files/expansion.table',
+        help='File della tabella dei sinonimi presenti nell\'indice (vedi \'buildExpansionTable.py\'). Se non esiste viene usato solo WordNet.')
+    p.add_argument(
+        '--wsd_max_pairs',
+        type=int,
+        default=5000,
+        help='Numero max di coppie di significati confrontate nella disambiguazione di una query.')
+    p.add_argument(
+        '--wsd_max_time',
+        type=float,
+        default=0.2,
+        help='Secondi max per la disambiguazione di una query (oltre viene usato il primo significato).')
+    p.add_argument(
+        '--expansion_cache',
+        type=str,
+        default='files/expansion.cache',
+        help='File della cache su disco delle espansioni delle query (stringa vuota per disabilitarla).')
+    p.add_argument(
+        '--expansion_cache_size',
+        type=int,
+        default=10000,
+        help='Numero max di espansioni salvate nella cache.')
+    p.add_argument(
+        '--warm_up',
+        action='store_true',
+        help='Caricamento in background di pagerank, nltk e WordNet subito dopo l\'apertura dell\'indice, invece che alla prima ricerca.')
+    p.add_argument(
+        '--metrics',
+        type=str,
+        default=None,
+        choices=['log', 'prometheus'],
+        help='Sink delle metriche di indicizzazione e ricerca (vedi \'indexing/instrumentation.py\'), se non specificato sono disabilitate.')
+    p.add_argument(
+        '--metrics_file',
+        type=str,
+        default='files/metrics.prom',
+        help='File delle metriche per il sink \'prometheus\' (\'{pid}\' viene sostituito con il pid del processo).')
+    p.add_argument(
+        '--metrics_interval',
+        type=float,
+        default=10.0,
+        help='Secondi tra due invii delle metriche al sink.')
+    p.add_argument(
+        '--workers',
+        type=int,
+        default=0,
+        help='Processi usati per il filtraggio delle pagine durante la creazione dell\'indice (0 = nessuna pipeline).')
+    p.add_argument(
+        '--checkpoint_pages',
+        type=int,
+        default=0,
+        help='Pagine indicizzate tra due checkpoint della creazione dell\'indice (0 = nessun checkpoint).')
+    p.add_argument(
+        '--merge_segment_docs',
+        type=int,
+        default=0,
+        help='Alla fine della creazione dell\'indice vengono uniti i segmenti con meno documenti di questo valore, es: quelli dei checkpoint (0 = nessun merge).')
+    p.add_argument(
+        '--no_resume',
+        dest='resume',
+        action='store_false',
+        help='Ricrea l\'indice da zero anche se è presente il checkpoint di una creazione interrotta.')
 
     args_paths = p.parse_args()   
 
@@ -0,0 +1,442 @@
+from indexing.xmlParsing import saxReader, dumpInput
+from indexing.xmlParsing.filterText import FilterWikiText
+from indexing.searching.searchPool import SearchPool
+from indexing.searching.searcher import WikiSearcher
+from indexing.evaluation import Evaluator
+
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+
+"""
+Script per misurare le prestazioni delle diverse fasi del motore di ricerca.
+Ogni fase ha un proprio sotto-comando, es:  python benchmark.py clean --corpus files/filtered.xml
+"""
+
+
+def loadPages(path_corpus):
+    """
+    Lettura delle pagine valide (non filtrate) del corpus.
+
+    :param path_corpus: path del file xml
+    return lista di dict (title, id, text)
+    """
+    pages = []
+    saxReader.startParse(path_corpus, saxReader.PageRecordHandler(lambda **page: pages.append(page)))
+    return pages
+
+
+def timeIt(fn, repeat):
+    """
+    Esegue 'repeat' volte la funzione e ritorna il tempo migliore.
+
+    :param fn: funzione senza argomenti da misurare
+    :param repeat: numero di ripetizioni
+    return tempo migliore in secondi
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        end = time.perf_counter()
+        if best is None or end-start < best:
+            best = end-start
+    return best
+
+
+def cleanBenchmark(args):
+    """
+    Misura del tempo di 'FilterWikiText.getCleaned' sulle pagine del corpus.
+    Il confronto con l'implementazione di riferimento si trova in 'tests/test_filterText.py'.
+
+    :param args: argomenti da linea di comando
+    return pagine pulite al secondo
+    """
+    pages = loadPages(args.corpus)
+    texts = [page['text'] for page in pages]
+
+    t_cleaned = timeIt(lambda: [FilterWikiText.getCleaned(t) for t in texts], args.repeat)
+
+    n_bytes = sum(len(t) for t in texts)
+    print('Pagine : {}   |   Caratteri : {}'.format(len(texts), n_bytes))
+    print('getCleaned : {}s   ({} pagine/s)'.format(round(t_cleaned, 5), round(len(texts)/t_cleaned, 1)))
+    return len(texts)/t_cleaned
+
+
+def linksBenchmark(args):
+    """
+    Misura della velocità di risoluzione dei link ('LinkResolver') sulle pagine del corpus.
+
+    :param args: argomenti da linea di comando
+    return numero di link risolti al secondo
+    """
+    pages = loadPages(args.corpus)
+    resolver = FilterWikiText(args.interwiki_links).link_resolver
+
+    n_links = sum(len(resolver.link_pattern.findall(page['text'])) for page in pages)
+    n_resolved = sum(len(resolver.resolve(page['text'], page['title'])['links']) for page in pages)
+
+    t_resolve = timeIt(lambda: [resolver.resolve(page['text'], page['title']) for page in pages], args.repeat)
+
+    links_per_second = n_links/t_resolve
+    print('Pagine : {}   |   Link : {}   |   Link validi : {}'.format(len(pages), n_links, n_resolved))
+    print('LinkResolver.resolve : {}s   ({} link/s)'.format(round(t_resolve, 5), round(links_per_second, 1)))
+
+    return links_per_second
+
+
+def handlerBenchmark(args):
+    """
+    Misura del tempo di accumulo del testo nel 'BaseContentHandler' per pagine sempre più lunghe.
+    Il testo viene passato all'handler in chunk piccoli (come fa expat): se l'accumulo è lineare,
+    il tempo per MB deve rimanere costante al crescere della pagina.
+
+    :param args: argomenti da linea di comando
+    return dict con dimensione della pagina (MB) e tempo per MB
+    """
+    chunk = 'x' * args.chunk_size
+    res = {}
+
+    for size_mb in (1, 2, 4, 8, 16):
+        n_chunks = size_mb * 1024 * 1024 // args.chunk_size
+
+        def readPage():
+            handler = saxReader.PageRecordHandler(lambda **page: None)
+            handler.startElement('page', {})
+            handler.startElement('text', {})
+            for _ in range(n_chunks):
+                handler.characters(chunk)
+            handler.endElement('text')
+            handler.endElement('page')
+
+        t_page = timeIt(readPage, args.repeat)
+        res[size_mb] = t_page/size_mb
+        print('Pagina {} MB : {}s   ({}s per MB)'.format(size_mb, round(t_page, 5), round(t_page/size_mb, 5)))
+
+    return res
+
+
+def readersBenchmark(args):
+    """
+    Misura delle pagine lette al secondo dai diversi backend di 'saxReader.readPages' (senza 
+    filtraggio del testo) e controllo che i record letti siano identici a quelli del parser SAX.
+
+    :param args: argomenti da linea di comando
+    return dict con backend e pagine al secondo
+    """
+    def readAll(reader):
+        pages = []
+        with dumpInput.openDump(args.corpus) as fp:
+            saxReader.readPages(fp, lambda **page: pages.append(page), reader)
+        return pages
+
+    reference = readAll('sax')
+    res = {}
+
+    for reader in ('sax', 'expat', 'lxml'):
+        try:
+            same = readAll(reader) == reference
+        except ImportError as e:
+            print(reader+' : '+str(e))
+            continue
+
+        t_read = timeIt(lambda: readAll(reader), args.repeat)
+        res[reader] = len(reference)/t_read
+        print('{:6} : {}s   ({} pagine/s)   {}'.format(reader, round(t_read, 5), round(res[reader], 1),
+                                                       'identico a sax' if same else '! DIVERSO da sax'))
+
+    return res
+
+
+def loadQueries(path_queries):
+    """
+    Lettura delle query: chiavi del file json dei link di Google oppure una query per riga.
+
+    :param path_queries: path del file delle query
+    return lista di query
+    """
+    with open(path_queries, 'r') as fp:
+        if path_queries.endswith('.json'):
+            return list(json.load(fp).keys())
+        return [line.strip() for line in fp if line.strip()]
+
+
+def searchBenchmark(args):
+    """
+    Query al secondo eseguite in parallelo da 'SearchPool' al variare del numero di worker.
+    Per ogni numero di worker le query vengono eseguite 'rounds' volte dopo un giro di riscaldamento
+    (apertura dei reader e dei searcher); controllo anche che i risultati siano identici a quelli
+    ottenuti con un solo worker.
+
+    :param args: argomenti da linea di comando
+    return dict con numero di worker e query al secondo
+    """
+    queries = loadQueries(args.queries)
+    settings = {'limit': args.limit, 'exp': args.exp, 'page_rank': args.page_rank,
+                'weighting': args.weighting, 'group': args.group}
+
+    def titles(results):
+        return [[doc['title'] for doc in res['docs']] for res in results]
+
+    reference = None
+    res = {}
+
+    for n_workers in [int(n) for n in args.workers.split(',')]:
+        with SearchPool(args, n_workers, args.mode) as pool:
+            same = titles(pool.map(queries, **settings))
+            if reference is None:
+                reference = same
+
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                pool.map(queries, **settings)
+            elapsed = time.perf_counter() - start
+
+        res[n_workers] = len(queries)*args.rounds/elapsed
+        print('{:3} {} : {} query/s   {}'.format(n_workers, args.mode, round(res[n_workers], 1),
+                                                  'risultati identici' if same == reference else '! RISULTATI DIVERSI'))
+
+    return res
+
+
+def syntheticQueries(index_dir, n_queries, seed=None, max_terms=3):
+    """
+    Query sintetiche composte da 1...max_terms termini scelti a caso tra i più frequenti nei titoli.
+
+    :param index_dir: folder indice whoosh
+    :param n_queries: numero di query
+    :param seed: seed del generatore casuale
+    :param max_terms: numero max di termini per query
+    return lista di query
+    """
+    from whoosh import index as whoosh_index
+
+    with whoosh_index.open_dir(index_dir).reader() as reader:
+        terms = [term.decode('utf-8') for _, term in reader.most_frequent_terms('title', 1000)]
+
+    rnd = random.Random(seed)
+    return [' '.join(rnd.sample(terms, rnd.randint(1, min(max_terms, len(terms))))) for _ in range(n_queries)]
+
+
+def percentiles(values, points=(50, 95, 99)):
+    """
+    :param values: lista di valori
+    :param points: percentili da calcolare
+    return dict 'p50', 'p95', .. -> valore
+    """
+    cuts = statistics.quantiles(values, n=100, method='inclusive') if len(values) > 1 else values*99
+    return {'p'+str(point): cuts[point-1] for point in points}
+
+
+def latencyBenchmark(args):
+    """
+    Latenza e query al secondo al variare della concorrenza: 'concurrency' client eseguono le query
+    (ognuno attende il risultato prima di inviare la successiva) su un 'SearchPool' con altrettanti
+    worker. La latenza è misurata dal client e comprende la serializzazione json del risultato
+    (come nel server); per ogni fase della ricerca (vedi 'WikiSearcher.search') sono riportati
+    media e p95 dei tempi misurati nei worker.
+    Con 'baseline' i risultati vengono confrontati con quelli salvati in precedenza ('save'): se la
+    latenza p95 o le query al secondo peggiorano oltre 'tolerance' il comando termina con errore.
+
+    :param args: argomenti da linea di comando
+    return dict concorrenza -> dict dei risultati
+    """
+    queries = loadQueries(args.queries) if args.queries else list(Evaluator.test_queries)
+    if args.synthetic > 0:
+        queries += syntheticQueries(args.index_dir, args.synthetic, args.seed)
+    settings = {'limit': args.limit, 'exp': args.exp, 'page_rank': args.page_rank,
+                'weighting': args.weighting, 'group': args.group, 'highlight': not args.no_highlight}
+    stages = WikiSearcher.stages + ('serialize',)
+
+    res = {}
+    for concurrency in [int(n) for n in args.concurrency.split(',')]:
+        with SearchPool(args, concurrency, args.mode) as pool:
+            pool.map(queries, **settings)     # riscaldamento: reader, searcher, pagerank, nltk
+
+            def client(texts):
+                measures = []
+                for text in texts:
+                    start = time.perf_counter()
+                    result = pool.submit(text, **settings).result()
+                    serialize_start = time.perf_counter()
+                    json.dumps(result)
+                    end = time.perf_counter()
+                    measures.append((end-start, dict(result['timings'], serialize=end-serialize_start)))
+                return measures
+
+            work = queries*args.rounds
+            with ThreadPoolExecutor(concurrency) as clients:
+                start = time.perf_counter()
+                measures = [m for chunk in clients.map(client, [work[i::concurrency] for i in range(concurrency)])
+                              for m in chunk]
+                elapsed = time.perf_counter() - start
+
+        latencies = [latency for latency, _ in measures]
+        res[concurrency] = {'qps': len(measures)/elapsed,
+                            **percentiles(latencies),
+                            'stages': {stage: {'mean': statistics.mean(timings[stage] for _, timings in measures),
+                                               'p95': percentiles([timings[stage] for _, timings in measures])['p95']}
+                                       for stage in stages},
+                            }
+
+        report = res[concurrency]
+        print('{:3} {} : {:8.1f} query/s   p50 {:7.1f} ms   p95 {:7.1f} ms   p99 {:7.1f} ms'.format(
+              concurrency, args.mode, report['qps'], report['p50']*1000, report['p95']*1000, report['p99']*1000))
+        print('      '+'   '.join('{} {:.2f}/{:.2f}'.format(stage, report['stages'][stage]['mean']*1000,
+                                                            report['stages'][stage]['p95']*1000) for stage in stages)
+              +'   (ms media/p95)')
+
+    if args.save is not None:
+        with open(args.save, 'w') as fp:
+            json.dump(res, fp, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as fp:
+            baseline = {int(concurrency): report for concurrency, report in json.load(fp).items()}
+
+        regressions = []
+        for concurrency, report in res.items():
+            if concurrency not in baseline:
+                continue
+            if report['p95'] > baseline[concurrency]['p95']*(1+args.tolerance):
+                regressions.append('{} : p95 {:.1f} ms (baseline {:.1f} ms)'.format(
+                                   concurrency, report['p95']*1000, baseline[concurrency]['p95']*1000))
+            if report['qps'] < baseline[concurrency]['qps']*(1-args.tolerance):
+                regressions.append('{} : {:.1f} query/s (baseline {:.1f} query/s)'.format(
+                                   concurrency, report['qps'], baseline[concurrency]['qps']))
+
+        for regression in regressions:
+            print('! REGRESSIONE con concorrenza '+regression)
+        if regressions:
+            sys.exit(1)
+        print('Nessuna regressione rispetto a '+args.baseline)
+
+    return res
+
+
+def startupBenchmark(args):
+    """
+    Tempi di avvio divisi per componente (import, apertura indice, prima ricerca, nltk, WordNet, ..),
+    misurati da 'indexing.startupProfile' in un processo nuovo per ogni round (mediana dei round).
+    'process' è il tempo totale del processo, compreso l'avvio dell'interprete.
+
+    :param args: argomenti da linea di comando
+    return dict con la mediana dei secondi di ogni fase
+    """
+    cmd = [sys.executable, '-m', 'indexing.startupProfile', '--index_dir', args.index_dir,
+           '--pagerank', args.pagerank, '--text', args.text, '--text_expanded', args.text_expanded]
+    if args.expansion_table is not None:
+        cmd += ['--expansion_table', args.expansion_table]
+
+    rounds = []
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        out = subprocess.run(cmd, stdout=subprocess.PIPE, check=True, universal_newlines=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        total = time.perf_counter() - start
+
+        timings = json.loads(out.strip().splitlines()[-1])
+        timings['process'] = total
+        rounds.append(timings)
+
+    res = {name: statistics.median(timings[name] for timings in rounds) for name in rounds[0]}
+    for name, seconds in res.items():
+        print('{:22} : {:8.1f} ms'.format(name, seconds*1000))
+
+    return res
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Benchmark delle fasi del motore di ricerca.')
+    p.add_argument(
+        '--corpus',
+        type=str,
+        default='files/filtered.xml',
+        help='File xml su cui eseguire i benchmark.')
+    p.add_argument(
+        '--repeat',
+        type=int,
+        default=5,
+        help='Numero di ripetizioni di ogni misura (viene preso il tempo migliore).')
+    p.add_argument(
+        '--interwiki_links',
+        type=str,
+        default='files/interwiki.prefix',
+        help='File per gli interwiki links.')
+    p.add_argument(
+        '--chunk_size',
+        type=int,
+        default=64,
+        help='Dimensione dei chunk di testo passati all\'handler.')
+
+    commands = p.add_subparsers(dest='command')
+    commands.add_parser('clean', help='Tempi di FilterWikiText.getCleaned.').set_defaults(fn=cleanBenchmark)
+    commands.add_parser('links', help='Link risolti al secondo da LinkResolver.').set_defaults(fn=linksBenchmark)
+    commands.add_parser('handler', help='Tempo di accumulo del testo di pagine lunghe nel ContentHandler.').set_defaults(fn=handlerBenchmark)
+    commands.add_parser('readers', help='Pagine al secondo lette da ogni backend di lettura del dump.').set_defaults(fn=readersBenchmark)
+
+    search = commands.add_parser('search', help='Query al secondo eseguite in parallelo al variare dei worker.')
+    search.set_defaults(fn=searchBenchmark)
+    search.add_argument('--index_dir', type=str, default='files/indexdir', help='Folder indice whoosh.')
+    search.add_argument('--pagerank', type=str, default='files/table.rank', help='File del pagerank.')
+    search.add_argument('--queries', type=str, default='files/google_links.json', 
+                        help='Query da eseguire (file json dei link di Google o una query per riga).')
+    search.add_argument('--workers', type=str, default='1,2,4', help='Numero di worker da provare, separati da virgola.')
+    search.add_argument('--mode', type=str, default='process', choices=SearchPool.modes, help='Pool di thread o di processi.')
+    search.add_argument('--rounds', type=int, default=5, help='Numero di volte in cui vengono eseguite tutte le query.')
+    search.add_argument('--limit', type=int, default=10, help='Numero max di documenti per query.')
+    search.add_argument('--weighting', type=str, default='BM25F', help='Metodo di weighting.')
+    search.add_argument('--group', type=str, default='OR', help='Come vengono concatenati i token della query.')
+    search.add_argument('--exp', action='store_true', help='Abilita il query expansion.')
+    search.add_argument('--page_rank', action='store_true', help='Abilita il pagerank.')
+    search.add_argument('--cache_size', type=int, default=0,
+                        help='Dimensione della cache dei risultati (0: ogni query viene eseguita davvero).')
+    search.add_argument('--expansion_cache', type=str, default=None, help='File della cache delle espansioni.')
+
+    latency = commands.add_parser('latency', help='Latenza (p50/p95/p99), query al secondo e tempi delle fasi della ricerca.')
+    latency.set_defaults(fn=latencyBenchmark)
+    latency.add_argument('--index_dir', type=str, default='files/indexdir', help='Folder indice whoosh.')
+    latency.add_argument('--pagerank', type=str, default='files/table.rank', help='File del pagerank.')
+    latency.add_argument('--expansion_table', type=str, default=None, help='File della tabella di espansione.')
+    latency.add_argument('--expansion_cache', type=str, default=None, help='File della cache delle espansioni.')
+    latency.add_argument('--cache_size', type=int, default=0,
+                         help='Dimensione della cache dei risultati (0: ogni query viene eseguita davvero).')
+    latency.add_argument('--queries', type=str, default=None,
+                         help='Query da eseguire (file json dei link di Google o una query per riga), se non specificato le query dell\'evaluation.')
+    latency.add_argument('--synthetic', type=int, default=0, help='Numero di query sintetiche aggiunte (termini frequenti dei titoli).')
+    latency.add_argument('--seed', type=int, default=0, help='Seed delle query sintetiche.')
+    latency.add_argument('--concurrency', type=str, default='1,4', help='Numero di client (e di worker) da provare, separati da virgola.')
+    latency.add_argument('--mode', type=str, default='process', choices=SearchPool.modes, help='Pool di thread o di processi.')
+    latency.add_argument('--rounds', type=int, default=3, help='Numero di volte in cui vengono eseguite tutte le query.')
+    latency.add_argument('--limit', type=int, default=10, help='Numero max di documenti per query.')
+    latency.add_argument('--weighting', type=str, default='BM25F', help='Metodo di weighting.')
+    latency.add_argument('--group', type=str, default='OR', help='Come vengono concatenati i token della query.')
+    latency.add_argument('--exp', action='store_true', help='Abilita il query expansion.')
+    latency.add_argument('--page_rank', action='store_true', help='Abilita il pagerank.')
+    latency.add_argument('--no_highlight', action='store_true', help='Disabilita il calcolo degli highlights.')
+    latency.add_argument('--save', type=str, default=None, help='File json dove salvare i risultati (es: da usare come baseline).')
+    latency.add_argument('--baseline', type=str, default=None, help='File json dei risultati con cui confrontare quelli attuali.')
+    latency.add_argument('--tolerance', type=float, default=0.2, help='Peggioramento relativo massimo rispetto alla baseline.')
+
+    startup = commands.add_parser('startup', help='Tempi di avvio di un processo divisi per componente.')
+    startup.set_defaults(fn=startupBenchmark)
+    startup.add_argument('--index_dir', type=str, default='files/indexdir', help='Folder indice whoosh.')
+    startup.add_argument('--pagerank', type=str, default='files/table.rank', help='File del pagerank.')
+    startup.add_argument('--expansion_table', type=str, default=None, help='File della tabella di espansione.')
+    startup.add_argument('--rounds', type=int, default=3, help='Numero di processi avviati.')
+    startup.add_argument('--text', type=str, default='roman empire', help='Query eseguita senza espansione.')
+    startup.add_argument('--text_expanded', type=str, default='ancient greek city', help='Query eseguita con espansione.')
+
+    args = p.parse_args()
+
+    if args.command is None:
+        p.print_help()
+    else:
+        args.fn(args)
@@ -0,0 +1,29 @@
+from indexing import index
+
+import argparse
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Creazione della tabella dei sinonimi di WordNet presenti nell\'indice, usata dal query expansion.')
+    p.add_argument(
+        '--index_dir',
+        type=str,
+        default='files/indexdir',
+        help='Folder indice whoosh (l\'indice deve essere già stato creato).')
+    p.add_argument(
+        '--pagerank',
+        type=str,
+        default='files/table.rank',
+        help='File del pagerank calcolato.')
+    p.add_argument(
+        '--expansion_table',
+        type=str,
+        default='files/expansion.table',
+        help='File dove salvo la tabella.')
+
+    args_paths = p.parse_args()
+
+    wiki_index = index.WikiIndex(args_paths)
+    if wiki_index.open():
+        wiki_index.buildExpansionTable()
+        wiki_index.close()
@@ -96,7 +96,7 @@ if __name__ == '__main__':
         '--source',
         type=str,
         default=None,
-        help='File xml da filtrare')
+        help='File xml da filtrare (anche compresso \'.bz2\' o \'.gz\')')
     p.add_argument(
         '--dest',
         type=str,
@@ -1,5 +1,3 @@
-import nltk 
-
 from whoosh.analysis import Filter
       
 
@@ -10,11 +8,17 @@ class LemmatizerFilter(Filter):
 
     def __init__(self):
         """
-        Inizializzazione del lemmatizer.
+        Il lemmatizer (e quindi nltk e WordNet) viene creato al primo utilizzo del filtro, non
+        quando viene creato l'analyzer.
 
         :param self
         """
-        self.lemmatizer = nltk.WordNetLemmatizer()
+        self.lemmatizer = None
+
+
+    def __getstate__(self):
+        # il lemmatizer non viene salvato con lo schema dell'indice
+        return {'lemmatizer': None}
 
     
     def __call__(self, tokens):
@@ -25,6 +29,10 @@ class LemmatizerFilter(Filter):
         :param tokens: tokens da lemmatizzare
         yield: token lemmatizzato 
         """
+        if self.lemmatizer is None:
+            import nltk
+            self.lemmatizer = nltk.WordNetLemmatizer()
+
         for token in tokens:
             token.text = self.lemmatizer.lemmatize(token.text)
             yield token
\ No newline at end of file
@@ -3,34 +3,56 @@ import json
 
 import os, os.path, re
 
+import numpy as np
+
 from . import testSet
+from .searching.searchPool import SearchPool
 #import testSet
   
 class Evaluator:
     """
     Classe per l'evaluation del sistema.
+
+    I documenti ritornati e quelli rilevanti vengono convertiti una sola volta in array
+    (query x posizione nel ranking, vedi '__judgments()'), dai quali tutte le misure sono calcolate
+    per tutte le query insieme (vedi 'metrics()').
     """
+
+    levels = 10                         # livelli di recall (1...10)
+
+    rel_gt = [6,5,4,3,2,1,1,1,1,1]      # rilevanza dei documenti del ground truth (vedi 'getRelevanceVector()')
+
+    workers = min(8, os.cpu_count() or 1)   # thread usati per le query se non viene passato un pool
+
+    # query dell'evaluation (usate anche dal benchmark della latenza)
+    test_queries = ('DNA', 'Apple', 'Epigenetics', 'Hollywood', 'Maya',
+                    'Microsoft', 'Precision', 'Tuscany', '99 balloons',
+                    'Computer Programming', 'Financial meltdown',
+                    'Justin Timberlake', 'Least Squares', 'Mars robots',
+                    'Page six', 'Roman Empire', 'Solar energy', 'Statistical Significance',
+                    'Steve Jobs', 'The Maya', 'Triple Cross', 'US Constitution',
+                    'Eye of Horus', 'Madam I’m Adam', 'Mean Average Precision',
+                    'Physics Nobel Prizes', 'Read the manual', 'Spanish Civil War',
+                    'Do geese see god', 'Much ado about nothing')
     
-    def __init__(self, index, settings):
+    def __init__(self, index, settings, pool=None, workers=None):
         """
         Inizializzazione della classe. Qua definisco le query e calcolo i set per l'evaluation.
 
         :param self
         :param index: index su cui fare l'evaluation
         :param settings: dict che contiene i settings con cui eseguire le query
+        :param pool: SearchPool con cui eseguire le query in parallelo (se None viene usato un pool di
+                     'workers' thread sull'indice passato, vedi '__computeRetrievalSet()')
+        :param workers: thread usati se il pool non è passato (None per 'Evaluator.workers', 1 per
+                        eseguire le query in sequenza)
         """
-        self.queries = set(('DNA', 'Apple', 'Epigenetics', 'Hollywood', 'Maya',
-                           'Microsoft', 'Precision', 'Tuscany', '99 balloons',
-                           'Computer Programming', 'Financial meltdown',
-                           'Justin Timberlake', 'Least Squares', 'Mars robots',
-                           'Page six', 'Roman Empire', 'Solar energy', 'Statistical Significance',
-                           'Steve Jobs', 'The Maya', 'Triple Cross', 'US Constitution',
-                           'Eye of Horus', 'Madam I’m Adam', 'Mean Average Precision', 
-                           'Physics Nobel Prizes', 'Read the manual', 'Spanish Civil War',
-                           'Do geese see god', 'Much ado about nothing'))
+        self.queries = set(Evaluator.test_queries)
         
         self.R_set = self.__computeTestSet(index, 30, 10)
-        self.A_set = self.__computeRetrievalSet(index, settings)
+        self.A_set = self.__computeRetrievalSet(index, settings, pool, workers)
+
+        self.__cache_judgments = None
 
         """
         self.queries = set(('q1', 'q2'))
@@ -61,74 +83,199 @@ class Evaluator:
         return google_set
 
     
-    def __computeRetrievalSet(self, index, settings):
+    def __computeRetrievalSet(self, index, settings, pool=None, workers=None):
         """
         Viene utilizzato il nostro modello IR per ricavare i documenti in base ad una data query.
+        Le query vengono inviate tutte insieme al pool e gli highlights non vengono calcolati, dato
+        che per l'evaluation servono solo i link dei documenti.
+        Se il pool non è passato, le query sono eseguite da un pool di 'workers' thread (default
+        'Evaluator.workers') sullo stesso indice (ogni thread ha il proprio reader), in sequenza se
+        'workers' è 1. Il pool viene chiuso alla fine, quindi per valutare molte configurazioni
+        conviene passare un pool che rimane aperto (es: 'parameterSweep.sweep()').
+
         return: docs dizionario dei documenti ricavati dal nostro modello IR.
         """
         if settings['limit'] <= 0:
             settings['limit'] = 10      
 
-        docs = {}
-        for query in self.queries:
-            docs[query] = [doc['link'] for doc in index.query(query, **settings)['docs']]
+        queries = sorted(self.queries)
+        query_settings = dict(settings, highlight=False)
+
+        if workers is None:
+            workers = Evaluator.workers
+
+        if pool is not None:
+            results = pool.map(queries, **query_settings)
+        elif workers > 1:
+            with SearchPool(index.args_paths, workers, 'thread', wiki_index=index) as thread_pool:
+                results = thread_pool.map(queries, **query_settings)
+        else:
+            results = [index.query(query, **query_settings) for query in queries]
 
-        return docs
+        return {query: [doc['link'] for doc in res['docs']] for query, res in zip(queries, results)}
 
 
-    def __getPrecsionAndRecall(self, query, rank_pos=10):
+    def __judgments(self):
         """
-        Calcolo della precision e della recall per una determinata query ad una certa 
-        posizione nel ranking.
+        Conversione di A_set e R_set in array, calcolata una sola volta (di nuovo solo se A_set o
+        R_set vengono sostituiti). Le righe sono le query (nell'ordine di self.queries), le colonne le
+        posizioni nel ranking (le query con meno documenti ritornati hanno colonne False/0).
+
+            - 'hits': True se il documento ritornato è rilevante;
+            - 'first_hits': come 'hits', ma solo per la prima occorrenza del documento nel ranking
+                            (per le misure calcolate sugli insiemi dei documenti);
+            - 'gains': rilevanza del documento ritornato (vedi 'getRelevanceVector()');
+            - 'n_retrieved', 'n_relevant': numero di documenti ritornati e rilevanti.
 
         :param self
-        :param query: query su cui calcolare precision e recall
-        :param rank_pos: posizione del rank su cui calcolare precision e recall
-        return precision, recall
+        return dict degli array
         """
-        if rank_pos > len(self.A_set[query]):
-            print('Valore di rank_pos troppo grande.')
-            rank_pos = len(self.A_set[query])
+        key = (id(self.A_set), id(self.R_set))
+        if self.__cache_judgments is not None and self.__cache_judgments[0] == key:
+            return self.__cache_judgments[1]
+
+        queries = list(self.queries)
+        n_cols = max([len(self.A_set[query]) for query in queries] + [1])
+
+        hits = np.zeros((len(queries), n_cols), dtype=bool)
+        first_hits = np.zeros((len(queries), n_cols), dtype=bool)
+        gains = np.zeros((len(queries), n_cols))
+
+        for i, query in enumerate(queries):
+            doc_rel_gt = {doc: Evaluator.rel_gt[pos] for pos, doc in enumerate(self.R_set[query])}
+            seen = set()
+            for j, doc in enumerate(self.A_set[query]):
+                if doc in doc_rel_gt:
+                    hits[i, j] = True
+                    first_hits[i, j] = doc not in seen
+                    gains[i, j] = doc_rel_gt[doc]
+                seen.add(doc)
+
+        judgments = {'queries': queries,
+                     'hits': hits,
+                     'first_hits': first_hits,
+                     'gains': gains,
+                     'n_retrieved': np.array([len(self.A_set[query]) for query in queries]),
+                     'n_relevant': np.array([len(self.R_set[query]) for query in queries]),
+                     }
+        self.__cache_judgments = (key, judgments)
+        return judgments
+
+
+    def __precisionAtLevels(self, judgments):
+        """
+        Precision di ogni query ad ogni livello di recall (1...10): per il livello l è la precision
+        alla posizione del l-esimo documento rilevante ritornato, 0 se non ce ne sono l.
+
+        :param self
+        :param judgments: array di '__judgments()'
+        return matrice query x livelli
+        """
+        hits = judgments['hits']
+        levels = np.arange(1, Evaluator.levels+1)
 
-        a = len(self.A_set[query][:rank_pos])
+        found_at = hits[:, None, :] & (hits.cumsum(axis=1)[:, None, :] == levels[None, :, None])
+        positions = found_at.argmax(axis=2) + 1     # le posizioni partono da 1
 
-        r = len(self.R_set[query])
+        return np.where(found_at.any(axis=2), levels[None, :] / positions, 0.0)
 
-        ra = len(set(self.R_set[query]) & set(self.A_set[query][:rank_pos]))
 
-        try:
-            precision = ra / a
-        except ZeroDivisionError:
-            precision = 0
+    def __precisionAndRecall(self, judgments, rank_pos=10):
+        """
+        Calcolo della precision e della recall di ogni query ad una certa posizione nel ranking.
 
-        try:
-            recall = ra / r
-        except ZeroDivisionError:
-            recall = 0
+        :param self
+        :param judgments: array di '__judgments()'
+        :param rank_pos: posizione del rank su cui calcolare precision e recall
+        return array delle precision, array delle recall
+        """
+        a = np.minimum(judgments['n_retrieved'], max(rank_pos, 0))
+        ra = judgments['first_hits'][:, :max(rank_pos, 0)].sum(axis=1)
+        r = judgments['n_relevant']
 
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.where(a > 0, ra / a, 0.0)
+            recall = np.where(r > 0, ra / r, 0.0)
         return precision, recall
 
 
-    def __precisonAtLevel(self, query, recall_level):
+    def __DCGs(self, judgments, rank=10, log_base=2):
         """
-        Viene calcolata la precision ad un determinato livello di recall, in riferimento ad una certa query.
+        DCG di tutte le query (vedi 'DCG()'), sommando i termini nello stesso ordine.
 
         :param self
-        :param query: la query in riferimento (suppongo che esista)
-        :param recall_level: livello recall su cui calcolare precision (0...10) per semplicità
-        return: precisione ad un certo livello di recall
+        :param judgments: array di '__judgments()'
+        :param rank: livello di ranking
+        :param log_base: base del logaritmo
+        return array dei valori dcg
         """
-        relevants_retrieved = 0
+        gains = judgments['gains']
+        discounts = np.array([1.0] + [math.log(i, log_base) if i <= rank else np.inf
+                                      for i in range(2, gains.shape[1]+1)])
+        terms = gains / discounts
 
-        # recall_level parte da 1
+        res = np.zeros(len(gains))
+        for j in range(1, gains.shape[1]):
+            res += terms[:, j]
+        return terms[:, 0] + res
 
-        for count_retrieved, retrieved in enumerate(self.A_set[query], 1):
-            if retrieved in self.R_set[query]:
-                relevants_retrieved += 1
 
-                if relevants_retrieved == recall_level:
-                    return relevants_retrieved/count_retrieved  # count_retrieved parte da 1 e non è mai 0
-        return 0
+    def metrics(self, b=1.0, rank_pos=10, r=10, rank=10, round_values=3):
+        """
+        Calcolo di tutte le misure in un solo passaggio sugli array dei documenti (senza stampe),
+        es: per confrontare molte configurazioni della ricerca.
+
+        :param self
+        :param b: parametro della e-measure (vedi 'Emeasure()')
+        :param rank_pos: posizione del rank per e-measure e f-measure
+        :param r: posizione del rank per la r-precision
+        :param rank: livello di ranking dell'ndcg
+        :param round_values: arrotondamento dei valori
+        return dict con 'map', 'avg_precision_at_level', 'r_precision', 'e_measure', 'f_measure',
+               'ndcg', 'avg_ndcg' (le misure per query sono dict con chiavi le query)
+        """
+        judgments = self.__judgments()
+        queries = judgments['queries']
+
+        def perQuery(values):
+            return {query: round(float(value), round_values) for query, value in zip(queries, values)}
+
+        # precision ai livelli di recall
+        at_levels = self.__precisionAtLevels(judgments)
+        sum_at_levels = np.zeros(len(queries))
+        for level in range(Evaluator.levels):
+            sum_at_levels += at_levels[:, level]
+
+        # le somme sulle query sono fatte in sequenza, nell'ordine di self.queries
+        res = {'map': round(sum((sum_at_levels / Evaluator.levels).tolist()) / len(queries), round_values),
+               'avg_precision_at_level': {(level+1) / Evaluator.levels: round(sum(at_levels[:, level].tolist()) / len(queries), round_values)
+                                          for level in range(Evaluator.levels)},
+               }
+
+        # r-precision
+        if r <= 0:
+            res['r_precision'] = None
+        else:
+            relevants_in_r = judgments['first_hits'][:, :r].sum(axis=1)
+            res['r_precision'] = {query: 'error' if r > n_retrieved else round(relevants / r, round_values)
+                                  for query, relevants, n_retrieved
+                                  in zip(queries, relevants_in_r.tolist(), judgments['n_retrieved'].tolist())}
+
+        # e-measure e f-measure
+        precision, recall = self.__precisionAndRecall(judgments, rank_pos)
+        valid = (precision > 0) & (recall > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            e_measure = 1 - ((1+pow(b, 2)) / ((pow(b, 2)/recall) + (1/precision)))
+            f_measure = (2*precision*recall) / (precision+recall)
+        res['e_measure'] = perQuery(np.where(valid, e_measure, 0.0))
+        res['f_measure'] = perQuery(np.where(valid, f_measure, 0.0))
+
+        # ndcg
+        ndcg = self.__DCGs(judgments, rank) / Evaluator.DCG(self.getRelevanceVector(None, gt=True), rank)
+        res['ndcg'] = perQuery(ndcg)
+        res['avg_ndcg'] = sum(res['ndcg'].values()) / len(queries)
+
+        return res
 
 
     def averagePrecisionAtLevel(self, round_precision=3):
@@ -144,15 +291,7 @@ class Evaluator:
         :param round_precision: arrotondamento dei valori di precision
         return: dict con chiavi i valori di recall e come valori le precision (per ogni livello di recall)
         """
-        res = {}
-        tot_queries = len(self.queries)
-        levels = 10                     
-
-        for level in range(1, levels+1):  # 1...10 compresi
-            sum_precisions_at_level = sum([self.__precisonAtLevel(q, level) for q in self.queries])
-            avg_precision_at_level = round( sum_precisions_at_level/tot_queries, round_precision)
-            recall_level = level / levels
-            res[recall_level] = avg_precision_at_level
+        res = self.metrics(round_values=round_precision)['avg_precision_at_level']
 
         print('avgAtRecall: ', res)
 
@@ -168,16 +307,7 @@ class Evaluator:
         :param round_map: approssimazione del MAP 
         return: MAP calcolato (single value)     
         """
-        avg_precisions_per_query = []
-        tot_queries = len(self.queries)
-        levels = 10
-
-        for query in self.queries:
-            sum_precisions_at_levels = sum( [self.__precisonAtLevel(query, level) for level in range(1, levels+1)] )
-            avg_precision = sum_precisions_at_levels / levels
-            avg_precisions_per_query.append(avg_precision)
-
-        return round( sum(avg_precisions_per_query)/tot_queries ,round_map)
+        return self.metrics(round_values=round_map)['map']
 
     
     def Rprecision(self, r=10, round_precision=3):
@@ -187,24 +317,29 @@ class Evaluator:
         :param r: r-esima posizione su cui calcolare la precision
         return: dict che ha come chiavi le query e come valori la r-precision
         """
-        res = {}
-
         if r <= 0:
             print('Valore di \'r\' deve essere >0.')
             return None
 
-        for query in self.queries:
-            if r > len(self.A_set[query]):
-                res[query] = 'error'
-            else:
-                relevants_in_r_retrieved = len(set(self.R_set[query]) & set(self.A_set[query][:r]))
-                res[query] = round(relevants_in_r_retrieved/r, round_precision) 
+        res = self.metrics(r=r, round_values=round_precision)['r_precision']
 
         print('R-precision: ', res)
         
         return res
 
 
+    def __checkRankPos(self, rank_pos):
+        """
+        Se rank_pos è maggiore del numero di documenti ritornati per una query, per quella query
+        precision e recall sono calcolate su tutti i documenti ritornati.
+
+        :param self
+        :param rank_pos: posizione del rank su cui calcolare precision e recall
+        """
+        if (rank_pos > self.__judgments()['n_retrieved']).any():
+            print('Valore di rank_pos troppo grande.')
+
+
     def Emeasure(self, b, rank_pos=10, round_measure=3):
         """
         Permette all'utente di decidere se è più interessato a precision o recall cambiando il valore
@@ -218,15 +353,8 @@ class Evaluator:
         return: dict con chiavi le query e valori la e-measure di ogni query 
         """
 
-        e_measure = {}
-
-        for query in self.queries:
-            precision, recall = self.__getPrecsionAndRecall(query, rank_pos)
-            try:
-                res = round( 1-( (1+pow(b, 2)) / ( (pow(b, 2)/recall) + (1/precision) ) ), round_measure)
-            except ZeroDivisionError:
-                res = 0.0
-            e_measure[query] = res
+        self.__checkRankPos(rank_pos)
+        e_measure = self.metrics(b=b, rank_pos=rank_pos, round_values=round_measure)['e_measure']
 
         print('e-measure: ', e_measure)
 
@@ -244,15 +372,8 @@ class Evaluator:
         return: dict con chiavi le query e valori la f-measure di ogni query
         """
 
-        f_measure = {}
-
-        for query in self.queries:
-            precision, recall = self.__getPrecsionAndRecall(query, rank_pos)
-            try:
-                res = round( (2*precision*recall) / (precision+recall), round_measure)
-            except ZeroDivisionError:
-                res = 0.0
-            f_measure[query]= res
+        self.__checkRankPos(rank_pos)
+        f_measure = self.metrics(rank_pos=rank_pos, round_values=round_measure)['f_measure']
 
         print('f-measure: ', f_measure)
 
@@ -275,7 +396,7 @@ class Evaluator:
         :param gt: True se voglio che la funzione ritorni il relevance vector del Ground Truth
         return: lista di valori di rilevanza
         """
-        rel_gt = [6,5,4,3,2,1,1,1,1,1]
+        rel_gt = Evaluator.rel_gt
         
         if gt:
             return rel_gt
@@ -325,12 +446,10 @@ class Evaluator:
         """
         rank = 10
 
-        res = {query : round(Evaluator.DCG(self.getRelevanceVector(query), rank) / 
-                              Evaluator.DCG(self.getRelevanceVector(query, gt=True), rank), round_ndcg) 
-                            for query in self.queries}
+        metrics = self.metrics(rank=rank, round_values=round_ndcg)
+        res = metrics['ndcg']
 
-        avg = sum([v for v in res.values()]) / len(res.values())
-        print('AVG NDCG, ',avg)
+        print('AVG NDCG, ',metrics['avg_ndcg'])
     
         return res
 
@@ -7,20 +7,29 @@ Created on Thu Sep 10 15:24:26 2020
 """
 
 import os, os.path
+import json
 
 from whoosh import index, scoring, qparser
 from whoosh.fields import SchemaClass, TEXT, ID, STORED, KEYWORD, NUMERIC
 from whoosh.qparser import QueryParser
 
 import shutil  
+import threading
 
-from .xmlParsing import saxReader
+from .xmlParsing import saxReader, dumpInput
+from .xmlParsing.filterText import FilterWikiText
 
 from .analysis.analyzers import SimpleAnalyzer_, StandardAnalyzer_, StemmingAnalyzer_, AccentStemmingAnalyzer, LemmatizingAnalyzer 
 from .searching.searcher import WikiSearcher
+from .searching.queryExpansion import Expander
+from .searching.resultCache import ResultCache
+from .searching.expansionCache import ExpansionCache
+from .searching.expansionTable import ExpansionTable
 
 from .pageRank.graph import WikiGraph, WikiPageRanker 
 
+from . import instrumentation
+
 
 class WikiSchema(SchemaClass):
     """
@@ -40,6 +49,10 @@ class WikiSchema(SchemaClass):
      
 
 class WikiIndex:
+
+    # file (nella cartella dell'indice) con lo stato dell'ultimo checkpoint della creazione
+    CHECKPOINT_FILE = 'build.checkpoint'
+    CHECKPOINT_VERSION = 2
     
     def __init__(self, args_paths):
         """
@@ -52,6 +65,10 @@ class WikiIndex:
         self.__index = None
         self.__page_ranker = None
         self.__searcher = None
+        self.__cache = ResultCache(getattr(args_paths, 'cache_size', 1024), getattr(args_paths, 'cache_ttl', 300.0))
+
+        # metriche abilitate da linea di comando (vedi 'instrumentation.configure()')
+        instrumentation.configure(args_paths)
         
     @classmethod 
     def getSchema(cls):
@@ -65,23 +82,37 @@ class WikiIndex:
     def openOrBuild(self):
         """
         Apre un indice già esistente oppure se non esiste ne crea uno nuovo.
+        Se la cartella contiene il checkpoint di una creazione interrotta, l'indice è incompleto
+        e la creazione viene ripresa (vedi 'build()').
         
         :param self
         """
+        if os.path.exists(self.__checkpointPath()):
+            print('  Ripresa creazione indice interrotta..')
+            return self.build()
         if index.exists_in(self.args_paths.index_dir):
-            print('  Lettura indice da file..')
-            try:
-                self.__index = index.open_dir(self.args_paths.index_dir)
-                self.__afterBuild()
-
-                return True
-            except Exception as e:
-                raise(e)
-                print('! Errore caricamento indice dal path: '+self.args_paths.index_dir)
-                return False
+            return self.open()
         else:
             print('  Creazione indice dal dump..')
             return self.build() 
+
+
+    def open(self):
+        """
+        Apre un indice già esistente.
+
+        :param self
+        """
+        print('  Lettura indice da file..')
+        try:
+            self.__index = index.open_dir(self.args_paths.index_dir)
+            self.__afterBuild()
+
+            return True
+        except Exception as e:
+            raise(e)
+            print('! Errore caricamento indice dal path: '+self.args_paths.index_dir)
+            return False
     
 
     def build(self): 
@@ -105,19 +136,72 @@ class WikiIndex:
         # multisegment: se True fa in modo che ogni sub-writer crei segmenti 
                         separati senza fare il merge.
                         Vengono creati n-segmenti se sono abilitati n processori.        
+
+        Se 'args_paths.workers' > 0 il filtraggio delle pagine (pulizia del testo e estrazione
+        dei link) viene eseguito da un pool di processi e non dal parser (vedi 'saxReader.readXMLPipeline').
+
+        CHECKPOINT
+        Se 'args_paths.checkpoint_pages' > 0, ogni 'checkpoint_pages' pagine viene eseguito il commit
+        del writer, salvato lo stato del grafo ('args_paths.graph') e scritto il file di checkpoint
+        con l'id dell'ultima pagina indicizzata (vedi '__checkpoint()').
+        Se la creazione si interrompe, la successiva chiamata (con lo stesso corpus) non elimina
+        l'indice ma riprende dall'ultimo checkpoint: le pagine già indicizzate vengono scartate
+        senza essere filtrate e, se il dump è multistream ('args_paths.corpus_index'), la lettura
+        parte direttamente dallo stream che contiene l'ultima pagina.
+        Con 'args_paths.resume' = False l'indice viene sempre ricreato da zero.
+        Il file di checkpoint viene scritto subito dopo la creazione dell'indice vuoto (con 0 pagine)
+        ed eliminato solo alla fine, quindi un indice incompleto non viene mai aperto come se fosse
+        completo (vedi 'openOrBuild()').
+        Se la creazione si è interrotta dopo il commit di un checkpoint, ma prima della scrittura
+        del file, l'indice contiene anche pagine successive a quella del checkpoint: la generazione
+        dell'indice è diversa da quella salvata nel checkpoint, e le pagine già presenti vengono
+        sostituite ('update_document') invece di essere aggiunte di nuovo.
+        Ogni checkpoint crea almeno 'procs' segmenti. Alla fine non viene eseguito il merge di tutto
+        l'indice (DISPENDIOSO, vedi sopra): se 'args_paths.merge_segment_docs' > 0 nel commit finale
+        vengono uniti solo i segmenti con meno documenti (vedi 'mergeSmallSegments()').
         
         :param self
         """
-        
-        if os.path.exists(self.args_paths.index_dir):
-            shutil.rmtree(self.args_paths.index_dir)  
-        os.mkdir(self.args_paths.index_dir)
+        checkpoint_pages = getattr(self.args_paths, 'checkpoint_pages', 0)
+        if checkpoint_pages > 0 and not getattr(self.args_paths, 'graph', None):
+            print('! Checkpoint disabilitati: lo stato del grafo non viene salvato (args_paths.graph)')
+            checkpoint_pages = 0
+
+        checkpoint = self.__loadCheckpoint() if getattr(self.args_paths, 'resume', True) else None
+
+        if checkpoint is not None:
+            print('Ripresa dal checkpoint : {} pagine indicizzate, ultima pagina {}'.
+                  format(checkpoint['pages'], checkpoint['last_id']))
+            graph = WikiGraph.load(self.args_paths)
+            self.__index = index.open_dir(self.args_paths.index_dir)
+
+            # pagine nell'indice (la creazione non elimina documenti), comprese quelle di un commit
+            # successivo all'ultimo checkpoint
+            committed = self.__index.doc_count()
+            if self.__index.latest_generation() == checkpoint['generation']:
+                committed = checkpoint['pages']
+            else:
+                print('! Indice modificato dopo l\'ultimo checkpoint : {} pagine già presenti vengono sostituite'.
+                      format(committed - checkpoint['pages']))
+        else:
+            if os.path.exists(self.args_paths.index_dir):
+                shutil.rmtree(self.args_paths.index_dir)  
+            os.mkdir(self.args_paths.index_dir)
 
-        graph = WikiGraph(self.args_paths)
+            graph = WikiGraph(self.args_paths)
         
-        self.__index = index.create_in(self.args_paths.index_dir, WikiIndex.getSchema())
-
-        writer = self.__index.writer(limitmb=2048, procs=4, multisegment=True)  
+            self.__index = index.create_in(self.args_paths.index_dir, WikiIndex.getSchema())
+            committed = 0
+
+        build = {'writer': None,
+                 'checkpoint_pages': checkpoint_pages,
+                 'pages': checkpoint['pages'] if checkpoint else 0,
+                 'last_id': checkpoint['last_id'] if checkpoint else None,
+                 'committed': committed,
+                 }
+        if checkpoint is None:
+            self.__writeCheckpoint(graph, build)
+        build['writer'] = self.__newWriter()
 
         try:     
             import time
@@ -125,69 +209,343 @@ class WikiIndex:
 
             print('Lettura file xml ...')
             start = time.time()
-            saxReader.readXML(self.args_paths, self.__addWikiPage, graph, writer)
+            saxReader.readXML(self.args_paths, self.__addWikiPage, graph, build, skip_until=build['last_id'])
             end = time.time()
             print('Tempo di lettura file xml : '+str(round(end-start, 5)))
+            instrumentation.observe('build_stage_seconds', end-start, stage='read')
 
             print('Commit indice ...')
             start = time.time()
-            writer.commit()
+            merge_segment_docs = getattr(self.args_paths, 'merge_segment_docs', 0)
+            if merge_segment_docs > 0:
+                build['writer'].commit(mergetype=WikiIndex.mergeSmallSegments(merge_segment_docs))
+            else:
+                build['writer'].commit()
             end = time.time()
             print('Tempo di commit indice : '+str(round(end-start, 5)))
+            instrumentation.observe('build_stage_seconds', end-start, stage='commit')
+        except Exception as e: 
+            # il writer può essere già chiuso se l'errore avviene durante un checkpoint
+            if not build['writer'].is_closed:
+                build['writer'].cancel()
+            raise(e)
 
-            print('Calcolo pagerank ...')
-            start = time.time()
-            graph.end()
-            end = time.time()
-            print('Tempo calcolo pagerank : '+str(round(end-start, 5)))
+        print('Calcolo pagerank ...')
+        start = time.time()
+        graph.end()
+        end = time.time()
+        print('Tempo calcolo pagerank : '+str(round(end-start, 5)))
+        instrumentation.observe('build_stage_seconds', end-start, stage='pagerank')
 
-            self.__afterBuild()  
-            end_build = time.time()
-            print('Tempo totale : '+str(round(end_build-start_build, 5)))
+        # indice completo: il checkpoint non serve più
+        if os.path.exists(self.__checkpointPath()):
+            os.remove(self.__checkpointPath())
 
+        self.__afterBuild()  
+        end_build = time.time()
+        print('Tempo totale : '+str(round(end_build-start_build, 5)))
+        instrumentation.observe('build_stage_seconds', end_build-start_build, stage='total')
+        instrumentation.flush()
 
-            return True           
-        except Exception as e: 
-            raise(e)
-            print('! Errore durante la creazione indice.')
-            return False   
+        return True           
+
+
+    def __newWriter(self):
+        """
+        :param self
+        return writer per la creazione dell'indice (vedi 'build()' per i parametri)
+        """
+        return self.__index.writer(limitmb=2048, procs=4, multisegment=True)
+
+
+    @staticmethod
+    def mergeSmallSegments(max_docs):
+        """
+        DOCS : https://whoosh.readthedocs.io/en/latest/indexing.html#merging-segments
+
+        Politica di merge (parametro 'mergetype' del commit) che unisce solo i segmenti con meno di
+        'max_docs' documenti (es: quelli creati dai checkpoint), lasciando invariati i segmenti
+        grandi, invece di riscrivere tutto l'indice come 'optimize()'.
+
+        :param max_docs: numero di documenti sotto al quale un segmento viene unito
+        return funzione (writer, segments) -> segmenti non uniti
+        """
+        def merge(writer, segments):
+            from whoosh.reading import SegmentReader
+
+            small = [segment for segment in segments if segment.doc_count_all() < max_docs]
+            if len(small) < 2:
+                return segments
+
+            for segment in small:
+                reader = SegmentReader(writer.storage, writer.schema, segment)
+                writer.add_reader(reader)
+                reader.close()
+            return [segment for segment in segments if segment not in small]
+
+        return merge
+
+
+    def __checkpointPath(self):
+        """
+        :param self
+        return path del file di checkpoint della creazione dell'indice
+        """
+        return os.path.join(self.args_paths.index_dir, WikiIndex.CHECKPOINT_FILE)
+
+
+    def __corpusInfo(self):
+        """
+        :param self
+        return dict che identifica il corpus letto (path, dimensione e data di modifica), usato
+               per verificare che il checkpoint si riferisca allo stesso dump
+        """
+        stat = os.stat(self.args_paths.corpus)
+        return {'corpus': os.path.abspath(self.args_paths.corpus),
+                'corpus_size': stat.st_size,
+                'corpus_mtime': stat.st_mtime,
+                }
+
+
+    def __loadCheckpoint(self):
+        """
+        Lettura del checkpoint di una creazione interrotta.
+
+        :param self
+        return dict del checkpoint, None se non presente o non valido (corpus diverso, stato del 
+               grafo o indice mancanti)
+        """
+        path_checkpoint = self.__checkpointPath()
+        if not os.path.exists(path_checkpoint):
+            return None
+
+        try:
+            with open(path_checkpoint) as fp:
+                checkpoint = json.load(fp)
+        except ValueError:
+            print('! Checkpoint non leggibile: '+path_checkpoint)
+            return None
+
+        corpus_info = self.__corpusInfo()
+        if checkpoint.get('version') != WikiIndex.CHECKPOINT_VERSION or \
+           any(checkpoint.get(key) != value for key, value in corpus_info.items()):
+            print('! Checkpoint relativo ad un altro corpus: l\'indice viene ricreato')
+            return None
+
+        path_graph = getattr(self.args_paths, 'graph', None)
+        if not path_graph or not os.path.exists(path_graph) or not index.exists_in(self.args_paths.index_dir):
+            print('! Stato del grafo o indice mancante: l\'indice viene ricreato')
+            return None
+
+        return checkpoint
+
+
+    def __writeCheckpoint(self, graph, build):
+        """
+        Salvataggio dello stato del grafo e poi del file di checkpoint, scritto per ultimo e in modo
+        atomico con la generazione corrente dell'indice (vedi 'build()').
+
+        :param self
+        :param graph: grafo per il pagerank
+        :param build: dict con lo stato della creazione (pagine indicizzate, ultima pagina)
+        """
+        graph.save()
+
+        checkpoint = {'version': WikiIndex.CHECKPOINT_VERSION,
+                      **self.__corpusInfo(),
+                      'generation': self.__index.latest_generation(),
+                      'pages': build['pages'],
+                      'last_id': build['last_id'],
+                      }
+        path_checkpoint = self.__checkpointPath()
+        with open(path_checkpoint+'.tmp', 'w') as fp:
+            json.dump(checkpoint, fp)
+        os.replace(path_checkpoint+'.tmp', path_checkpoint)
+
+
+    def __checkpoint(self, graph, build):
+        """
+        Checkpoint della creazione: commit dei segmenti scritti, salvataggio dello stato del grafo 
+        e del file di checkpoint (vedi '__writeCheckpoint()'). 
+        Il writer viene sostituito da uno nuovo per le pagine successive.
+
+        :param self
+        :param graph: grafo per il pagerank
+        :param build: dict con lo stato della creazione (writer, pagine indicizzate, ultima pagina)
+        """
+        with instrumentation.timer('build_checkpoint_seconds'):
+            build['writer'].commit()
+            self.__writeCheckpoint(graph, build)
+
+            build['writer'] = self.__newWriter()
+        instrumentation.count('build_checkpoints_total')
 
 
     def __afterBuild(self):
         """
         Funzione che deve essere chiamata dopo che l'indice è stato creato oppure caricato da file.
-        Configura il page_ranker e il searcher.
+        Configura il page_ranker e il searcher (chiudendo quello precedente, se presente).
 
         :param self
         """
-        print('Caricamento in memoria del file di pagerank e searcher ...')
+        print('Configurazione del pagerank e del searcher ...')
+
+        if self.__searcher is not None:
+            self.__searcher.close()
 
         self.__page_ranker = WikiPageRanker(self.args_paths)
-        self.__searcher = WikiSearcher(self.__index, self.__page_ranker)
+        expansion_cache = None
+        if getattr(self.args_paths, 'expansion_cache', None):
+            expansion_cache = ExpansionCache(self.args_paths.expansion_cache,
+                                             getattr(self.args_paths, 'expansion_cache_size', 10000))
+        expansion_table = None
+        if getattr(self.args_paths, 'expansion_table', None):
+            expansion_table = ExpansionTable.load(self.args_paths.expansion_table)
+        expander = Expander('noun_sense', cache=expansion_cache, table=expansion_table,
+                            max_pairs=getattr(self.args_paths, 'wsd_max_pairs', 5000),
+                            max_time=getattr(self.args_paths, 'wsd_max_time', 0.2))
+        self.__searcher = WikiSearcher(self.__index, self.__page_ranker, expander)
+
+        # pagerank, nltk e WordNet vengono caricati alla prima ricerca, oppure subito in background
+        if getattr(self.args_paths, 'warm_up', False):
+            self.warmUp()
 
         print('* Creazione / caricamento indice avvenuta con successo')
 
         
-    def __addWikiPage(self, graph, writer, **data_parsed):
+    def __addWikiPage(self, graph, build, **data_parsed):
         """
         Questa funzione viene chiamata quando viene letta una pagina valida dal dump xml.
         Aggiungo la pagina all'indice, e aggiungo pagina al grafo.
+        Ogni 'checkpoint_pages' pagine viene eseguito un checkpoint (vedi '__checkpoint()').
         
         :param self
         :param graph: instanza di grafo per il page rank
-        :param writer: writer per poter aggiungere all'index la pagina di wikipedia letta dal dump
+        :param build: dict con il writer per poter aggiungere all'index la pagina di wikipedia letta 
+                      dal dump e lo stato della creazione (vedi 'build()')
         :param data_parsed: dati letti e filtrati che sono stati ritornati dopo la lettura del dump xml
         """
+        writer = build['writer']
         if self.__index is not None and writer is not None:
             title = data_parsed['title']
             text = data_parsed['text']
             id_page = data_parsed['id']
             link = data_parsed['internal_link']
 
-            writer.add_document(text=text, title=title, id_page=id_page)
-            graph.addPage(id_page, title, link)
+            if build['pages'] < build['committed']:
+                # pagina già nell'indice (commit successivo all'ultimo checkpoint, vedi 'build()')
+                with instrumentation.timer('index_add_document_seconds'):
+                    writer.update_document(text=text, title=title, id_page=id_page)
+                graph.updatePage(id_page, title, link, data_parsed.get('digest'))
+            else:
+                with instrumentation.timer('index_add_document_seconds'):
+                    writer.add_document(text=text, title=title, id_page=id_page)
+                graph.addPage(id_page, title, link, data_parsed.get('digest'))
+            instrumentation.count('index_pages_total')
+
+            build['pages'] += 1
+            build['last_id'] = id_page.strip()
+            if build['checkpoint_pages'] > 0 and build['pages'] % build['checkpoint_pages'] == 0:
+                self.__checkpoint(graph, build)
         else:
             print('! Problemi durante indicizzazione pagina wikipedia')
+
+
+    def update(self, deleted_ids=(), partial=False):
+        """
+        DOCS : https://whoosh.readthedocs.io/en/latest/indexing.html#updating-documents
+
+        Aggiornamento incrementale dell'indice esistente a partire da un dump più recente 
+        ('args_paths.corpus'), senza ricreare l'indice.
+        Lo stato del grafo salvato alla fine dell'ultima creazione/aggiornamento ('args_paths.graph')
+        contiene il digest di ogni pagina indicizzata: le pagine del dump con lo stesso digest non 
+        vengono filtrate e non vengono reindicizzate. Le pagine nuove o modificate sono sostituite
+        con 'update_document' (id_page è unique nello schema).
+
+        Le pagine eliminate sono quelle in 'deleted_ids', quelle che nel dump sono diventate redirect
+        o sono state spostate in un namespace non valido (il reader le segnala con il solo id, vedi
+        'saxReader.readPages()') e, se il dump è completo (partial=False), anche quelle indicizzate
+        che non sono più presenti nel dump.
+        Il pagerank viene ricalcolato sul grafo aggiornato.
+
+        :param self
+        :param deleted_ids: id delle pagine da eliminare
+        :param partial: True se il dump contiene solo le pagine aggiunte/modificate
+        return True se l'aggiornamento è avvenuto con successo
+        """
+        import time
+        start = time.time()
+
+        self.__index = index.open_dir(self.args_paths.index_dir)
+        graph = WikiGraph.load(self.args_paths)
+
+        writer = self.__index.writer(limitmb=2048)
+        page_filter = FilterWikiText(self.args_paths.interwiki_links)
+        stats = {'seen': set(), 'tombstones': set(), 'updated': 0, 'unchanged': 0, 'deleted': 0}
+
+        try:
+            print('Lettura file xml ...')
+            with dumpInput.openDump(self.args_paths.corpus) as fp:
+                saxReader.readPages(fp, lambda **page: self.__updateWikiPage(graph, writer, page_filter, stats, **page), 
+                                    getattr(self.args_paths, 'reader', 'sax'),
+                                    fn_tombstone=lambda id: stats['tombstones'].add(int(id)))
+
+            to_delete = {int(id_page) for id_page in deleted_ids} | stats['tombstones']
+            if not partial:
+                to_delete |= graph.getPageIds() - stats['seen']
+
+            for id_page in to_delete:
+                if graph.removePage(id_page):
+                    writer.delete_by_term('id_page', str(id_page))
+                    stats['deleted'] += 1
+
+            print('Commit indice ...')
+            writer.commit()
+        except Exception as e:
+            writer.cancel()
+            raise(e)
+
+        print('Calcolo pagerank ...')
+        graph.end()
+
+        self.__afterBuild()
+
+        print('Pagine aggiunte/modificate : {}  |  invariate : {}  |  eliminate : {}'.
+              format(stats['updated'], stats['unchanged'], stats['deleted']))
+        print('Tempo totale : '+str(round(time.time()-start, 5)))
+        instrumentation.observe('build_stage_seconds', time.time()-start, stage='update')
+        instrumentation.flush()
+        return True
+
+
+    def __updateWikiPage(self, graph, writer, page_filter, stats, title, id, text):
+        """
+        Questa funzione viene chiamata per ogni pagina valida letta dal dump durante l'aggiornamento.
+        Se la pagina è nuova o modificata, la filtro e la sostituisco nell'indice e nel grafo.
+
+        :param self
+        :param graph: instanza di grafo per il page rank
+        :param writer: writer dell'indice
+        :param page_filter: FilterWikiText usato per filtrare le pagine modificate
+        :param stats: dict con i contatori dell'aggiornamento
+        :param title: titolo della pagina
+        :param id: id della pagina
+        :param text: testo (non filtrato) della pagina
+        """
+        id_page = int(id)
+        stats['seen'].add(id_page)
+
+        if graph.getDigest(id_page) == FilterWikiText.getDigest(title, text):
+            stats['unchanged'] += 1
+            return
+
+        data_parsed = page_filter.filterPage(title, id, text)
+
+        with instrumentation.timer('index_add_document_seconds'):
+            writer.update_document(text=data_parsed['text'], title=data_parsed['title'], id_page=data_parsed['id'])
+        graph.updatePage(data_parsed['id'], data_parsed['title'], data_parsed['internal_link'], data_parsed['digest'])
+        stats['updated'] += 1
+        instrumentation.count('index_pages_total')
             
             
     def getFieldInfo(self, field):
@@ -212,6 +570,17 @@ class WikiIndex:
         return self.__searcher.getGeneralInfo()
         
         
+    def close(self):
+        """
+        Chiusura del searcher (e del reader dell'indice).
+
+        :param self
+        """
+        if self.__searcher is not None:
+            self.__searcher.close()
+            self.__searcher = None
+
+
     def query(self, text, **settings): 
         """
         Viene fatto il parsing della query e poi tramite l'utilizzo di modelli
@@ -222,9 +591,77 @@ class WikiIndex:
         :param settings: sono i settaggi del searcher 
         :return dict con il tempo di esecuzione della query, i documneti totali
                         e il riferimento ai documenti interi (url)
+
+        I risultati vengono salvati in una cache (vedi 'ResultCache') che viene svuotata quando
+        cambia la generazione dell'indice; 'cached' indica se il risultato è stato preso dalla cache.
+        In questo caso 'time_second' e 'timings' sono azzerati: i tempi salvati si riferiscono
+        alla ricerca originale e non a quella attuale.
         """
         if self.__index is not None:
-            return self.__searcher.search(text, **settings)
+            self.__searcher.refresh()
+            generation = self.__searcher.generation
+            key = ResultCache.getKey(text, settings)
+
+            res = self.__cache.get(key, generation)
+            if res is None:
+                res = self.__searcher.search(text, **settings)
+                self.__cache.put(key, generation, res)
+                res['cached'] = False
+            else:
+                res['cached'] = True
+                res['time_second'] = 0.0
+                res['timings'] = dict.fromkeys(res.get('timings', ()), 0.0)
+            instrumentation.count('result_cache_total', result='hit' if res['cached'] else 'miss')
+            return res
         else:
             return None
 
+
+    def warmUp(self, background=True):
+        """
+        Caricamento anticipato delle risorse usate dalla ricerca (vedi 'WikiSearcher.warmUp()').
+
+        :param self
+        :param background: se True il caricamento avviene in un thread separato
+        return thread del caricamento, None se eseguito subito
+        """
+        if self.__searcher is None:
+            return None
+
+        if not background:
+            self.__searcher.warmUp()
+            return None
+
+        thread = threading.Thread(target=self.__searcher.warmUp, name='warm-up', daemon=True)
+        thread.start()
+        return thread
+
+
+    def buildExpansionTable(self):
+        """
+        Creazione della tabella dei sinonimi presenti nell'indice (vedi 'ExpansionTable'), salvata
+        in 'args_paths.expansion_table'. La tabella viene poi usata dal searcher per l'espansione.
+
+        :param self
+        """
+        if self.__index is None:
+            return
+
+        import time
+        start = time.time()
+        with self.__index.reader() as reader:
+            ExpansionTable.build(self.args_paths.expansion_table, reader)
+        print('Tempo totale : '+str(round(time.time()-start, 5)))
+
+        self.__afterBuild()
+
+
+    def getCacheInfo(self):
+        """
+        Contatori della cache dei risultati (hit, miss, ..).
+
+        :param self
+        return dict con le info della cache
+        """
+        return self.__cache.getInfo()
+
@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+DOCS : https://prometheus.io/docs/instrumenting/exposition_formats/
+
+Strumentazione dei punti critici del motore (lettura del dump, filtraggio, indicizzazione, grafo,
+pagerank, query expansion e ricerca) con contatori, gauge e istogrammi, inviati periodicamente ad
+uno o più sink:
+    - 'MemorySink': mantiene l'ultimo snapshot, da leggere nel codice (es: nei test, con
+                    'enable(MemorySink())'): non è selezionabile da linea di comando;
+    - 'LogSink': stampa una riga per metrica, con la velocità dei contatori dall'ultimo flush
+                 (es: pagine al secondo durante la creazione dell'indice);
+    - 'PrometheusSink': file in formato testo di Prometheus (es: per il textfile collector di
+                        node_exporter), sostituito in modo atomico ad ogni flush.
+
+La strumentazione è disabilitata di default: le funzioni del modulo controllano solo che il registro
+non sia None e 'timer()' ritorna un context manager che non fa niente, quindi quando è disabilitata
+costa una chiamata di funzione. Dove il costo conta (es: per ogni pagina del dump) i chiamanti
+controllano 'enabled()' una volta sola.
+
+    instrumentation.enable(instrumentation.LogSink(), interval=10)
+    instrumentation.count('index_pages_total')
+    with instrumentation.timer('search_stage_seconds', stage='expand'):
+        ...
+
+Ogni processo ha il proprio registro: nei processi worker (es: 'SearchPool') la strumentazione va
+abilitata dal processo stesso, con un file per processo (vedi 'configure()'). In alternativa i worker
+di breve durata (es: 'PagePipeline') registrano le metriche in un registro senza sink (vedi
+'enableWorker()') che viene svuotato ad ogni task e unito a quello del processo principale.
+"""
+
+import atexit
+import bisect
+import os
+import sys
+import threading
+import time
+
+
+# limiti superiori (secondi) dei bucket degli istogrammi
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram():
+    """
+    Istogramma cumulativo come quello di Prometheus: numero di osservazioni <= di ogni limite,
+    somma e numero totale delle osservazioni.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+
+    def observe(self, value):
+        """
+        :param self
+        :param value: valore osservato
+        """
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+    def snapshot(self):
+        """
+        :param self
+        return dict con 'buckets' (limite -> osservazioni cumulative), 'sum' e 'count'
+        """
+        cumulative = []
+        total = 0
+        for n in self.counts:
+            total += n
+            cumulative.append(total)
+        return {'buckets': dict(zip(self.buckets, cumulative)), 'sum': self.sum, 'count': self.count}
+
+
+    def merge(self, other):
+        """
+        :param self
+        :param other: Histogram con gli stessi bucket da aggiungere a questo
+        """
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+
+class Metrics():
+    """
+    Registro delle metriche. Ogni metrica è identificata dal nome e dalle label, es:
+    ('search_stage_seconds', (('stage', 'expand'),)). Può essere usato da più thread contemporaneamente.
+    """
+
+    def __init__(self, sinks=()):
+        """
+        :param self
+        :param sinks: sink a cui vengono inviati gli snapshot con 'flush()'
+        """
+        self.sinks = list(sinks)
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+
+    def count(self, name, value=1, labels=()):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+
+    def gauge(self, name, value, labels=()):
+        with self.lock:
+            self.gauges[(name, labels)] = value
+
+
+    def observe(self, name, value, labels=()):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+
+    def snapshot(self):
+        """
+        :param self
+        return dict con 'time', 'counters', 'gauges' e 'histograms' (chiave: (nome, label))
+        """
+        with self.lock:
+            return {'time': time.time(),
+                    'counters': dict(self.counters),
+                    'gauges': dict(self.gauges),
+                    'histograms': {key: histogram.snapshot() for key, histogram in self.histograms.items()},
+                    }
+
+
+    def drain(self):
+        """
+        Metriche registrate fino ad ora, azzerando il registro.
+
+        :param self
+        return tuple (counters, gauges, histograms)
+        """
+        with self.lock:
+            drained = (self.counters, self.gauges, self.histograms)
+            self.counters, self.gauges, self.histograms = {}, {}, {}
+        return drained
+
+
+    def merge(self, drained):
+        """
+        Unione delle metriche di un altro registro (vedi 'drain()'): i contatori e gli istogrammi
+        vengono sommati, i gauge sostituiti.
+
+        :param self
+        :param drained: tuple (counters, gauges, histograms)
+        """
+        counters, gauges, histograms = drained
+        with self.lock:
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            self.gauges.update(gauges)
+            for key, other in histograms.items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    self.histograms[key] = other
+                else:
+                    histogram.merge(other)
+
+
+    def flush(self):
+        """
+        Invio dello snapshot corrente a tutti i sink.
+
+        :param self
+        """
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            sink.write(snapshot)
+
+
+class MemorySink():
+    """
+    Mantiene l'ultimo snapshot inviato.
+    """
+
+    def __init__(self):
+        self.last = None
+
+
+    def write(self, snapshot):
+        self.last = snapshot
+
+
+class LogSink():
+    """
+    Stampa le metriche ad ogni flush: per i contatori anche la velocità (al secondo) dall'ultimo
+    flush, per gli istogrammi numero, media e totale delle osservazioni.
+    """
+
+    def __init__(self, stream=None, prefix='[metrics] '):
+        """
+        :param self
+        :param stream: file su cui stampare (default sys.stderr)
+        :param prefix: prefisso di ogni riga
+        """
+        self.stream = stream
+        self.prefix = prefix
+        self.previous = None
+
+
+    def write(self, snapshot):
+        stream = self.stream if self.stream is not None else sys.stderr
+        lines = []
+
+        for key, value in sorted(snapshot['counters'].items()):
+            line = '{} {}'.format(formatKey(*key), value)
+            if self.previous is not None and snapshot['time'] > self.previous['time']:
+                rate = (value - self.previous['counters'].get(key, 0)) / (snapshot['time'] - self.previous['time'])
+                line += '  ({:.1f}/s)'.format(rate)
+            lines.append(line)
+
+        for key, value in sorted(snapshot['gauges'].items()):
+            lines.append('{} {}'.format(formatKey(*key), value))
+
+        for key, histogram in sorted(snapshot['histograms'].items()):
+            if histogram['count']:
+                lines.append('{} count {}  mean {:.2f} ms  sum {:.3f} s'.format(
+                             formatKey(*key), histogram['count'], histogram['sum']/histogram['count']*1000, histogram['sum']))
+
+        self.previous = snapshot
+        for line in lines:
+            print(self.prefix+line, file=stream)
+        stream.flush()
+
+
+class PrometheusSink():
+    """
+    Scrittura delle metriche in formato testo di Prometheus. Il file viene scritto su un file
+    temporaneo e poi sostituito, così chi lo legge non vede mai un file parziale.
+    Il path può contenere '{pid}' (es: 'files/metrics.{pid}.prom') per avere un file per processo:
+    in questo caso a tutte le metriche viene aggiunta la label 'pid', così le serie dei diversi
+    processi non sono in conflitto.
+    """
+
+    def __init__(self, path_file):
+        """
+        :param self
+        :param path_file: file delle metriche
+        """
+        self.path_file = path_file.format(pid=os.getpid())
+        self.labels = (('pid', os.getpid()),) if '{pid}' in path_file else ()
+
+
+    @classmethod
+    def render(cls, snapshot, labels=()):
+        """
+        :param cls
+        :param snapshot: snapshot di 'Metrics'
+        :param labels: label aggiunte a tutte le metriche
+        return testo in formato Prometheus
+        """
+        lines = []
+        types = {}
+
+        def declare(name, kind):
+            if name not in types:
+                types[name] = kind
+                lines.append('# TYPE {} {}'.format(name, kind))
+
+        for (name, key_labels), value in sorted(snapshot['counters'].items()):
+            declare(name, 'counter')
+            lines.append('{} {}'.format(formatKey(name, labels+key_labels), value))
+
+        for (name, key_labels), value in sorted(snapshot['gauges'].items()):
+            declare(name, 'gauge')
+            lines.append('{} {}'.format(formatKey(name, labels+key_labels), value))
+
+        for (name, key_labels), histogram in sorted(snapshot['histograms'].items()):
+            declare(name, 'histogram')
+            key_labels = labels+key_labels
+            for bound, n in histogram['buckets'].items():
+                lines.append('{} {}'.format(formatKey(name+'_bucket', key_labels+(('le', repr(bound)),)), n))
+            lines.append('{} {}'.format(formatKey(name+'_bucket', key_labels+(('le', '+Inf'),)), histogram['count']))
+            lines.append('{} {}'.format(formatKey(name+'_sum', key_labels), histogram['sum']))
+            lines.append('{} {}'.format(formatKey(name+'_count', key_labels), histogram['count']))
+
+        return '\n'.join(lines)+'\n'
+
+
+    def write(self, snapshot):
+        # il pid nel file temporaneo evita che due processi con lo stesso file scrivano lo stesso tmp
+        path_tmp = self.path_file+'.'+str(os.getpid())+'.tmp'
+        with open(path_tmp, 'w') as fp:
+            fp.write(PrometheusSink.render(snapshot, self.labels))
+        os.replace(path_tmp, self.path_file)
+
+
+def formatKey(name, labels):
+    """
+    :param name: nome della metrica
+    :param labels: tuple di (label, valore)
+    return nome con le label, es: search_stage_seconds{stage="expand"}
+    """
+    if not labels:
+        return name
+    return name+'{'+','.join('{}="{}"'.format(label, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                             for label, value in labels)+'}'
+
+
+class _Timer():
+    """
+    Context manager che registra in un istogramma i secondi trascorsi.
+    """
+
+    __slots__ = ('metrics', 'name', 'labels', 'start')
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, self.labels)
+        return False
+
+
+class _NullTimer():
+    """
+    Timer usato quando la strumentazione è disabilitata.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+# registro del processo, None se la strumentazione è disabilitata
+_metrics = None
+_flusher = None
+_stop = threading.Event()
+_atexit_registered = False
+
+
+def enabled():
+    """
+    return True se la strumentazione è abilitata
+    """
+    return _metrics is not None
+
+
+def enable(*sinks, interval=None):
+    """
+    Abilitazione della strumentazione nel processo corrente (se già abilitata, i sink vengono aggiunti).
+
+    :param sinks: sink a cui inviare le metriche
+    :param interval: secondi tra due flush eseguiti da un thread in background (None: solo con
+                     'flush()' e all'uscita del processo)
+    return Metrics del processo
+    """
+    global _metrics, _flusher, _atexit_registered
+
+    if _metrics is None:
+        _metrics = Metrics(sinks)
+    else:
+        _metrics.sinks.extend(sinks)
+
+    if not _atexit_registered:
+        atexit.register(flush)
+        _atexit_registered = True
+
+    if interval is not None and _flusher is None:
+        _stop.clear()
+
+        def flushLoop():
+            while not _stop.wait(interval):
+                flush()
+
+        _flusher = threading.Thread(target=flushLoop, name='metrics-flush', daemon=True)
+        _flusher.start()
+
+    return _metrics
+
+
+def disable():
+    """
+    Ultimo flush e disabilitazione della strumentazione.
+    """
+    global _metrics, _flusher
+
+    flush()
+    _stop.set()
+    if _flusher is not None:
+        _flusher.join()
+    _metrics = None
+    _flusher = None
+
+
+def configure(args_paths):
+    """
+    Abilitazione della strumentazione dagli argomenti da linea di comando, se non è già abilitata:
+        - 'metrics': 'log', 'prometheus' o None (disabilitata);
+        - 'metrics_file': file per 'prometheus' (può contenere '{pid}');
+        - 'metrics_interval': secondi tra due flush.
+
+    :param args_paths: argomenti da linea di comando
+    """
+    sink_name = getattr(args_paths, 'metrics', None)
+    if not sink_name or enabled():
+        return
+
+    if sink_name == 'log':
+        sink = LogSink()
+    elif sink_name == 'prometheus':
+        sink = PrometheusSink(getattr(args_paths, 'metrics_file', 'files/metrics.prom'))
+    else:
+        raise ValueError('Sink delle metriche non valido: '+str(sink_name))
+
+    enable(sink, interval=getattr(args_paths, 'metrics_interval', 10.0))
+
+
+def enableWorker():
+    """
+    Abilitazione della strumentazione in un processo worker che invia le metriche al processo
+    principale insieme ai risultati (vedi 'drain()' e 'merge()'). Il registro ereditato con la fork
+    (con i sink del processo principale) viene sostituito da un registro senza sink: i worker del
+    pool terminano senza eseguire le funzioni 'atexit' e non hanno il thread di flush.
+    """
+    global _metrics, _flusher
+
+    _metrics = Metrics()
+    _flusher = None
+
+
+def drain():
+    """
+    return metriche registrate nel processo corrente dall'ultima chiamata (vedi 'Metrics.drain()'),
+           None se la strumentazione è disabilitata
+    """
+    metrics = _metrics
+    if metrics is None:
+        return None
+    return metrics.drain()
+
+
+def merge(drained):
+    """
+    Unione nel registro del processo corrente delle metriche di un worker (vedi 'drain()').
+
+    :param drained: metriche ritornate da 'drain()', anche None
+    """
+    metrics = _metrics
+    if metrics is not None and drained is not None:
+        metrics.merge(drained)
+
+
+def flush():
+    """
+    Invio delle metriche ai sink (se la strumentazione è abilitata).
+    """
+    metrics = _metrics
+    if metrics is not None:
+        metrics.flush()
+
+
+def count(name, value=1, **labels):
+    """
+    :param name: nome del contatore
+    :param value: incremento
+    :param labels: label della metrica
+    """
+    metrics = _metrics
+    if metrics is not None:
+        metrics.count(name, value, tuple(sorted(labels.items())))
+
+
+def gauge(name, value, **labels):
+    """
+    :param name: nome del gauge
+    :param value: valore corrente
+    :param labels: label della metrica
+    """
+    metrics = _metrics
+    if metrics is not None:
+        metrics.gauge(name, value, tuple(sorted(labels.items())))
+
+
+def observe(name, value, **labels):
+    """
+    :param name: nome dell'istogramma
+    :param value: valore osservato (es: secondi)
+    :param labels: label della metrica
+    """
+    metrics = _metrics
+    if metrics is not None:
+        metrics.observe(name, value, tuple(sorted(labels.items())))
+
+
+def timer(name, **labels):
+    """
+    :param name: nome dell'istogramma dei secondi
+    :param labels: label della metrica
+    return context manager che misura il tempo del blocco
+    """
+    metrics = _metrics
+    if metrics is None:
+        return _NULL_TIMER
+    return _Timer(metrics, name, tuple(sorted(labels.items())))
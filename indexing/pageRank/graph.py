@@ -6,9 +6,23 @@ Created on Tue Sep 29 09:00:43 2020
 @author: gabrielesavoia
 """
 
-import snap
+try:
+    import snap
+except ImportError:
+    snap = None
 
+import numpy as np
+
+import glob
+import json
 import math
+import mmap
+import os
+import tempfile
+from array import array
+
+from . import sparseRank
+from .. import instrumentation
 
 
 def snapSave(to_save, file_name):
@@ -41,82 +55,634 @@ class WikiGraph():
     DOC : https://snap.stanford.edu/snappy/doc/reference/graphs.html
 
     Gestisce la creazione del grafo delle pagine di Wikipedia.
+    Il grafo snap viene creato solo se il pagerank è calcolato con snap (vedi 'end()').
     """
 
-    t_graph = {'TUNGraph': snap.TUNGraph,   # grafo unidirezionale -> NO attributi su archi e nodi
+    t_graph = {'TUNGraph': 'TUNGraph',      # grafo unidirezionale -> NO attributi su archi e nodi
                                             #                         (A---B)
-               'TNGraph': snap.TNGraph,     # grafo diretto        -> NO attributi su archi e nodi                                          
+               'TNGraph': 'TNGraph',        # grafo diretto        -> NO attributi su archi e nodi                                          
                                             #                         (A-->B) O (A<--B)
-               'TNEANet': snap.TNEANet,     # network              -> SI attributi su archi e nodi
+               'TNEANet': 'TNEANet',        # network              -> SI attributi su archi e nodi
                 }                                           
 
+    # numero di link uscenti tenuti in memoria prima di essere scritti sul file dei link
+    spill_size = 1 << 20
+
+    # versione del file dello stato del grafo (vedi 'save()')
+    STATE_VERSION = 1
+
+    # frazione di righe o di link eliminati oltre la quale il grafo viene compattato (vedi 'compact()')
+    compact_ratio = 0.3
+
+    # record di una riga CSR nel file delle righe: id della pagina, indice del titolo, fine dei
+    # suoi link nel file dei link (offsets[r+1]) e digest (sha1 esadecimale, vuoto se non presente)
+    row_dtype = np.dtype([('id', '<i8'), ('title', '<i4'), ('end', '<i8'), ('digest', 'S40')])
+
     def __init__(self, args_paths, t_graph='TNGraph'):
         """
         Inizializzazione della classe.
 
-        In 'compact_struct' salvo un dict contenente n chiavi (titoli), dove n = numeri nodi del grafo, in 
-        cui ciascuna è associata ad una tupla (x, y) con x = id pagina, y = set di link a cui punta (uso un 
-        set per togliere duplicati dei link, quindi non è possibile che una pagina punti più volte ad
-        un'altra)
+        I titoli vengono INTERNATI: ad ogni titolo (di una pagina o di un link) viene associato un
+        indice intero la prima volta che viene letto. In 'titles' salvo il titolo di ogni indice e in 
+        'page_ids' l'id della pagina che ha quel titolo (-1 se la pagina non è ancora stata letta o 
+        non esiste nel grafo completo).
+
+        I link uscenti delle pagine sono salvati in formato CSR: la pagina alla riga r punta agli
+        indici dei titoli targets[offsets[r]:offsets[r+1]] (senza duplicati, quindi non è possibile che
+        una pagina punti più volte ad un'altra). 'targets' non viene tenuto in memoria ma viene scritto
+        a blocchi su file durante la lettura del dump e letto con mmap nel 'computeEdges()'.
+        Per ogni riga salvo l'id della pagina ('row_ids') e l'indice del suo titolo ('row_titles'),
+        -1 se la pagina è stata eliminata.
 
         Questa struttra di supporto mi serve dato che in fase di scrittura dei nodi nel grafo, non 
         ho conoscienza dell' id dei link a cui punta una pagina dato che potrebbero rappresentare pagine
-        non ancora lette o che non esisteranno nel grafo completo.
+        non ancora lette o che non esisteranno nel grafo completo. Gli indici dei titoli permettono di
+        risolvere questi link alla fine, senza dover tenere in memoria un set di stringhe per pagina.
+
+        In 'digests' salvo per ogni id il digest del testo letto dal dump (vedi 'FilterWikiText.getDigest'),
+        che serve in fase di aggiornamento incrementale dell'indice.
+
+        In 'saved' salvo quanti titoli, righe e righe eliminate sono già stati scritti sui file dello
+        stato (None se lo stato non è ancora stato salvato) e in 'removed' le righe già salvate che
+        sono state eliminate dopo l'ultimo salvataggio (vedi 'save()').
 
         :param sel
         :param args_paths: per determinare i path
         :param t_graph: tipologia grafo
         """
         self.args_paths = args_paths
-        self.graph = WikiGraph.t_graph.get(t_graph, snap.TNGraph).New()
+        self.t_graph = WikiGraph.t_graph.get(t_graph, 'TNGraph')
+        self.graph = None
+
+        self.title_ids = {}
+        self.titles = []
+        self.page_ids = array('q')
+
+        self.rows = {}
+        self.row_ids = array('q')
+        self.row_titles = array('i')
+        self.offsets = array('q', [0])
+
+        self.targets_buffer = array('i')
+        self.links_file = None
+
+        self.digests = {}
+
+        self.generation = 0
+        self.saved = None
+        self.removed = array('q')
+
+
+    def __statePath(self, kind, generation=None):
+        """
+        I file dello stato ('titles', 'rows', 'removed' e 'links') si trovano accanto al file dello
+        stato del grafo ('args_paths.graph') e contengono nel nome la generazione dello stato.
+
+        :param self
+        :param kind: tipo del file
+        :param generation: generazione dello stato (None per quella corrente)
+        return path del file, None se lo stato del grafo non viene salvato
+        """
+        path_graph = getattr(self.args_paths, 'graph', None)
+        if not path_graph:
+            return None
+        return '{}.{}.{}'.format(path_graph, self.generation if generation is None else generation, kind)
+
+
+    def __linksPath(self):
+        """
+        :param self
+        return path del file dei link, None se lo stato del grafo non viene salvato
+        """
+        return self.__statePath('links')
+
+
+    def __openLinksFile(self, mode):
+        """
+        Apertura del file dei link. Se lo stato del grafo non viene salvato, uso un file temporaneo.
+
+        :param self
+        :param mode: modalità di apertura ('w+b' per un nuovo grafo, 'r+b' per un grafo caricato)
+        """
+        path_links = self.__linksPath()
+        if path_links is None:
+            self.links_file = tempfile.TemporaryFile()
+        else:
+            self.links_file = open(path_links, mode)
+
+
+    def __spill(self):
+        """
+        Scrittura sul file dei link uscenti tenuti in memoria.
+
+        :param self
+        """
+        if self.links_file is None:
+            self.__openLinksFile('w+b')
+
+        self.targets_buffer.tofile(self.links_file)
+        self.targets_buffer = array('i')
+        self.links_file.flush()
+
+
+    def __intern(self, title):
+        """
+        :param self
+        :param title: titolo di una pagina o di un link
+        return indice intero associato al titolo
+        """
+        title_idx = self.title_ids.get(title)
+        if title_idx is None:
+            title_idx = len(self.titles)
+            self.title_ids[title] = title_idx
+            self.titles.append(title)
+            self.page_ids.append(-1)
+        return title_idx
+
+
+    @classmethod
+    def load(cls, args_paths, t_graph='TNGraph'):
+        """
+        Creazione del grafo a partire dallo stato salvato su file ('args_paths.graph') alla fine
+        della creazione o dell'ultimo aggiornamento dell'indice (oppure ad un checkpoint).
+        I file dello stato vengono troncati alle lunghezze salvate nel file dello stato, in modo da
+        togliere quello che è stato scritto dopo l'ultimo salvataggio (es: aggiornamento interrotto).
+
+        :param cls
+        :param args_paths: per determinare i path
+        :param t_graph: tipologia grafo
+        return grafo caricato
+        """
+        wiki_graph = cls(args_paths, t_graph)
+
+        try:
+            with open(args_paths.graph) as fp:
+                state = json.load(fp)
+        except ValueError:
+            state = None
+        if state is None or state.get('version') != WikiGraph.STATE_VERSION:
+            raise ValueError('Stato del grafo non valido: '+args_paths.graph)
+
+        wiki_graph.generation = state['generation']
+
+        data = wiki_graph.__readState('titles', state['titles_bytes'])
+        titles = data.decode('utf-8').split('\0')[:-1]
+        records = np.frombuffer(wiki_graph.__readState('rows', state['rows'] * WikiGraph.row_dtype.itemsize),
+                                dtype=WikiGraph.row_dtype)
+        removed = np.frombuffer(wiki_graph.__readState('removed', state['removed'] * 8), dtype=np.int64)
+
+        row_ids = records['id'].copy()
+        row_titles = records['title'].copy()
+        row_ids[removed] = -1
+        row_titles[removed] = -1
+        alive = np.flatnonzero(row_ids >= 0)
+
+        # id della pagina di ogni titolo, dalle righe presenti (in caso di titoli ripetuti vale
+        # l'ultima riga, come in 'addPage()')
+        page_ids = np.full(len(titles), -1, dtype=np.int64)
+        page_ids[row_titles[alive]] = row_ids[alive]
+
+        wiki_graph.titles = titles
+        wiki_graph.title_ids = {title: title_idx for title_idx, title in enumerate(titles)}
+        wiki_graph.page_ids = array('q', page_ids.tobytes())
+        wiki_graph.row_ids = array('q', row_ids.tobytes())
+        wiki_graph.row_titles = array('i', row_titles.tobytes())
+        wiki_graph.offsets = array('q', [0])
+        wiki_graph.offsets.frombytes(records['end'].tobytes())
+
+        ids = row_ids[alive].tolist()
+        wiki_graph.rows = dict(zip(ids, alive.tolist()))
+        wiki_graph.digests = {id_page: digest.decode('ascii') or None
+                              for id_page, digest in zip(ids, records['digest'][alive].tolist())}
+
+        wiki_graph.saved = {'titles': len(titles), 'titles_bytes': state['titles_bytes'],
+                            'rows': state['rows'], 'removed': state['removed']}
+
+        # Tolgo eventuali link scritti dopo l'ultimo salvataggio
+        wiki_graph.__openLinksFile('r+b')
+        wiki_graph.links_file.truncate(wiki_graph.offsets[-1] * wiki_graph.targets_buffer.itemsize)
+        wiki_graph.links_file.seek(0, os.SEEK_END)
+
+        return wiki_graph
+
+
+    def __readState(self, kind, size):
+        """
+        Lettura dei primi 'size' byte di un file dello stato, che viene troncato a questa lunghezza.
+
+        :param self
+        :param kind: tipo del file (vedi '__statePath()')
+        :param size: byte salvati nel file dello stato
+        return bytes letti
+        """
+        with open(self.__statePath(kind), 'r+b') as fp:
+            data = fp.read(size)
+            if len(data) != size:
+                raise ValueError('File dello stato del grafo incompleto: '+self.__statePath(kind))
+            fp.truncate(size)
+        return data
+
+
+    def __appendState(self, kind, size, data):
+        """
+        Scrittura di 'data' in un file dello stato dopo i primi 'size' byte già salvati.
+
+        :param self
+        :param kind: tipo del file (vedi '__statePath()')
+        :param size: byte già salvati nel file (0 per un nuovo file)
+        :param data: bytes da aggiungere
+        """
+        with open(self.__statePath(kind), 'r+b' if size > 0 else 'wb') as fp:
+            fp.seek(size)
+            fp.truncate()
+            fp.write(data)
+
 
-        self.compact_struct = {}
+    def save(self):
+        """
+        Salvataggio su file dello stato del grafo (titoli, righe CSR e digest). I link uscenti sono
+        già presenti nel file dei link.
+        Lo stato permette di riutilizzare il grafo senza rileggere il dump (es: aggiornamento 
+        incrementale dell'indice o ripresa della creazione da un checkpoint).
+        Se il path non è specificato ('args_paths.graph') lo stato non viene salvato.
 
+        I file dello stato vengono solo estesi: ad ogni salvataggio scrivo i titoli e le righe
+        aggiunti dall'ultimo salvataggio e le righe già salvate che sono state eliminate, quindi il
+        costo dipende dalle pagine lette dall'ultimo salvataggio e non da tutto il grafo.
+        Per ultimo viene sostituito (in modo atomico) il file 'args_paths.graph' con le lunghezze dei
+        file: quello che viene scritto dopo, fino al salvataggio successivo, viene ignorato dal 'load()'.
+        Se le righe o i link eliminati sono troppi il grafo viene prima compattato e i file della
+        nuova generazione vengono scritti per intero (vedi 'compact()').
 
-    def addPage(self, id_page, title_page, titles_page_linked=[]):
+        :param self
         """
-        Aggiungo una pagina al grafo e aggiorno il compact_struct con la pagina 
-        corrente e i suoi link. Per descrizione della compact_struct vedere commenti nell'__init__.
+        path_graph = getattr(self.args_paths, 'graph', None)
+        if not path_graph:
+            return
+
+        if self.deadFraction() > WikiGraph.compact_ratio:
+            self.compact()
+
+        self.__spill()
+
+        new_files = self.saved is None
+        if new_files:
+            self.saved = {'titles': 0, 'titles_bytes': 0, 'rows': 0, 'removed': 0}
+        saved = self.saved
+
+        titles = b''.join(title.encode('utf-8')+b'\0' for title in self.titles[saved['titles']:])
+        self.__appendState('titles', saved['titles_bytes'], titles)
+
+        first = saved['rows']
+        records = np.empty(len(self.row_ids) - first, dtype=WikiGraph.row_dtype)
+        records['id'] = np.frombuffer(self.row_ids, dtype=np.int64)[first:]
+        records['title'] = np.frombuffer(self.row_titles, dtype=np.int32)[first:]
+        records['end'] = np.frombuffer(self.offsets, dtype=np.int64)[first+1:]
+        records['digest'] = [(self.digests.get(id_page) or '').encode('ascii') if id_page >= 0 else b''
+                             for id_page in self.row_ids[first:]]
+        self.__appendState('rows', first * WikiGraph.row_dtype.itemsize, records.tobytes())
+
+        self.__appendState('removed', saved['removed'] * 8, self.removed.tobytes())
+
+        state = {'version': WikiGraph.STATE_VERSION,
+                 'generation': self.generation,
+                 'titles_bytes': saved['titles_bytes'] + len(titles),
+                 'rows': len(self.row_ids),
+                 'removed': saved['removed'] + len(self.removed),
+                 'links': self.offsets[-1],
+                 }
+
+        # Scrivo su un file temporaneo in modo da non perdere lo stato precedente in caso di errore
+        with open(path_graph+'.tmp', 'w') as fp:
+            json.dump(state, fp)
+        os.replace(path_graph+'.tmp', path_graph)
+
+        self.saved = {'titles': len(self.titles), 'titles_bytes': state['titles_bytes'],
+                      'rows': state['rows'], 'removed': state['removed']}
+        self.removed = array('q')
+
+        # i file delle altre generazioni vengono eliminati solo dopo aver sostituito lo stato
+        if new_files:
+            self.__removeStateFiles()
+
+
+    def __removeStateFiles(self):
+        """
+        Eliminazione dei file dello stato delle altre generazioni (es: di un grafo precedente).
+
+        :param self
+        """
+        current = {self.__statePath(kind) for kind in ('titles', 'rows', 'removed', 'links')}
+        for path_file in glob.glob(glob.escape(self.args_paths.graph)+'.*.*'):
+            if path_file not in current and path_file.rsplit('.', 1)[-1] in ('titles', 'rows', 'removed', 'links'):
+                os.remove(path_file)
+
+
+    def deadFraction(self):
+        """
+        Le pagine eliminate o modificate (es: aggiornamenti incrementali) lasciano nella struttura
+        CSR la loro riga e i loro link, che vengono comunque letti da 'getCSR()' e 'iterEdges()'.
+
+        :param self
+        return frazione massima tra righe eliminate e link di righe eliminate
+        """
+        if len(self.row_ids) == 0:
+            return 0.0
+
+        dead = np.frombuffer(self.row_ids, dtype=np.int64) < 0
+        n_links = self.offsets[-1]
+        dead_links = np.diff(np.frombuffer(self.offsets, dtype=np.int64))[dead].sum() / n_links if n_links else 0.0
+        return max(dead.mean(), dead_links)
+
+
+    def compact(self, block_size=1 << 22):
+        """
+        Compattazione del grafo: vengono tenute solo le righe delle pagine presenti e i loro link,
+        e vengono eliminati i titoli a cui non fa riferimento nessuna riga o link (gli indici dei
+        titoli vengono rinumerati).
+        Il file dei link viene riscritto a blocchi di 'block_size' link in una nuova generazione
+        dello stato: i file della generazione precedente rimangono validi fino al 'save()' successivo,
+        che scrive per intero i file della nuova generazione.
+
+        :param self
+        :param block_size: numero di link letti per volta
+        """
+        self.__spill()
+
+        row_ids = np.frombuffer(self.row_ids, dtype=np.int64)
+        row_titles = np.frombuffer(self.row_titles, dtype=np.int32)
+        offsets = np.frombuffer(self.offsets, dtype=np.int64)
+        alive = row_ids >= 0
+        n_links = int(offsets[-1])
+
+        targets = np.memmap(self.links_file, dtype=np.int32, mode='r', shape=(n_links,)) if n_links else None
+
+        def liveBlocks():
+            for start in range(0, n_links, block_size):
+                end = min(start+block_size, n_links)
+                yield targets[start:end][alive[WikiGraph.rowsOfLinks(offsets, start, end)]]
+
+        referenced = np.zeros(len(self.titles), dtype=bool)
+        referenced[row_titles[alive]] = True
+        for block in liveBlocks():
+            referenced[block] = True
+        title_map = np.cumsum(referenced) - 1
+
+        generation = self.generation + 1
+        path_links = self.__statePath('links', generation)
+        links_file = tempfile.TemporaryFile() if path_links is None else open(path_links, 'w+b')
+        for block in liveBlocks():
+            title_map[block].astype(np.int32).tofile(links_file)
+        links_file.flush()
+        del targets
+
+        self.links_file.close()
+        self.links_file = links_file
+        self.generation = generation
+
+        self.titles = [title for title, keep in zip(self.titles, referenced.tolist()) if keep]
+        self.title_ids = {title: title_idx for title_idx, title in enumerate(self.titles)}
+        self.page_ids = array('q', np.frombuffer(self.page_ids, dtype=np.int64)[referenced].tobytes())
+
+        live_ids = row_ids[alive]
+        self.row_ids = array('q', live_ids.tobytes())
+        self.row_titles = array('i', title_map[row_titles[alive]].astype(np.int32).tobytes())
+        self.offsets = array('q', [0])
+        self.offsets.frombytes(np.cumsum(np.diff(offsets)[alive]).astype(np.int64).tobytes())
+        self.rows = {id_page: row for row, id_page in enumerate(live_ids.tolist())}
+
+        self.saved = None
+        self.removed = array('q')
+        instrumentation.count('graph_compactions_total')
+
+
+    def addPage(self, id_page, title_page, titles_page_linked=[], digest=None):
+        """
+        Aggiungo una pagina al grafo e una riga alla struttura CSR con i link della pagina. 
+        Per descrizione della struttura vedere commenti nell'__init__.
 
         :param self
         :param id_page: id della pagina da aggiungere
         :param title_page: titolo della pagina da aggiungere
         :param titles_page_linked: link a cui la pagina corrente punta
+        :param digest: digest del testo della pagina
+        """
+        id_page = int(id_page)
+
+        if id_page in self.rows:
+            print('La pagina con id: '+str(id_page)+' e titolo: '+title_page+' è già presente nel grafo.')
+            return False
+
+        title_idx = self.__intern(title_page)
+        self.page_ids[title_idx] = id_page
+
+        self.rows[id_page] = len(self.row_ids)
+        self.row_ids.append(id_page)
+        self.row_titles.append(title_idx)
+
+        targets = {self.__intern(linked_page) for linked_page in titles_page_linked}
+        self.targets_buffer.extend(targets)
+        self.offsets.append(self.offsets[-1] + len(targets))
+        instrumentation.count('graph_pages_total')
+        instrumentation.count('graph_links_total', len(targets))
+
+        if len(self.targets_buffer) >= WikiGraph.spill_size:
+            self.__spill()
+
+        self.digests[id_page] = digest
+        return True
+
+
+    def removePage(self, id_page):
+        """
+        Elimino una pagina dal grafo. La sua riga CSR viene solo marcata come eliminata.
+
+        :param self
+        :param id_page: id della pagina da eliminare
+        return True se la pagina era presente, False altrimenti
         """
         id_page = int(id_page)
 
-        if self.graph.IsNode(id_page):
-            print('La pagina con id: '+id_page+' e titolo: '+title_page+' è già presente nel grafo.')
+        if id_page not in self.rows:
             return False
 
-        self.graph.AddNode(id_page)
+        row = self.rows.pop(id_page)
+        title_idx = self.row_titles[row]
+        self.row_ids[row] = -1
+        self.row_titles[row] = -1
+        if self.saved is not None and row < self.saved['rows']:
+            self.removed.append(row)
+
+        if self.page_ids[title_idx] == id_page:
+            self.page_ids[title_idx] = -1
+
+        self.digests.pop(id_page, None)
+        return True
+
+
+    def updatePage(self, id_page, title_page, titles_page_linked=[], digest=None):
+        """
+        Aggiungo una pagina al grafo sostituendo la versione precedente se presente.
+
+        :param self
+        :param id_page: id della pagina
+        :param title_page: titolo della pagina
+        :param titles_page_linked: link a cui la pagina corrente punta
+        :param digest: digest del testo della pagina
+        """
+        self.removePage(id_page)
+        return self.addPage(id_page, title_page, titles_page_linked, digest)
+
+
+    def getDigest(self, id_page):
+        """
+        :param self
+        :param id_page: id della pagina
+        return digest della pagina salvato nel grafo, None se la pagina non è presente
+        """
+        return self.digests.get(int(id_page))
+
+
+    def getPageIds(self):
+        """
+        :param self
+        return set degli id delle pagine presenti nel grafo
+        """
+        return set(self.rows.keys())
+
+
+    def iterEdges(self):
+        """
+        Per ogni pagina (riga CSR), ricavo il suo id (id_page_from) e gli indici dei titoli 
+        corrispondenti ai link a cui punta. Per ognuno di questi titoli, guardo se è associato ad una
+        pagina presente nel grafo (id_page_to >= 0) e in caso affermativo ritorno l'edge dato
+        da (page_from, page_to).
 
-        self.compact_struct[title_page] = tuple((id_page, set()))
-        for linked_page in titles_page_linked:
-            self.compact_struct[title_page][1].add(linked_page)
+        Il file dei link viene letto tramite mmap, quindi non viene caricato interamente in memoria.
+
+        :param self
+        yield: tuple (id_page_from, id_page_to)
+        """
+        self.__spill()
+
+        if self.offsets[-1] == 0:
+            return
+
+        mapped = mmap.mmap(self.links_file.fileno(), 0, access=mmap.ACCESS_READ)
+        targets = memoryview(mapped).cast('i')
+        try:
+            page_ids = self.page_ids
+            offsets = self.offsets
+
+            for row, id_page_from in enumerate(self.row_ids):
+                if id_page_from < 0:
+                    continue
+
+                for title_idx in targets[offsets[row]:offsets[row+1]]:
+                    id_page_to = page_ids[title_idx]
+                    if id_page_to >= 0:
+                        yield id_page_from, id_page_to
+        finally:
+            targets.release()
+            mapped.close()
 
 
     def computeEdges(self):
         """
-        Per ogni pagina (page_from), ricavo il suo id (id_page_from) e il suo set di titoli 
-        corrispondenti ai link a cui punta. Per ognuno di questi titoli, guardo se è presente nel grafo 
-        (page_to not None) e in caso affermativo ricavo il suo id id_page_to, per poi creare l'edge
-        dato da (page_from, page_to).
+        Creazione del grafo snap con un nodo per ogni pagina e tutti gli edges (a,b) 
+        (vedi 'iterEdges()').
 
         In tutti gli edges (a,b) che creo, 'a' e 'b' sono entrambi presenti nel grafo.
 
         :param self
+        return grafo snap
         """
-        for page_from in self.compact_struct.values():
-            id_page_from = page_from[0]
-            links_out = page_from[1]
+        if snap is None:
+            raise ImportError('Il grafo snap richiede il pacchetto snap-stanford')
+
+        self.graph = getattr(snap, self.t_graph).New()
+
+        for id_page in self.row_ids:
+            if id_page >= 0:
+                self.graph.AddNode(id_page)
+
+        for id_page_from, id_page_to in self.iterEdges():
+            self.graph.AddEdge(id_page_from, id_page_to)
+
+        return self.graph
+
+
+    @staticmethod
+    def rowsOfLinks(offsets, start, end):
+        """
+        Riga CSR di ogni link nell'intervallo [start, end) del file dei link, calcolata solo per
+        questo blocco (un array con la riga di tutti i link avrebbe un elemento per ogni link del grafo).
+
+        :param offsets: array NumPy degli offset delle righe
+        :param start: posizione del primo link
+        :param end: posizione successiva all'ultimo link
+        return array delle righe
+        """
+        return np.searchsorted(offsets, np.arange(start, end), side='right') - 1
+
+
+    def getCSR(self, block_size=1 << 22):
+        """
+        Matrice di adiacenza del grafo in formato CSR, con un nodo per ogni pagina presente.
+        Il nodo i corrisponde alla pagina node_ids[i] e punta ai nodi indices[indptr[i]:indptr[i+1]].
+
+        Come in 'iterEdges()', gli indici dei titoli dei link vengono risolti nei nodi delle pagine
+        corrispondenti (i link a pagine non presenti vengono scartati). Il file dei link viene letto 
+        tramite mmap a blocchi di 'block_size' link.
+        Come nel grafo snap, i link ripetuti nella stessa pagina diventano un solo arco.
+
+        :param self
+        :param block_size: numero di link risolti per volta
+        return node_ids, indptr, indices (array NumPy)
+        """
+        self.__spill()
+
+        row_ids = np.frombuffer(self.row_ids, dtype=np.int64)
+        row_titles = np.frombuffer(self.row_titles, dtype=np.int32)
+        offsets = np.frombuffer(self.offsets, dtype=np.int64)
+        page_ids = np.frombuffer(self.page_ids, dtype=np.int64)
+
+        alive = row_ids >= 0
+        node_ids = row_ids[alive]
+        node_of_row = np.cumsum(alive) - 1
+        node_of_row[~alive] = -1
+
+        # nodo della pagina associata ad ogni titolo (-1 se nessuna pagina presente)
+        node_of_title = np.full(len(page_ids), -1, dtype=np.int64)
+        owner = alive & (page_ids[np.maximum(row_titles, 0)] == row_ids)
+        node_of_title[row_titles[owner]] = node_of_row[owner]
+
+        n = len(node_ids)
+        n_links = int(offsets[-1])
+        if n_links == 0:
+            return node_ids, np.zeros(n+1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        targets = np.memmap(self.links_file, dtype=np.int32, mode='r', shape=(n_links,))
+
+        sources = []
+        indices = []
+        for start in range(0, n_links, block_size):
+            end = min(start+block_size, n_links)
+            src = node_of_row[WikiGraph.rowsOfLinks(offsets, start, end)]
+            dst = node_of_title[targets[start:end]]
+            valid = (src >= 0) & (dst >= 0)
+            sources.append(src[valid])
+            indices.append(dst[valid])
+        del targets
 
-            for link in links_out:
-                page_to = self.compact_struct.get(link, None)
-                if page_to is not None:
-                    id_page_to = page_to[0]
+        # archi unici ordinati per (sorgente, destinazione)
+        edges = np.unique(np.concatenate(sources) * n + np.concatenate(indices))
+        sources, indices = np.divmod(edges, n)
 
-                    self.graph.AddEdge(id_page_from, id_page_to)
+        indptr = np.zeros(n+1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=n), out=indptr[1:])
+
+        return node_ids, indptr, indices
 
 
     def end(self):
@@ -126,13 +692,210 @@ class WikiGraph():
 
         Qua eseguo il 'computeEdges()' che mi calcola tutti i possibili edges che 
         compongono il grafo, per poi effettuare il pagerank.
+        Se 'args_paths.pagerank_engine' è 'numpy', il pagerank viene calcolato sulla matrice CSR
+        (vedi 'getCSR()') senza creare il grafo snap.
+
+        Viene salvato il file corrispondente alla table del pagerank e lo stato del grafo
+        (vedi 'save()'), ma non il grafo snap.
+
+        Prima del calcolo, se le righe o i link eliminati sono troppi, il grafo viene compattato
+        (vedi 'compact()').
+
+        :param self
+        """
+        if self.deadFraction() > WikiGraph.compact_ratio:
+            self.compact()
+
+        engine = getattr(self.args_paths, 'pagerank_engine', 'snap')
+        with instrumentation.timer('pagerank_seconds', engine=engine):
+            if engine == 'numpy':
+                WikiPageRanker.computePageRankSparse(*self.getCSR(), self.args_paths)
+            else:
+                self.computeEdges()
+                WikiPageRanker.computePageRank(self.graph, self.args_paths)
+        self.save()
+
+
+NUMPY_MAGIC = b'\x93NUMPY'
+
+
+class SortedRankTable():
+    """
+    Table (id_page, value_pagerank) calcolata con NumPy: gli id delle pagine sono ordinati,
+    quindi il rank di una pagina viene cercato con una ricerca binaria.
+    Si usa come la 'snap.TIntFltH' (table_rank[id_page]).
+    """
+
+    def __init__(self, ids, ranks):
+        """
+        :param self
+        :param ids: id delle pagine
+        :param ranks: rank delle pagine
+        """
+        order = np.argsort(ids, kind='stable')
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.ranks = np.asarray(ranks, dtype=np.float64)[order]
+
+
+    @classmethod
+    def load(cls, path_file):
+        """
+        :param cls
+        :param path_file: file salvato con 'save()'
+        return SortedRankTable
+        """
+        with open(path_file, 'rb') as fp:
+            return cls(np.load(fp), np.load(fp))
+
+
+    def save(self, path_file):
+        """
+        :param self
+        :param path_file: file dove salvare gli id e i rank
+        """
+        with open(path_file, 'wb') as fp:
+            np.save(fp, self.ids)
+            np.save(fp, self.ranks)
+
+
+    def __len__(self):
+        return len(self.ids)
+
+
+    def __getitem__(self, id_page):
+        """
+        :param self
+        :param id_page: id della pagina
+        return rank della pagina, 0 se non presente
+        """
+        pos = np.searchsorted(self.ids, id_page)
+        if pos < len(self.ids) and self.ids[pos] == id_page:
+            return float(self.ranks[pos])
+        return 0.0
+
 
-        Non viene salvato il grafo ma solo il file corrispondente alla table del pagrank.
+class DocRankTable():
+    """
+    Table del pagerank allineata ai docnum di whoosh: l'elemento i dell'array float32 è il pagerank
+    del documento con docnum i (0 per i documenti eliminati o senza pagerank).
+
+    I docnum cambiano ad ogni commit dell'indice, quindi la table è legata alla generazione del reader
+    con cui è stata creata ed è salvata nel file '<pagerank>.gen<generazione>.npy'.
+    Il file viene aperto con mmap: il caricamento è immediato, la memoria è condivisa tra i processi
+    che leggono la stessa table e il rank di un documento (o di un array di documenti) è un accesso
+    all'array.
+    """
 
+    def __init__(self, path_file):
+        """
         :param self
+        :param path_file: file salvato con 'build()'
+        """
+        self.ranks = np.load(path_file, mmap_mode='r')
+        self.prior = None
+        self.prior_alpha = None
+
+
+    @classmethod
+    def pathFor(cls, path_pagerank, generation):
+        """
+        :param cls
+        :param path_pagerank: file della table (id_page, value_pagerank)
+        :param generation: generazione dell'indice
+        return path della table allineata ai docnum della generazione
+        """
+        return path_pagerank+'.gen'+str(generation)+'.npy'
+
+
+    @classmethod
+    def clear(cls, path_pagerank, keep=None):
+        """
+        Eliminazione delle table allineate ai docnum create per la table (id_page, value_pagerank).
+
+        :param cls
+        :param path_pagerank: file della table (id_page, value_pagerank)
+        :param keep: path della table da non eliminare
+        """
+        for path_file in glob.glob(glob.escape(path_pagerank)+'.gen*.npy'):
+            if path_file != keep:
+                os.remove(path_file)
+
+
+    @classmethod
+    def build(cls, path_file, reader, table_rank):
+        """
+        Creazione della table a partire dalla table (id_page, value_pagerank).
+        Il docnum di ogni pagina è ricavato dalla posting list del suo id nel campo 'id_page',
+        senza leggere i campi salvati dei documenti.
+
+        :param cls
+        :param path_file: file dove salvare la table
+        :param reader: reader dell'indice
+        :param table_rank: table (id_page, value_pagerank)
+        return DocRankTable
+        """
+        ranks = np.zeros(reader.doc_count_all(), dtype=np.float32)
+
+        # il lessico contiene anche gli id dei documenti eliminati, che hanno la posting list vuota
+        for id_page in reader.lexicon('id_page'):
+            docnums = list(reader.postings('id_page', id_page).all_ids())
+            if docnums:
+                ranks[docnums] = table_rank[int(id_page.decode('utf-8'))]
+
+        # file temporaneo diverso per ogni processo che può creare la stessa table
+        path_tmp = path_file+'.'+str(os.getpid())+'.tmp'
+        with open(path_tmp, 'wb') as fp:
+            np.save(fp, ranks)
+        os.replace(path_tmp, path_file)
+
+        return cls(path_file)
+
+
+    def __len__(self):
+        return len(self.ranks)
+
+
+    def __getitem__(self, docnums):
+        """
+        :param self
+        :param docnums: docnum o array di docnum
+        return pagerank dei documenti
+        """
+        return self.ranks[docnums]
+
+
+    def getPrior(self, alpha=2):
         """
-        self.computeEdges()
-        WikiPageRanker.computePageRank(self.graph, self.args_paths)
+        Prior statico di ogni documento, usato per combinare il pagerank con lo score testuale
+        durante la ricerca (vedi 'searching.staticPrior').
+        Il prior non dipende dalla query, quindi il rank non può essere normalizzato rispetto al max
+        dei soli documenti ritornati come in 'WikiPageRanker.prepareCalculatorRank()'. Dato che la
+        distribuzione del pagerank è a coda lunga, normalizzare rispetto al max di tutto l'indice 
+        darebbe un prior circa 1 a quasi tutti i documenti: il rank viene quindi normalizzato in
+        scala logaritmica tra il rank minimo (pagine senza link entranti) e quello max
+
+            prior = 1 + (log(rank / min) / log(max / min)) ^ alpha
+
+        Il prior è compreso tra 1 e 2 (1 per i documenti senza pagerank) e viene calcolato una sola volta.
+
+        :param self
+        :param alpha: esponente applicato al rank normalizzato
+        return array float32 con il prior di ogni docnum
+        """
+        if self.prior is None or self.prior_alpha != alpha:
+            ranks = np.asarray(self.ranks, dtype=np.float64)
+            positive = ranks[ranks > 0]
+            normalized = np.zeros(len(ranks))
+
+            if len(positive) and positive.max() > positive.min():
+                min_rel, max_rel = positive.min(), positive.max()
+                mask = ranks > 0
+                normalized[mask] = np.log(ranks[mask] / min_rel) / np.log(max_rel / min_rel)
+
+            self.prior = (1 + np.power(normalized, alpha)).astype(np.float32)
+            self.prior_alpha = alpha
+
+        return self.prior
 
 
 class WikiPageRanker():
@@ -141,16 +904,83 @@ class WikiPageRanker():
           https://snap.stanford.edu/snappy/doc/reference/composite.html#thash
     """
 
+    params = {'C': 0.85,
+              'Eps': 1e-4,
+              'MaxIter': 100}
+
     def __init__(self, args_paths):
         """
-        Caricamento da file della table (id_page, value_pagerank).
-        Genera eccezione se il file non esiste.
+        Genera eccezione se il file della table del pagerank non esiste.
+        La table (id_page, value_pagerank) viene caricata solo quando serve: per la ricerca si 
+        usano le table allineate ai docnum (vedi 'getDocTable()').
 
         :param self
         :param args_paths: path dello storage della tabella del page rank.
         """
-        self.table_rank = snap.TIntFltH()
-        snapLoad(self.table_rank, args_paths.pagerank)    
+        if not os.path.exists(args_paths.pagerank):
+            raise FileNotFoundError(args_paths.pagerank)
+
+        self.path_pagerank = args_paths.pagerank
+        self.__table_rank = None
+        self.__table_mtime = None
+        self.doc_tables = {}
+
+
+    @property
+    def table_rank(self):
+        """
+        Caricamento da file della table (id_page, value_pagerank), salvata da snap o da NumPy
+        (riconosciuta dal magic number del formato '.npy').
+        La table viene ricaricata se il file è stato modificato (es: pagerank ricalcolato da un
+        aggiornamento dell'indice eseguito da un altro processo).
+
+        :param self
+        return table (id_page, value_pagerank)
+        """
+        mtime = os.path.getmtime(self.path_pagerank)
+        if self.__table_rank is None or mtime != self.__table_mtime:
+            self.__table_mtime = mtime
+            with open(self.path_pagerank, 'rb') as fp:
+                is_numpy = fp.read(len(NUMPY_MAGIC)) == NUMPY_MAGIC
+
+            if is_numpy:
+                self.__table_rank = SortedRankTable.load(self.path_pagerank)
+            else:
+                self.__table_rank = snap.TIntFltH()
+                snapLoad(self.__table_rank, self.path_pagerank)
+
+        return self.__table_rank
+
+
+    def getDocTable(self, reader):
+        """
+        Table del pagerank allineata ai docnum del reader (vedi 'DocRankTable').
+        Se non esiste ancora per la generazione del reader (o è più vecchia della table del pagerank)
+        viene creata e le table delle generazioni precedenti vengono eliminate.
+
+        :param self
+        :param reader: reader dell'indice
+        return DocRankTable
+        """
+        generation = reader.generation()
+        doc_table = self.doc_tables.get(generation)
+        if doc_table is not None:
+            return doc_table
+
+        path_file = DocRankTable.pathFor(self.path_pagerank, generation)
+        if os.path.exists(path_file) and os.path.getmtime(path_file) >= os.path.getmtime(self.path_pagerank):
+            doc_table = DocRankTable(path_file)
+        else:
+            with instrumentation.timer('pagerank_doc_table_seconds'):
+                doc_table = DocRankTable.build(path_file, reader, self.table_rank)
+            DocRankTable.clear(self.path_pagerank, keep=path_file)
+
+        # tengo solo le ultime due generazioni (i reader di alcuni thread possono essere ancora
+        # sulla generazione precedente)
+        self.doc_tables[generation] = doc_table
+        for old_generation in sorted(self.doc_tables)[:-2]:
+            del self.doc_tables[old_generation]
+        return doc_table
 
 
     @classmethod
@@ -165,16 +995,37 @@ class WikiPageRanker():
         :param graph: grafo su cui calcolare il pagerank
         :parma args_paths: dove salvare la table del page rank
         """
-        params = {'C': 0.85,
-                  'Eps': 1e-4,
-                  'MaxIter': 100}
-
         table_rank = snap.TIntFltH()
-        snap.GetPageRank(graph, table_rank, *params.values())
+        snap.GetPageRank(graph, table_rank, *cls.params.values())
 
         snapSave(table_rank, args_paths.pagerank)
 
 
+    @classmethod
+    def computePageRankSparse(cls, node_ids, indptr, indices, args_paths):
+        """
+        Calcolo del page rank con NumPy/SciPy sulla matrice CSR del grafo (vedi 'sparseRank.pageRank'),
+        con gli stessi parametri di snap.
+        La table viene salvata su file come due array '.npy' (id delle pagine ordinati e rank).
+
+        :param cls
+        :param node_ids: id della pagina di ogni nodo
+        :param indptr: array CSR degli offset
+        :param indices: array CSR dei nodi puntati
+        :param args_paths: dove salvare la table del page rank
+        """
+        rank, info = sparseRank.pageRank(indptr, indices,
+                                         damping=cls.params['C'],
+                                         tol=cls.params['Eps'],
+                                         max_iter=cls.params['MaxIter'])
+
+        print('PageRank: '+str(info['iterations'])+' iterazioni, convergenza: '+str(info['converged'])
+              +' (delta: '+str(info['delta'])+')')
+        instrumentation.gauge('pagerank_iterations', info['iterations'])
+
+        SortedRankTable(node_ids, rank).save(args_paths.pagerank)
+
+
     def prepareCalculatorRank(self, filter_ids):
         """
         Calcolo il max rank tra i documenti passati, per poi ritornare la 
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Calcolo del pagerank con NumPy (e SciPy se disponibile) sulla matrice di adiacenza in formato CSR,
+in alternativa a 'snap.GetPageRank'.
+
+Il grafo con n nodi è rappresentato da 'indptr' e 'indices': il nodo i punta ai nodi
+indices[indptr[i]:indptr[i+1]].
+"""
+
+import numpy as np
+
+
+def pageRank(indptr, indices, damping=0.85, tol=1e-4, max_iter=100):
+    """
+    DOCS : https://snap.stanford.edu/snappy/doc/reference/GetPageRank.html
+
+    Power iteration del pagerank. Ad ogni iterazione ogni nodo distribuisce 'damping' volte il suo
+    rank ai nodi a cui punta; il rank 'perso' (teleport e nodi dangling, ovvero senza link uscenti)
+    viene ridistribuito in modo uniforme su tutti i nodi, come in snap.
+    L'iterazione termina quando la somma delle differenze assolute tra due iterazioni è < tol.
+
+    Il prodotto matrice-vettore è eseguito con una matrice sparsa di SciPy oppure, se SciPy non
+    è installato, con 'np.bincount'.
+
+    :param indptr: array CSR degli offset (n+1 elementi)
+    :param indices: array CSR dei nodi puntati
+    :param damping: damping factor
+    :param tol: tolleranza per la convergenza
+    :param max_iter: numero max di iterazioni
+    return array con il rank di ogni nodo, dict con 'iterations', 'converged' e 'delta'
+    """
+    indptr = np.asarray(indptr, dtype=np.int64)
+    indices = np.asarray(indices, dtype=np.int64)
+    n = len(indptr) - 1
+
+    if n == 0:
+        return np.zeros(0), {'iterations': 0, 'converged': True, 'delta': 0.0}
+
+    # SciPy viene importato solo qui, dato che serve solo per il calcolo del pagerank
+    try:
+        from scipy import sparse
+    except ImportError:
+        sparse = None
+
+    out_degree = np.diff(indptr)
+    dangling = out_degree == 0
+    inv_out_degree = np.zeros(n)
+    inv_out_degree[~dangling] = 1.0 / out_degree[~dangling]
+
+    if sparse is not None:
+        # trasposta della matrice di adiacenza: riga j = nodi che puntano a j
+        transposed = sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(n, n)).T.tocsr()
+
+        def propagate(weights):
+            return transposed.dot(weights)
+    else:
+        def propagate(weights):
+            return np.bincount(indices, weights=np.repeat(weights, out_degree), minlength=n)
+
+    rank = np.full(n, 1.0 / n)
+    delta = float('inf')
+    iterations = 0
+
+    for iterations in range(1, max_iter+1):
+        new_rank = damping * propagate(rank * inv_out_degree)
+        new_rank += (1.0 - new_rank.sum()) / n
+
+        delta = float(np.abs(new_rank - rank).sum())
+        rank = new_rank
+        if delta < tol:
+            break
+
+    return rank, {'iterations': iterations, 'converged': delta < tol, 'delta': delta}
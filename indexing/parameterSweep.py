@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ricerca dei parametri di 'WikiSearcher.search' che massimizzano MAP e NDCG sulle query
+dell'evaluation (vedi 'Evaluator'), senza interfaccia grafica (vedi 'sweep.py').
+
+Le configurazioni sono tutte quelle della griglia ('gridConfigurations') oppure un campione casuale
+('randomConfigurations') e vengono valutate in parallelo da un pool di processi: ogni processo apre
+l'indice una sola volta (in '_initWorker') e valuta tutte le configurazioni che riceve, quindi tra
+una configurazione e l'altra vengono riusati:
+    - i reader e i searcher di ogni weighting, con le statistiche dei termini (es: idf) già lette;
+    - la table del pagerank e il suo prior;
+    - le espansioni delle query, che dipendono solo dal testo (memorizzate dall'Expander e nella
+      cache su disco, se presente, condivisa tra i processi).
+Le configurazioni vengono inviate nell'ordine della griglia, in cui 'exp' e 'group' cambiano più
+lentamente, così ogni processo riceve di seguito configurazioni con le stesse query.
+Nei processi worker le query di una configurazione sono eseguite in sequenza (i processi sono già
+uno per cpu); con un solo worker sono eseguite da un pool di thread che rimane aperto per tutte le
+configurazioni, quindi ogni thread riusa il proprio reader (vedi 'WikiSearcher').
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import itertools
+import random
+import time
+
+from . import index
+from . import evaluation
+from .searching.searchPool import SearchPool
+
+
+# parametri della griglia, nell'ordine in cui vengono combinati (l'ultimo cambia più velocemente)
+PARAMETERS = ('exp', 'group', 'page_rank', 'weighting', 'title_boost', 'text_boost')
+
+# colonne della tabella dei risultati oltre ai parametri
+COLUMNS = ('map', 'ndcg', 'r_precision', 'f_measure', 'seconds')
+
+
+# WikiIndex del processo worker, aperto una sola volta in '_initWorker'
+_wiki_index = None
+
+
+def _initWorker(args_paths):
+    """
+    Inizializzazione del processo worker: apertura dell'indice.
+
+    :param args_paths: path dell'indice, del pagerank e del test set
+    """
+    global _wiki_index
+    _wiki_index = index.WikiIndex(args_paths)
+    _wiki_index.open()
+
+
+def _evaluate(settings):
+    """
+    Valutazione eseguita nel processo worker.
+
+    :param settings: parametri della ricerca
+    return riga della tabella dei risultati
+    """
+    return evaluateSettings(_wiki_index, settings)
+
+
+def gridConfigurations(grid):
+    """
+    :param grid: dict parametro -> lista dei valori da provare
+    return lista di dict con tutte le combinazioni dei valori
+    """
+    names = [name for name in PARAMETERS if name in grid] + [name for name in grid if name not in PARAMETERS]
+    return [dict(zip(names, values)) for values in itertools.product(*[grid[name] for name in names])]
+
+
+def randomConfigurations(grid, n_samples, seed=None):
+    """
+    Campione casuale (senza ripetizioni) delle combinazioni della griglia, nell'ordine della griglia.
+
+    :param grid: dict parametro -> lista dei valori da provare
+    :param n_samples: numero di configurazioni (tutte se sono meno)
+    :param seed: seed del generatore casuale
+    return lista di dict
+    """
+    configurations = gridConfigurations(grid)
+    if n_samples >= len(configurations):
+        return configurations
+
+    chosen = random.Random(seed).sample(range(len(configurations)), n_samples)
+    return [configurations[i] for i in sorted(chosen)]
+
+
+def evaluateSettings(wiki_index, settings, pool=None):
+    """
+    Esecuzione delle query dell'evaluation con i parametri richiesti e calcolo delle misure.
+
+    :param wiki_index: WikiIndex aperto
+    :param settings: parametri della ricerca
+    :param pool: SearchPool (aperto per tutte le configurazioni) con cui eseguire le query, se None
+                 vengono eseguite in sequenza
+    return dict con i parametri e le misure (media sulle query per quelle calcolate per query)
+    """
+    start = time.perf_counter()
+    evaluator = evaluation.Evaluator(wiki_index, dict(settings), pool=pool, workers=1)
+    metrics = evaluator.metrics()
+
+    def mean(values):
+        values = [v for v in values.values() if v != 'error']
+        return round(sum(values)/len(values), 3) if values else None
+
+    return {**settings,
+            'map': metrics['map'],
+            'ndcg': round(metrics['avg_ndcg'], 3),
+            'r_precision': mean(metrics['r_precision']),
+            'f_measure': mean(metrics['f_measure']),
+            'seconds': round(time.perf_counter()-start, 3),
+            }
+
+
+def sweep(args_paths, configurations, n_workers=1, callback=None):
+    """
+    Valutazione di tutte le configurazioni. Con un solo worker le configurazioni vengono valutate
+    nel processo corrente.
+
+    :param args_paths: path dell'indice, del pagerank e del test set (vedi 'WikiIndex')
+    :param configurations: lista di dict dei parametri della ricerca
+    :param n_workers: numero di processi
+    :param callback: funzione chiamata con ogni riga appena calcolata (es: per il progresso)
+    return lista delle righe della tabella dei risultati, nell'ordine delle configurazioni
+    """
+    rows = []
+
+    if n_workers <= 1:
+        wiki_index = index.WikiIndex(args_paths)
+        wiki_index.open()
+        try:
+            with SearchPool(args_paths, evaluation.Evaluator.workers, 'thread', wiki_index=wiki_index) as pool:
+                for settings in configurations:
+                    rows.append(evaluateSettings(wiki_index, settings, pool))
+                    if callback is not None:
+                        callback(rows[-1])
+        finally:
+            wiki_index.close()
+        return rows
+
+    with ProcessPoolExecutor(n_workers, initializer=_initWorker, initargs=(args_paths,)) as executor:
+        for row in executor.map(_evaluate, configurations):
+            rows.append(row)
+            if callback is not None:
+                callback(row)
+    return rows
+
+
+def writeTable(path_file, rows, sort_by='map'):
+    """
+    Salvataggio della tabella dei risultati in csv, ordinata per 'sort_by' decrescente.
+
+    :param path_file: file csv
+    :param rows: righe calcolate da 'sweep()'
+    :param sort_by: colonna per l'ordinamento
+    return righe ordinate
+    """
+    rows = sorted(rows, key=lambda row: row[sort_by] if row[sort_by] is not None else -1, reverse=True)
+    names = [name for name in PARAMETERS if any(name in row for row in rows)]
+    names += [name for row in rows for name in row if name not in names and name not in COLUMNS]
+    fields = list(dict.fromkeys(names)) + list(COLUMNS)
+
+    with open(path_file, 'w', newline='') as fp:
+        writer = csv.DictWriter(fp, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    return rows
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+DOCS : https://docs.python.org/3/library/sqlite3.html
+
+Cache su disco delle espansioni delle query (vedi 'Expander'), che rimane valida anche dopo il
+riavvio dell'applicazione. L'espansione dipende solo dal testo della query e da WordNet, quindi
+non deve essere invalidata quando cambia l'indice.
+
+La cache è un database sqlite: può essere usata da più thread e da più processi (es: i worker
+del 'SearchPool') contemporaneamente. Il numero di espansioni salvate è limitato a 'max_size',
+oltre il quale vengono eliminate quelle usate meno di recente.
+
+La lettura di un'espansione non scrive sul database: l'ultimo utilizzo viene tenuto in memoria e
+salvato insieme al successivo inserimento, quindi le ricerche servite dalla cache non aspettano il
+lock di scrittura di sqlite.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+
+class ExpansionCache():
+
+    # da incrementare se cambia il calcolo dell'espansione, così le espansioni salvate non vengono usate
+    version = 1
+
+    # frazione di 'max_size' eliminata in più quando la cache è piena, così l'eliminazione non
+    # viene ripetuta ad ogni inserimento
+    prune_ratio = 0.1
+
+    def __init__(self, path_file, max_size=10000):
+        """
+        :param self
+        :param path_file: path del database della cache
+        :param max_size: numero max di espansioni salvate
+        """
+        self.path_file = path_file
+        self.max_size = max_size
+
+        self.local = threading.local()
+        self.stats = {'hits': 0, 'misses': 0, 'errors': 0}
+
+        # ultimo utilizzo delle espansioni lette dalla cache e non ancora salvato (vedi 'get()')
+        self.used = {}
+        self.lock = threading.Lock()
+
+        with self.__connection() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS expansion '
+                         '(key TEXT PRIMARY KEY, terms TEXT NOT NULL, used REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS expansion_used ON expansion (used)')
+            # numero approssimato di espansioni salvate (vedi 'put()')
+            self.n_rows = conn.execute('SELECT COUNT(*) FROM expansion').fetchone()[0]
+
+
+    def __connection(self):
+        """
+        Le connessioni sqlite non possono essere condivise tra thread, quindi ne apro una per thread.
+
+        :param self
+        return sqlite3.Connection del thread corrente
+        """
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path_file, timeout=5.0)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self.local.conn = conn
+        return conn
+
+
+    @classmethod
+    def encodeKey(cls, key):
+        """
+        :param cls
+        :param key: tuple serializzabile in json
+        return chiave nel database
+        """
+        return json.dumps([cls.version, *key], ensure_ascii=False)
+
+
+    def get(self, key):
+        """
+        Viene eseguita solo una lettura (in WAL non aspetta le scritture degli altri processi):
+        l'ultimo utilizzo dell'espansione viene salvato dal 'put()' successivo.
+
+        :param self
+        :param key: tuple che identifica l'espansione (vedi 'Expander.cachedExpansion()')
+        return lista dei termini dell'espansione, None se non presente
+        """
+        key = ExpansionCache.encodeKey(key)
+        try:
+            row = self.__connection().execute('SELECT terms FROM expansion WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error:
+            # la cache non deve bloccare la ricerca (es: database bloccato da un altro processo)
+            self.stats['errors'] += 1
+            return None
+
+        if row is None:
+            self.stats['misses'] += 1
+            return None
+
+        with self.lock:
+            self.used[key] = time.time()
+        self.stats['hits'] += 1
+        return json.loads(row[0])
+
+
+    def __flushUsed(self, conn):
+        """
+        Salvataggio degli ultimi utilizzi tenuti in memoria, nella transazione di 'conn'.
+        Se la transazione fallisce vengono persi: servono solo a scegliere le espansioni da eliminare.
+
+        :param self
+        :param conn: sqlite3.Connection con la transazione aperta
+        """
+        with self.lock:
+            used, self.used = self.used, {}
+        if used:
+            conn.executemany('UPDATE expansion SET used = ? WHERE key = ? AND used < ?',
+                             [(t, key, t) for key, t in used.items()])
+
+
+    def put(self, key, terms):
+        """
+        Salvataggio di un'espansione insieme agli ultimi utilizzi tenuti in memoria.
+        Il numero di espansioni salvate viene stimato (conta gli inserimenti di questo processo):
+        solo quando la stima supera 'max_size' viene contato con una query e, se la cache è piena,
+        vengono eliminate le espansioni usate meno di recente fino a scendere sotto 'max_size'
+        di 'prune_ratio'.
+
+        :param self
+        :param key: tuple che identifica l'espansione
+        :param terms: lista dei termini dell'espansione
+        """
+        if self.max_size <= 0:
+            return
+
+        key = ExpansionCache.encodeKey(key)
+        try:
+            with self.__connection() as conn:
+                conn.execute('INSERT OR REPLACE INTO expansion (key, terms, used) VALUES (?, ?, ?)',
+                             (key, json.dumps(terms, ensure_ascii=False), time.time()))
+                self.__flushUsed(conn)
+                self.n_rows += 1
+                if self.n_rows > self.max_size:
+                    self.n_rows = conn.execute('SELECT COUNT(*) FROM expansion').fetchone()[0]
+                    if self.n_rows > self.max_size:
+                        n_over = self.n_rows - self.max_size + int(self.max_size * ExpansionCache.prune_ratio)
+                        conn.execute('DELETE FROM expansion WHERE key IN '
+                                     '(SELECT key FROM expansion ORDER BY used LIMIT ?)', (n_over,))
+                        self.n_rows -= n_over
+        except sqlite3.Error:
+            self.stats['errors'] += 1
+
+
+    def __len__(self):
+        return self.__connection().execute('SELECT COUNT(*) FROM expansion').fetchone()[0]
+
+
+    def close(self):
+        """
+        Salvataggio degli ultimi utilizzi e chiusura della connessione del thread corrente.
+
+        :param self
+        """
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            try:
+                with conn:
+                    self.__flushUsed(conn)
+            except sqlite3.Error:
+                self.stats['errors'] += 1
+            conn.close()
+            self.local.conn = None
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tabella dei sinonimi per il query expansion, calcolata offline sul vocabolario dell'indice
+(vedi 'buildExpansionTable.py'), così durante la ricerca non serve interrogare WordNet per
+ricavare i significati dei token e i loro sinonimi.
+
+La tabella contiene:
+    - 'senses': per ogni nome di WordNet (senza '_') gli id dei suoi significati, nello stesso
+                ordine di 'wn.synsets(nome, wn.NOUN)';
+    - 'lemmas': per ogni significato che ha almeno un sinonimo presente nell'indice, i suoi lemmi;
+    - 'df': per ogni termine che si può ottenere dai lemmi (minuscolo, separato su '_' e '-') e che
+            è presente nell'indice, la sua document frequency (max tra 'text' e 'title');
+    - iperonimi e profondità di ogni significato (vedi 'TableHypernyms'), usati per la
+      disambiguazione senza caricare WordNet.
+I sinonimi che non sono presenti nell'indice non vengono aggiunti alla query, dato che non
+cambiano i risultati e costano solo la lettura di una posting list vuota.
+"""
+
+import os
+import pickle
+import time
+
+from .queryExpansion import Disambiguator
+from .senseSimilarity import TableHypernyms, nltkCorpus, wordnet_lock
+
+
+class ExpansionTable():
+
+    # da incrementare se cambia il formato del file
+    version = 2
+
+    fields = ('text', 'title')
+
+    def __init__(self, state):
+        """
+        :param self
+        :param state: dict salvato con 'build()'
+        """
+        self.synset_names = state['synset_names']
+        self.synset_ids = {name: synset_id for synset_id, name in enumerate(self.synset_names)}
+        self.synset_objs = {}
+        self.senses = state['senses']
+        self.lemmas = state['lemmas']
+        self.df = state['df']
+        self.generation = state['generation']
+        self.created = state['created']
+        self.hypernyms = TableHypernyms(self.synset_names, self.synset_ids, state['min_depth'], state['max_depth'],
+                                        state['anc_indptr'], state['anc_ids'], state['anc_dist'])
+
+
+    @classmethod
+    def load(cls, path_file):
+        """
+        :param cls
+        :param path_file: file salvato con 'build()'
+        return ExpansionTable, None se il file non esiste o ha un formato diverso
+        """
+        if not os.path.exists(path_file):
+            return None
+
+        with open(path_file, 'rb') as fp:
+            state = pickle.load(fp)
+
+        if state.get('version') != ExpansionTable.version:
+            print('! Tabella di espansione con formato diverso, va ricreata: '+path_file)
+            return None
+        return cls(state)
+
+
+    @classmethod
+    def splitLemma(cls, lemma):
+        """
+        Termini ottenuti da un lemma di WordNet, come in 'Expander.expansion()'.
+
+        :param cls
+        :param lemma: lemma di WordNet (es: 'Roman_Empire')
+        return lista di termini
+        """
+        return lemma.lower().replace('_', ' ').replace('-', ' ').split()
+
+
+    @classmethod
+    def build(cls, path_file, reader):
+        """
+        Creazione della tabella: per ogni significato (nome) di WordNet ricavo i termini dei suoi
+        lemmi e controllo se sono presenti nel lessico dell'indice, analizzandoli con l'analyzer
+        del campo (es: stemming per 'text').
+
+        :param cls
+        :param path_file: file dove salvare la tabella
+        :param reader: reader dell'indice
+        return ExpansionTable
+        """
+        wn = nltkCorpus('wordnet')
+
+        analyzers = {field: reader.schema[field].analyzer for field in ExpansionTable.fields}
+
+        def docFrequency(term):
+            """
+            return document frequency del termine (0 se non presente nell'indice)
+            """
+            best = 0
+            for field, analyzer in analyzers.items():
+                tokens = [t.text for t in analyzer(term)]
+                if tokens:
+                    best = max(best, min(reader.doc_frequency(field, t) for t in tokens))
+            return best
+
+        synsets = []
+        synset_names = []
+        synset_ids = {}
+        lemmas = {}
+        df = {}
+        checked = set()
+
+        print('Significati e sinonimi presenti nell\'indice ...')
+        for synset in wn.all_synsets(wn.NOUN):
+            synset_id = len(synset_names)
+            synset_ids[synset.name()] = synset_id
+            synset_names.append(synset.name())
+            synsets.append(synset)
+
+            names = synset.lemma_names()
+            useful = False
+            for lemma in names:
+                for term in ExpansionTable.splitLemma(lemma):
+                    if len(term) <= 2:
+                        continue
+                    if term not in checked:
+                        checked.add(term)
+                        freq = docFrequency(term)
+                        if freq > 0:
+                            df[term] = freq
+                    useful = useful or term in df
+            if useful:
+                lemmas[synset_id] = tuple(names)
+
+        print('Significati dei nomi ...')
+        senses = {}
+        for name in wn.all_lemma_names(wn.NOUN):
+            if '_' not in name:
+                senses[name] = tuple(synset_ids[s.name()] for s in wn.synsets(name, wn.NOUN))
+
+        print('Iperonimi dei significati ...')
+        hypernyms = TableHypernyms.buildArrays(synsets, synset_ids)
+
+        state = {'version': ExpansionTable.version,
+                 'generation': reader.generation(),
+                 'created': time.time(),
+                 'synset_names': synset_names,
+                 'senses': senses,
+                 'lemmas': lemmas,
+                 'df': df,
+                 **hypernyms,
+                 }
+
+        path_tmp = path_file+'.'+str(os.getpid())+'.tmp'
+        with open(path_tmp, 'wb') as fp:
+            pickle.dump(state, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path_tmp, path_file)
+
+        print('Nomi : {}  |  significati con sinonimi : {}  |  termini presenti : {}'.
+              format(len(senses), len(lemmas), len(df)))
+        return cls(state)
+
+
+    def __synset(self, synset_id):
+        """
+        :param self
+        :param synset_id: id del significato nella tabella
+        return synset di WordNet (caricato una sola volta)
+        """
+        synset = self.synset_objs.get(synset_id)
+        if synset is None:
+            with wordnet_lock:
+                synset = self.synset_objs[synset_id] = nltkCorpus('wordnet').synset(self.synset_names[synset_id])
+        return synset
+
+
+    def synsets(self, term):
+        """
+        Significati (nomi) di un termine. I termini che non sono nella tabella (es: plurali, che
+        WordNet riconduce al singolare) vengono cercati in WordNet.
+
+        :param self
+        :param term: termine
+        return tuple dei synset del termine
+        """
+        ids = self.senses.get(term.lower())
+        if ids is None:
+            return Disambiguator.nounSynsets(term)
+        return tuple(self.__synset(synset_id) for synset_id in ids)
+
+
+    def senseNames(self, term):
+        """
+        Come 'synsets()', ma ritorna i nomi dei significati, senza caricare WordNet per i termini
+        presenti nella tabella.
+
+        :param self
+        :param term: termine
+        return tuple dei nomi dei synset del termine
+        """
+        ids = self.senses.get(term.lower())
+        if ids is None:
+            return tuple(s.name() for s in Disambiguator.nounSynsets(term))
+        return tuple(self.synset_names[synset_id] for synset_id in ids)
+
+
+    def hasRelatedTerms(self, term):
+        """
+        :param self
+        :param term: termine
+        return False se nessun significato del termine ha sinonimi presenti nell'indice
+        """
+        ids = self.senses.get(term.lower())
+        if ids is None:
+            return True
+        return any(synset_id in self.lemmas for synset_id in ids)
+
+
+    def lemmaNames(self, sense):
+        """
+        :param self
+        :param sense: synset o nome del synset
+        return lemmi del significato, lista vuota se nessuno è presente nell'indice
+        """
+        name = sense if isinstance(sense, str) else sense.name()
+        return list(self.lemmas.get(self.synset_ids.get(name), ()))
+
+
+    def __contains__(self, term):
+        return term in self.df
+
+
+    def docFrequency(self, term):
+        """
+        :param self
+        :param term: termine
+        return document frequency del termine nell'indice (0 se non presente)
+        """
+        return self.df.get(term, 0)
@@ -6,14 +6,18 @@ Created on Sat Sep 26 15:21:04 2020
 @author: gabrielesavoia
 """
 
-import nltk    
-from nltk.corpus import wordnet as wn  
-from nltk.wsd import lesk
+import functools
+
+# nltk (e WordNet) vengono importati solo quando servono: il solo 'import nltk' richiede alcuni 
+# secondi, che altrimenti verrebbero pagati da ogni processo anche senza query expansion
+
+from .senseSimilarity import WordNetHypernyms, WupDisambiguator, nltkCorpus, wordnet_lock
+from .. import instrumentation
 
 class Disambiguator():
 
     @classmethod
-    def leskDisambiguate(cls, tokens, index_term):
+    def leskDisambiguate(cls, tokens, index_term, synsets_fn=None):
         """
         DOC: https://www.nltk.org/_modules/nltk/wsd.html
              https://www.linkedin.com/pulse/wordnet-word-sense-disambiguation-wsd-nltk-aswathi-nambiar/
@@ -22,12 +26,18 @@ class Disambiguator():
 
         :param tokens: token della frase
         :param index_term: termine da disambiguare
+        :param synsets_fn: funzione che ritorna i significati di un termine (None per WordNet)
         return: significato del token disambiguato 
         """
-        return lesk(tokens, index_term, 'n')
+        from nltk.wsd import lesk
+
+        nltkCorpus('wordnet')
+        synsets = synsets_fn(index_term) if synsets_fn is not None else None
+        with wordnet_lock:
+            return lesk(tokens, index_term, 'n', synsets=synsets)
 
     @classmethod
-    def nounSenseDisambiguate(cls, tokens, index_term):
+    def nounSenseDisambiguate(cls, tokens, index_term, synsets_fn=None):
         """
         Avviene la disambiguazione in riferimento al token 'index_term' nell'insieme 'tokens'.
         
@@ -43,22 +53,28 @@ class Disambiguator():
         :param cls
         :param tokens: ovvero il testo tokenizzato
         :param index_term: termine da disambiguare
+        :param synsets_fn: funzione che ritorna i significati di un termine (None per WordNet)
         return: significato del token disambiguato
         """
         Tx = index_term
+        if synsets_fn is None:
+            synsets_fn = Disambiguator.nounSynsets
 
-        if len(wn.synsets(Tx, wn.NOUN)) == 0:  # se token non riconosciuto
+        senses_Tx = synsets_fn(Tx)
+        if len(senses_Tx) == 0:  # se token non riconosciuto
             return None
-        best_sense = wn.synsets(Tx, wn.NOUN)[0]
+
+        # i significati dei termini del contesto non dipendono da TxSi
+        senses_context = [synsets_fn(Ty) for Ty in tokens if Ty != Tx]
+
+        best_sense = senses_Tx[0]
         best_score = 0.0
-        for TxSi in wn.synsets(Tx, wn.NOUN):
+        for TxSi in senses_Tx:
             score_TxSi = 0.0            
-            for Ty in tokens:
-                if Ty==Tx:
-                    continue
+            for senses_Ty in senses_context:
                 max_score = 0.0   
-                for TySz in wn.synsets(Ty, wn.NOUN):
-                    tmp_score = TxSi.wup_similarity(TySz)
+                for TySz in senses_Ty:
+                    tmp_score = Disambiguator.senseSimilarity(TxSi, TySz)
                     if tmp_score > max_score:
                         max_score = tmp_score
                 score_TxSi += max_score
@@ -67,6 +83,34 @@ class Disambiguator():
                 best_sense = TxSi
         return best_sense
 
+    @staticmethod
+    @functools.lru_cache(maxsize=16384)
+    def nounSynsets(term):
+        """
+        Significati (nomi) di un termine, memorizzati per non interrogare WordNet più volte
+        per lo stesso termine (anche tra query diverse).
+
+        :param term: termine
+        return tuple dei synset del termine
+        """
+        wn = nltkCorpus('wordnet')
+
+        with wordnet_lock:
+            return tuple(wn.synsets(term, wn.NOUN))
+
+    @staticmethod
+    @functools.lru_cache(maxsize=262144)
+    def senseSimilarity(sense_a, sense_b):
+        """
+        Similarità di Wu-Palmer tra due significati, memorizzata.
+
+        :param sense_a: synset
+        :param sense_b: synset
+        return similarità (0 se non calcolabile)
+        """
+        with wordnet_lock:
+            return sense_a.wup_similarity(sense_b) or 0.0
+
 
 class Expander():
     """
@@ -78,7 +122,7 @@ class Expander():
                            }
 
 
-    def __init__(self, disambiguate_fn, n_per_token=4):
+    def __init__(self, disambiguate_fn, n_per_token=4, cache=None, table=None, max_pairs=5000, max_time=0.2):
         """
         Inizializzazione classe in cui specifico la funzione che voglio usare per la
         disambiguazione e il numero max di token estesi per ogni token.
@@ -86,10 +130,53 @@ class Expander():
         :param self
         :param disambiguate_fn: funzione usata per la disambiguazione
         :param n_per_token: numero di termini espansi per token
+        :param cache: ExpansionCache in cui salvare le espansioni (None per non salvarle)
+        :param table: ExpansionTable con significati e sinonimi precalcolati sul vocabolario
+                      dell'indice (None per usare solo WordNet)
+        :param max_pairs: per 'noun_sense', numero max di coppie di significati confrontate per query
+        :param max_time: per 'noun_sense', secondi max di disambiguazione per query
         """
+        self.disambiguate_name = disambiguate_fn
         self.disambiguate_fn = Expander.disambiguate_fn_map[disambiguate_fn]
         self.n_per_token = n_per_token
-        self.stopword = nltk.corpus.stopwords.words('english')
+        self.cache = cache
+        self.table = table
+
+        # 'noun_sense' calcola la similarità di tutte le coppie di significati della query insieme
+        self.wup = None
+        if disambiguate_fn == 'noun_sense':
+            hypernyms = table.hypernyms if table is not None else WordNetHypernyms()
+            self.wup = WupDisambiguator(hypernyms, max_pairs, max_time)
+
+        self.__stopword = None
+
+
+    @property
+    def stopword(self):
+        """
+        Stopword inglesi di nltk, caricate al primo utilizzo.
+
+        :param self
+        return frozenset delle stopword
+        """
+        if self.__stopword is None:
+            self.__stopword = frozenset(nltkCorpus('stopwords').words('english'))
+        return self.__stopword
+
+
+    def warmUp(self):
+        """
+        Caricamento anticipato delle risorse usate dall'espansione (nltk, stopword, tokenizer e
+        WordNet), così la prima query non ne paga il costo. WordNet serve anche con la tabella di
+        espansione, per i token che non sono nella tabella (es: plurali).
+
+        :param self
+        """
+        import nltk
+
+        self.stopword
+        nltk.word_tokenize('warm up')
+        nltkCorpus('wordnet')
 
 
     def stopwordRemove(self, tokens):
@@ -116,6 +203,8 @@ class Expander():
         return: termini pertinenti/relativi 
         """
         if best_sense is not None:
+            if self.table is not None:
+                return self.stopwordRemove(self.table.lemmaNames(best_sense))
             return self.stopwordRemove(best_sense.lemma_names())
         return []
 
@@ -130,17 +219,32 @@ class Expander():
         Per ogni sinonimo tolgo gli eventuali trattini (questo può portare al fatto che un singolo sinonimo
         abbia più token).
         Elimino inoltre i sinonimi che sono già presenti nella query.
+        Con la tabella di espansione elimino anche i sinonimi che non sono presenti nell'indice, e
+        non faccio la disambiguazione dei token che non hanno sinonimi presenti nell'indice.
         
         :param n: per ogni nome vengono salvati al più n sinonimi
         """
+        return self.__expansion(text)[0]
+
+    def __expansion(self, text):
+        """
+        :param self
+        :param text: testo da cui fare espansione
+        return: lista dei termini dell'espansione, False se la disambiguazione ha superato i limiti
+                di 'max_pairs' o 'max_time'
+        """
+        import nltk
+
         tokens = self.stopwordRemove(nltk.word_tokenize(text))
+        with instrumentation.timer('disambiguation_seconds'):
+            best_senses, complete = self.disambiguate(tokens)
+        if not complete:
+            instrumentation.count('disambiguation_over_budget_total')
 
         res=[]
-        for token in tokens:
+        for token, best_sense in zip(tokens, best_senses):
             n=0
 
-            best_sense = self.disambiguate_fn(tokens, token)
-
             related_terms = self.getRelatedTerms(best_sense)
 
             for related_term in related_terms:
@@ -152,10 +256,63 @@ class Expander():
                 splitted_term = related_term.split()
 
                 for term in splitted_term:  
+                    if self.table is not None and term not in self.table:
+                        continue
                     if term not in res and len(term)>2 and term.strip()!='':
                         if n<self.n_per_token:
                             res.append(term)
                             n+=1
+        return res, complete
+
+    def disambiguate(self, tokens):
+        """
+        Significato di ogni token. Con la tabella di espansione non vengono disambiguati i token
+        che non hanno sinonimi presenti nell'indice.
+
+        :param self
+        :param tokens: token della query (senza stopword)
+        return: lista dei significati (None se non disambiguato), False se sono stati superati i
+                limiti della disambiguazione
+        """
+        if self.table is not None:
+            targets = [i for i, token in enumerate(tokens) if self.table.hasRelatedTerms(token)]
+        else:
+            targets = range(len(tokens))
+
+        if self.wup is not None:
+            if self.table is not None:
+                senses = [self.table.senseNames(token) for token in tokens]
+            else:
+                senses = [Disambiguator.nounSynsets(token) for token in tokens]
+            return self.wup.disambiguate(tokens, senses, targets)
+
+        best_senses = [None] * len(tokens)
+        synsets_fn = self.table.synsets if self.table is not None else None
+        for i in targets:
+            best_senses[i] = self.disambiguate_fn(tokens, tokens[i], synsets_fn)
+        return best_senses, True
+
+    def cachedExpansion(self, text):
+        """
+        Come 'expansion()', ma il risultato viene preso dalla cache se presente.
+        La chiave dipende anche dalla funzione di disambiguazione e da n_per_token.
+        Le espansioni calcolate superando i limiti della disambiguazione non vengono salvate.
+
+        :param self
+        :param text: testo da cui fare espansione
+        return: lista dei termini dell'espansione
+        """
+        if self.cache is None:
+            return self.expansion(text)
+
+        table_id = self.table.created if self.table is not None else None
+        key = (self.disambiguate_name, self.n_per_token, table_id, ' '.join(text.split()))
+        res = self.cache.get(key)
+        instrumentation.count('expansion_cache_total', result='miss' if res is None else 'hit')
+        if res is None:
+            res, complete = self.__expansion(text)
+            if complete:
+                self.cache.put(key, res)
         return res
 
     def __call__(self, text):
@@ -168,7 +325,8 @@ class Expander():
         :param text: testo da cui fare espansione
         return: testo espanso in cui ho imposto regole sintattiche
         """
-        list_token_expanded = self.expansion(text)
+        with instrumentation.timer('expansion_seconds'):
+            list_token_expanded = self.cachedExpansion(text)
         token_exp_sequence = ' OR '.join(list_token_expanded)
         expandend = ' OR ( '+token_exp_sequence+' )^0.5'
         return ('( '+text+' )'+expandend, list_token_expanded)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache dei risultati delle ricerche (LRU con scadenza), usata da 'WikiIndex.query'.
+
+La chiave è composta dal testo della query normalizzato e da tutti i parametri della ricerca
+(con i valori di default di 'WikiSearcher.search' per quelli non specificati), quindi due richieste
+con gli stessi parametri espliciti o impliciti usano lo stesso risultato.
+I risultati dipendono dalla generazione dell'indice: quando cambia, la cache viene svuotata.
+"""
+
+from collections import OrderedDict
+import copy
+import inspect
+import threading
+import time
+import unicodedata
+
+from .searcher import WikiSearcher
+
+
+# valori di default dei parametri di 'WikiSearcher.search'
+DEFAULT_SETTINGS = {name: param.default
+                    for name, param in inspect.signature(WikiSearcher.search).parameters.items()
+                    if param.default is not inspect.Parameter.empty}
+
+
+def normalizeText(text):
+    """
+    Normalizzazione del testo della query: forma unicode NFC e spazi consecutivi ridotti ad uno.
+    Il testo non viene convertito in minuscolo perchè gli operatori del parser ('AND', 'OR', ..)
+    e le stopword dell'espansione distinguono maiuscole e minuscole.
+
+    :param text: testo della query
+    return testo normalizzato
+    """
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def normalizeSettings(settings):
+    """
+    Parametri della ricerca completi dei valori di default e convertiti nel tipo usato dalla
+    ricerca, con weighting e group non validi sostituiti come in 'WikiSearcher.search'.
+
+    :param settings: parametri della ricerca
+    return tuple ordinata di (nome, valore)
+    """
+    full = dict(DEFAULT_SETTINGS, **settings)
+
+    full['limit'] = int(full['limit'])
+    full['exp'] = bool(full['exp'])
+    full['page_rank'] = bool(full['page_rank'])
+    full['text_boost'] = float(full['text_boost'])
+    full['title_boost'] = float(full['title_boost'])
+    full['highlight'] = bool(full['highlight'])
+    if full['weighting'] not in WikiSearcher.weighting:
+        full['weighting'] = 'BM25F'
+    if full['group'] not in WikiSearcher.group:
+        full['group'] = 'AND'
+
+    return tuple(sorted(full.items()))
+
+
+class ResultCache():
+    """
+    Cache LRU dei risultati con scadenza ('ttl' secondi) e contatori di hit/miss.
+    Può essere usata da più thread contemporaneamente.
+    """
+
+    def __init__(self, max_size=1024, ttl=300.0):
+        """
+        :param self
+        :param max_size: numero max di risultati salvati (0 per disabilitare la cache)
+        :param ttl: secondi dopo i quali un risultato scade (None per nessuna scadenza)
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+        self.generation = None
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0, 'invalidations': 0}
+
+
+    @classmethod
+    def getKey(cls, text, settings):
+        """
+        :param cls
+        :param text: testo della query
+        :param settings: parametri della ricerca
+        return chiave della cache
+        """
+        return (normalizeText(text), normalizeSettings(settings))
+
+
+    def __checkGeneration(self, generation):
+        """
+        Se la generazione dell'indice è cambiata svuoto la cache. Da chiamare con il lock acquisito.
+
+        :param self
+        :param generation: generazione corrente dell'indice
+        """
+        if generation != self.generation:
+            if self.items:
+                self.stats['invalidations'] += 1
+            self.items.clear()
+            self.generation = generation
+
+
+    def get(self, key, generation):
+        """
+        :param self
+        :param key: chiave (vedi 'getKey()')
+        :param generation: generazione corrente dell'indice
+        return copia del risultato salvato, None se non presente o scaduto
+        """
+        with self.lock:
+            self.__checkGeneration(generation)
+
+            item = self.items.get(key)
+            if item is not None and self.ttl is not None and time.monotonic() - item[0] > self.ttl:
+                del self.items[key]
+                self.stats['expired'] += 1
+                item = None
+
+            if item is None:
+                self.stats['misses'] += 1
+                return None
+
+            self.items.move_to_end(key)
+            self.stats['hits'] += 1
+            result = item[1]
+
+        return copy.deepcopy(result)
+
+
+    def put(self, key, generation, result):
+        """
+        Salvataggio di un risultato. Se la cache è piena viene eliminato il risultato usato meno
+        di recente.
+
+        :param self
+        :param key: chiave (vedi 'getKey()')
+        :param generation: generazione dell'indice su cui è stata eseguita la ricerca
+        :param result: risultato della ricerca
+        """
+        if self.max_size <= 0:
+            return
+
+        result = copy.deepcopy(result)
+        with self.lock:
+            # risultato di una ricerca iniziata prima del cambio di generazione
+            if self.generation is not None and generation < self.generation:
+                return
+            self.__checkGeneration(generation)
+
+            self.items[key] = (time.monotonic(), result)
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+                self.stats['evictions'] += 1
+
+
+    def clear(self):
+        """
+        :param self
+        """
+        with self.lock:
+            self.items.clear()
+
+
+    def getInfo(self):
+        """
+        :param self
+        return dict con i contatori, il numero di risultati salvati e l'hit rate
+        """
+        with self.lock:
+            info = dict(self.stats, size=len(self.items), max_size=self.max_size)
+
+        requests = info['hits'] + info['misses']
+        info['hit_rate'] = info['hits'] / requests if requests else 0.0
+        return info
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Esecuzione di più ricerche in parallelo sullo stesso indice.
+
+    - 'thread':  le ricerche sono eseguite da un pool di thread sullo stesso WikiIndex (ogni thread
+                 ha il proprio reader, vedi 'WikiSearcher'). La ricerca è quasi tutta codice python,
+                 quindi per il GIL i thread sono utili solo se le ricerche attendono I/O.
+    - 'process': ogni processo worker apre l'indice una sola volta (in '_initWorker') ed esegue
+                 le ricerche in modo indipendente dagli altri. I file dell'indice e la table del
+                 pagerank sono in mmap, quindi la memoria è condivisa tra i processi.
+                 Ogni processo ha la propria cache dei risultati, i cui contatori vengono copiati
+                 dopo ogni ricerca in un array condiviso (vedi 'SearchPool.getCacheInfo()').
+"""
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+
+from .. import index
+
+
+# contatori della cache dei risultati copiati da ogni processo worker nell'array condiviso
+CACHE_FIELDS = ('hits', 'misses', 'evictions', 'expired', 'invalidations', 'size', 'max_size')
+
+
+# WikiIndex del processo worker, aperto una sola volta in '_initWorker'
+_wiki_index = None
+
+# array condiviso dei contatori della cache e posizione del processo worker
+_cache_stats = None
+_cache_offset = None
+
+
+def _initWorker(args_paths, cache_stats=None, n_started=None):
+    """
+    Inizializzazione del processo worker: apertura dell'indice e assegnazione della posizione
+    nell'array dei contatori della cache.
+
+    :param args_paths: path dell'indice e del pagerank
+    :param cache_stats: array condiviso dei contatori della cache (len(CACHE_FIELDS) per worker)
+    :param n_started: contatore condiviso dei worker avviati
+    """
+    global _wiki_index, _cache_stats, _cache_offset
+    _wiki_index = index.WikiIndex(args_paths)
+    _wiki_index.open()
+
+    if cache_stats is not None:
+        with n_started.get_lock():
+            slot = n_started.value
+            n_started.value += 1
+        if (slot+1) * len(CACHE_FIELDS) <= len(cache_stats):
+            _cache_stats = cache_stats
+            _cache_offset = slot * len(CACHE_FIELDS)
+
+
+def _search(text, settings):
+    """
+    Ricerca eseguita nel processo worker.
+
+    :param text: testo della query
+    :param settings: parametri della ricerca (vedi 'WikiSearcher.search')
+    return dict con i risultati
+    """
+    res = _wiki_index.query(text, **settings)
+
+    if _cache_stats is not None:
+        info = _wiki_index.getCacheInfo()
+        for i, field in enumerate(CACHE_FIELDS):
+            _cache_stats[_cache_offset+i] = info[field]
+
+    return res
+
+
+class SearchPool():
+    """
+    Pool di thread o di processi per eseguire le ricerche in parallelo.
+    """
+
+    modes = ('thread', 'process')
+
+    def __init__(self, args_paths, n_workers, mode='process', wiki_index=None):
+        """
+        Creazione del pool.
+
+        :param self
+        :param args_paths: path dell'indice e del pagerank (usati dai processi worker)
+        :param n_workers: numero di thread o processi
+        :param mode: 'thread' o 'process'
+        :param wiki_index: WikiIndex già aperto usato dai thread (se None viene aperto)
+        """
+        if mode not in SearchPool.modes:
+            raise ValueError('Modalità non valida: '+str(mode))
+
+        self.mode = mode
+        self.wiki_index = None
+        self.cache_stats = None
+
+        if mode == 'thread':
+            self.wiki_index = wiki_index
+            if self.wiki_index is None:
+                self.wiki_index = index.WikiIndex(args_paths)
+                self.wiki_index.open()
+            self.executor = ThreadPoolExecutor(n_workers)
+        else:
+            self.cache_stats = multiprocessing.Array('q', n_workers * len(CACHE_FIELDS), lock=False)
+            self.n_started = multiprocessing.Value('i', 0)
+            self.executor = ProcessPoolExecutor(n_workers, initializer=_initWorker, 
+                                                initargs=(args_paths, self.cache_stats, self.n_started))
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+    def submit(self, text, **settings):
+        """
+        Invio di una ricerca al pool.
+
+        :param self
+        :param text: testo della query
+        :param settings: parametri della ricerca (vedi 'WikiSearcher.search')
+        return Future con il dict dei risultati
+        """
+        if self.mode == 'thread':
+            return self.executor.submit(self.wiki_index.query, text, **settings)
+        return self.executor.submit(_search, text, settings)
+
+
+    def map(self, texts, **settings):
+        """
+        Esecuzione di più ricerche con gli stessi parametri.
+
+        :param self
+        :param texts: testi delle query
+        :param settings: parametri della ricerca
+        return lista dei risultati, nello stesso ordine delle query
+        """
+        futures = [self.submit(text, **settings) for text in texts]
+        return [future.result() for future in futures]
+
+
+    def getCacheInfo(self):
+        """
+        Contatori della cache dei risultati (vedi 'ResultCache.getInfo()'). In modalità 'process'
+        sono la somma dei contatori di tutti i worker, aggiornati alla loro ultima ricerca.
+
+        :param self
+        return dict con le info della cache
+        """
+        if self.mode == 'thread':
+            return self.wiki_index.getCacheInfo()
+
+        stats = list(self.cache_stats)
+        info = {field: sum(stats[i::len(CACHE_FIELDS)]) for i, field in enumerate(CACHE_FIELDS)}
+
+        requests = info['hits'] + info['misses']
+        info['hit_rate'] = info['hits'] / requests if requests else 0.0
+        info['workers'] = self.n_started.value
+        return info
+
+
+    def close(self):
+        """
+        Attendo le ricerche in corso e chiudo il pool.
+
+        :param self
+        """
+        self.executor.shutdown(wait=True)
@@ -10,7 +10,58 @@ from whoosh.qparser import MultifieldParser
 from whoosh.searching import Searcher as WhooshSearcher
 from whoosh import scoring, qparser
 
+import threading
+import time
+import weakref
+
 from .queryExpansion import Expander
+from .. import instrumentation
+from . import staticPrior
+from .staticPrior import StaticPriorWeighting
+
+
+class ReaderState():
+    """
+    Stato di un thread che esegue ricerche: reader, table del pagerank allineata ai suoi docnum e
+    searcher dei weighting (vedi 'WikiSearcher.getSearcher()').
+    L'unico riferimento forte è nel threading.local del thread, quindi quando il thread termina lo
+    stato viene eliminato e il reader chiuso ('finalizer').
+    """
+
+    def __init__(self):
+        self.reader = None
+        self.doc_ranks = None
+        self.searchers = {}
+        self.finalizer = None
+        self.busy = False           # True durante una ricerca: il reader non può essere chiuso da altri thread
+
+
+    def setReader(self, reader, doc_ranks):
+        """
+        Sostituzione del reader (quello precedente viene chiuso).
+
+        :param self
+        :param reader: nuovo reader
+        :param doc_ranks: table del pagerank allineata ai docnum del reader
+        """
+        self.closeReader()
+        self.reader = reader
+        self.doc_ranks = doc_ranks
+        self.finalizer = weakref.finalize(self, reader.close)
+
+
+    def closeReader(self):
+        """
+        Chiusura del reader (se presente) e dei searcher che lo usano.
+
+        :param self
+        """
+        if self.finalizer is not None:
+            self.finalizer()
+        self.reader = None
+        self.doc_ranks = None
+        self.searchers = {}
+        self.finalizer = None
 
 
 class WikiSearcher:
@@ -25,13 +76,15 @@ class WikiSearcher:
             }
 
     base_url = 'https://en.wikipedia.org/wiki/'
+
+    refresh_interval = 5.0      # secondi tra due controlli di una nuova generazione dell'indice
+
+    stages = ('expand', 'parse', 'pagerank', 'search', 'highlight', 'docs')     # fasi misurate in 'search()'
     
-    def __init__(self, index, page_ranker):
+    def __init__(self, index, page_ranker, expander=None):
         """
-        Creazione del QueryParser relativo al testo della query.
-        Aggiungo il plugin 'MultifieldPlugin' al 'QueryParser' perchè mi permette poi nella funzione di 
-        'search' di poter modificare il filed boost (cosa che non siamo riusciti a fare se avessimo
-        definito direttamente un 'MultifieldParser').
+        La configurazione del QueryParser relativo al testo della query dipende dai parametri 
+        della ricerca, quindi il parser viene creato ad ogni ricerca (vedi 'getParser()').
 
         - MULTIFIELD così effettuo ricerca sia nel titolo che nel testo.
                     Il parser utilizza l'analizzatore definito nell'index, riferito al field corrispondente.
@@ -43,33 +96,192 @@ class WikiSearcher:
         - GROUP default concatena i token con 'AND'. Specificando 'OrGroup' concatena con OR.
                 Utilizzando il FACTORY, do un punteggio maggiore ai documenti in cui un certo termine
                 ha una frequenza più alta. Senza FACTORY non ho questo effetto.     
+
+        - READER uno per thread, condiviso dai searcher di tutti i weighting (vedi 'getSearcher()').
+                 I reader di whoosh leggono le posting list con seek/read su file condivisi, quindi 
+                 non possono essere usati da più thread contemporaneamente. I file dell'indice e la
+                 table del pagerank sono in mmap, quindi la memoria è comunque condivisa.
+                 Il reader viene chiuso quando il thread termina, oppure da 'refresh()' se il thread
+                 non sta eseguendo una ricerca e l'indice ha una nuova generazione (vedi 'ReaderState').
+
+        - EXPANDER Expander usato per il query expansion (con eventuale cache e tabella di espansione),
+                   se None viene usato il 'noun_sense' con WordNet.
+
+        La 'search()' non modifica lo stato condiviso del WikiSearcher, quindi può essere chiamata
+        da più thread contemporaneamente (vedi 'searchPool').
         """
         self.index = index
 
         self.page_ranker = page_ranker
 
-        self.expand = Expander(disambiguate_fn='noun_sense')
+        self.expand = expander if expander is not None else Expander(disambiguate_fn='noun_sense')
 
-        self.parser = qparser.QueryParser(None, index.schema)
-        self.multifield_plugin = qparser.MultifieldPlugin(['text', 'title'])
-        self.parser.add_plugin(self.multifield_plugin)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.states = weakref.WeakSet()
+        self.generation = self.index.latest_generation()
+        self.last_refresh = time.time()
+
+
+    def __local(self, busy=False):
+        """
+        Stato del thread corrente (vedi 'ReaderState'). Il reader viene (ri)aperto se il thread 
+        non ne ha ancora uno o se l'indice ha una generazione più recente (vedi 'refresh()'); il 
+        reader precedente viene chiuso.
+
+        :param self
+        :param busy: True per segnare il thread come impegnato in una ricerca (vedi '__release()')
+        return ReaderState del thread corrente
+        """
+        state = getattr(self.local, 'state', None)
+        if state is None:
+            state = self.local.state = ReaderState()
+            with self.lock:
+                self.states.add(state)
+
+        with self.lock:
+            if busy:
+                state.busy = True
+            stale = state.reader is None or state.reader.generation() < self.generation
+
+        if stale:
+            new_reader = self.index.reader()
+
+            with self.lock:
+                state.setReader(new_reader, self.page_ranker.getDocTable(new_reader))
+
+        return state
+
+
+    def __release(self, state):
+        """
+        Fine della ricerca del thread: il suo reader può essere chiuso da 'refresh()'.
+
+        :param self
+        :param state: ReaderState del thread
+        """
+        with self.lock:
+            state.busy = False
+
+
+    def getSearcher(self, weighting='BM25F', page_rank=False):
+        """
+        Searcher con il weighting richiesto sul reader del thread corrente. Viene creato una sola 
+        volta per ogni weighting (e per la ricerca con o senza pagerank), quindi cambiare weighting
+        tra una ricerca e l'altra non apre un nuovo reader.
+        Il searcher con pagerank combina lo score del weighting con il prior statico del pagerank 
+        (vedi 'StaticPriorWeighting').
+
+        :param self
+        :param weighting: nome del weighting (BM25F se non valido)
+        :param page_rank: boolean se il searcher deve usare il pagerank
+        return WhooshSearcher
+        """
+        if weighting not in WikiSearcher.weighting:
+            weighting = 'BM25F'
+
+        local = self.__local()
+        searcher = local.searchers.get((weighting, page_rank))
+        if searcher is None:
+            model = WikiSearcher.weighting[weighting]()
+            if page_rank:
+                model = StaticPriorWeighting(model, local.doc_ranks.getPrior())
+
+            searcher = WhooshSearcher(reader=local.reader, weighting=model, closereader=False)
+            local.searchers[(weighting, page_rank)] = searcher
+
+        return searcher
+
+
+    def getParser(self, group='AND', text_boost=1.0, title_boost=1.0):
+        """
+        Creazione del QueryParser per la ricerca corrente.
+        Aggiungo il plugin 'MultifieldPlugin' al 'QueryParser' perchè mi permette di impostare 
+        il field boost (cosa che non siamo riusciti a fare se avessimo definito direttamente un 
+        'MultifieldParser').
+
+        :param self
+        :param group: come vengono concatenati i token della query
+        :param text_boost: boosting del campo testo
+        :param title_boost: boosting del campo titolo
+        return QueryParser
+        """
+        parser = qparser.QueryParser(None, self.index.schema, 
+                                     group=WikiSearcher.group.get(group, qparser.AndGroup))
+        parser.add_plugin(qparser.MultifieldPlugin(['text', 'title'], 
+                                                   fieldboosts={'text': text_boost, 'title': title_boost}))
+        return parser
+
+
+    def refresh(self, force=False):
+        """
+        Se l'indice su disco ha una generazione più recente (es: dopo un aggiornamento con 
+        'updateIndex.py'), ogni thread aprirà un nuovo reader alla sua prossima ricerca. I reader
+        precedenti dei thread che non stanno eseguendo una ricerca vengono chiusi subito, gli altri
+        alla fine della ricerca in corso. Il controllo viene fatto al più ogni 'refresh_interval' secondi.
+
+        :param self
+        :param force: True per controllare subito la generazione dell'indice
+        return True se c'è una nuova generazione dell'indice
+        """
+        if not force and time.time() - self.last_refresh < WikiSearcher.refresh_interval:
+            return False
+        self.last_refresh = time.time()
+
+        generation = self.index.latest_generation()
+        if generation == self.generation:
+            return False
+
+        # i reader della generazione precedente dei thread che non stanno cercando vengono chiusi
+        # subito, senza aspettare la loro prossima ricerca
+        with self.lock:
+            self.generation = generation
+            for state in list(self.states):
+                if not state.busy and state.reader is not None and state.reader.generation() < generation:
+                    state.closeReader()
+        return True
+
+
+    def warmUp(self):
+        """
+        Caricamento anticipato delle risorse usate dalla prima ricerca: table del pagerank allineata
+        ai docnum (creata se non esiste) con il suo prior, e risorse del query expansion.
+        Viene usato un reader temporaneo, dato che i reader sono legati al thread che li apre.
+
+        :param self
+        """
+        with self.index.reader() as reader:
+            with self.lock:
+                doc_ranks = self.page_ranker.getDocTable(reader)
+            doc_ranks.getPrior()
+
+        self.expand.warmUp()
+
+
+    def close(self):
+        """
+        Chiusura dei reader aperti da tutti i thread.
+
+        :param self
+        """
+        with self.lock:
+            for state in list(self.states):
+                state.closeReader()
+        self.local = threading.local()
 
-        self.weighting = 'BM25F'
-        self.searcher = WhooshSearcher(reader=self.index.reader(), weighting=WikiSearcher.weighting[self.weighting])
-        
     
     def search(self, text, limit=10, exp=True, page_rank=True, text_boost=1.0, title_boost=1.0,
-                weighting='BM25F', group='AND'):
+                weighting='BM25F', group='AND', highlight=True):
         """
         Funzione che esegue la ricerca con i parametri passati in input.
         Se il pagerank è specificato, lo score finale del documento viene calcolato sia in funzione
-        dello score fornito dalla ricerca che al valore di pagerank.
+        dello score fornito dalla ricerca che al valore di pagerank, durante la ricerca: i documenti
+        ritornati sono i primi 'limit' per score finale.
 
-        Per prima cosa avviene la fase di settaggio del parser e del weighting con i valori passati in 
-        input.
+        Per prima cosa viene creato il parser con i valori passati in input.
         Dopo di chè avviene il query expansion.
-        Poi, avviene il parsing del testo, che viene passato al searcher che ottiene 
-        i documenti rilevanti.
+        Poi, avviene il parsing del testo, che viene passato al searcher (del thread corrente) con 
+        il weighting richiesto che ottiene i documenti rilevanti.
 
         :param self
         :param text: testo che verrà convertito in query dal parser
@@ -80,66 +292,97 @@ class WikiSearcher:
         :param title_boost: boosting del campo titolo
         :param weighting: metodo di weighting
         :param group: come vengono concatenati i token della query
+        :param highlight: boolean se calcolare o meno gli highlights dei documenti (es: non servono
+                          nell'evaluation)
 
-        return dict con i risultati.
+        return dict con i risultati. In 'timings' ci sono i secondi di ogni fase della ricerca:
+               'expand', 'parse', 'pagerank' (searcher e prior del thread), 'search' (whoosh, 
+               compreso il pagerank durante la ricerca), 'highlight' e 'docs' (dati dei risultati).
         """
-        self.multifield_plugin.boosts = {'text': text_boost, 'title': title_boost}
-        self.parser.group = WikiSearcher.group.get(group, 'AND')
+        timings = dict.fromkeys(WikiSearcher.stages, 0.0)
+        start = time.perf_counter()
+
+        parser = self.getParser(group, text_boost, title_boost)
 
         text, list_token_expanded = self.expand(text) if exp else (text, None)
-        query = self.parser.parse(text)
-        
-        if weighting != self.weighting:
-            print('Imposto il searcher con il weighting : '+weighting+' Può impiegare tempo ...')
-            self.searcher = WhooshSearcher(reader=self.index.reader(), 
-                                           weighting=WikiSearcher.weighting.get(weighting, 'BM25F'))
-            self.weighting = weighting
-            print('Weighting impostato correttamente')
+        timings['expand'], start = WikiSearcher.__lap(start)
+
+        query = parser.parse(text)
+        timings['parse'], start = WikiSearcher.__lap(start)
 
         #print('Query : '+str(query))
 
-        res = {}
-        results = self.searcher.search(query, limit=limit)
+        self.refresh()
+        state = self.__local(busy=True)
+        try:
+            searcher = self.getSearcher(weighting, page_rank)
+            prior = state.doc_ranks.getPrior() if page_rank else None
+            timings['pagerank'], start = WikiSearcher.__lap(start)
 
-        res['time_second'] = results.runtime 
-        res['expanded'] = list_token_expanded if exp else []
-        res['n_res'] = results.estimated_length()
+            res = {}
+            if page_rank:
+                results = staticPrior.search(searcher, query, limit=limit)
+            else:
+                results = searcher.search(query, limit=limit)
+
+            res['time_second'] = results.runtime 
+            res['expanded'] = list_token_expanded if exp else []
+            res['n_res'] = results.estimated_length()
+            timings['search'], start = WikiSearcher.__lap(start)
+
+            res['docs'] = [self.__resultDoc(result, prior, highlight, timings) for result in results]
+            timings['docs'] = time.perf_counter() - start - timings['highlight']
+        finally:
+            self.__release(state)
 
-        final_score_fn, values_page_rank = self.__combinedScore(page_rank, results)
-        if page_rank:
-            results = sorted(results, key=final_score_fn, reverse=True)   
+        res['timings'] = timings
 
-        res['docs'] = [{'link': WikiSearcher.base_url+result['title'].replace(" ", "_"),
-                        'title': result['title'], 
-                        'highlight': result.highlights("text", top=2),
-                        'final_score': final_score_fn(result),
-                        'score': result.score,
-                        'page_rank': values_page_rank.get(result['id_page'], -1)
-                        } for result in results]
+        if instrumentation.enabled():
+            instrumentation.count('search_queries_total', exp=exp, page_rank=page_rank)
+            for stage, seconds in timings.items():
+                instrumentation.observe('search_stage_seconds', seconds, stage=stage)
 
         return res
 
 
-    def __combinedScore(self, page_rank, results):
+    @staticmethod
+    def __lap(start):
         """
-        Ritorna il riferimento alla funzione usata per il calcolo dello score finale combinato con 
-        il valore di pagerank. In questa funzione ricavo, tramite il 'getRank' del 'pageRanker', 
-        i valori di pagerank che ho calcolato in precedenza.
-
-        :param self
-        :param page_rank: boolean per capire se serve usare il pagerank per la query corrente
-        :param results: risultati della query 
+        :param start: istante di inizio della fase (time.perf_counter())
+        return secondi trascorsi, istante di inizio della fase successiva
         """
-        values_page_rank = {}
-        if page_rank:
-            values_page_rank = self.page_ranker.getRank([res['id_page'] for res in results], 5)
+        now = time.perf_counter()
+        return now - start, now
 
-        def final_score_fn(result):
-            if page_rank:
-                return result.score * values_page_rank.get(result['id_page'], 1)
-            return result.score
 
-        return final_score_fn, values_page_rank
+    def __resultDoc(self, result, prior, highlight=True, timings=None):
+        """
+        Dict con i dati del risultato. Se il pagerank è abilitato lo score del risultato è già 
+        quello finale, e lo score del weighting si ricava dividendo per il prior del documento.
+
+        :param self
+        :param result: risultato della query (whoosh Hit)
+        :param prior: array del prior dei docnum, None se il pagerank non è abilitato
+        :param highlight: False per non calcolare gli highlights (stringa vuota)
+        :param timings: dict dei tempi della ricerca, a cui viene sommato il tempo degli highlights
+        return dict del risultato
+        """
+        doc_prior = float(prior[result.docnum]) if prior is not None else 1.0
+
+        highlights = ''
+        if highlight:
+            start = time.perf_counter()
+            highlights = result.highlights("text", top=2)
+            if timings is not None:
+                timings['highlight'] += time.perf_counter() - start
+
+        return {'link': WikiSearcher.base_url+result['title'].replace(" ", "_"),
+                'title': result['title'], 
+                'highlight': highlights,
+                'final_score': result.score,
+                'score': result.score / doc_prior,
+                'page_rank': round(doc_prior, 5) if prior is not None else -1
+                }
 
 
     def getFieldInfo(self, field):
@@ -150,7 +393,11 @@ class WikiSearcher:
         :param field: field di cui voglio le informazioni
         return dict con le info del field specificato
         """
-        return {'length': self.searcher.field_length(field)}
+        state = self.__local(busy=True)
+        try:
+            return {'length': self.getSearcher().field_length(field)}
+        finally:
+            self.__release(state)
 
 
     def getGeneralInfo(self):
@@ -161,4 +408,4 @@ class WikiSearcher:
         :param self:
         return dict con le info
         """
-        return {'doc_count': self.searcher.doc_count()}
\ No newline at end of file
+        return {'doc_count': self.getSearcher().doc_count()}
\ No newline at end of file
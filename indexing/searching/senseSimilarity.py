@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+DOCS : https://www.nltk.org/_modules/nltk/corpus/reader/wordnet.html (Synset.wup_similarity)
+
+Disambiguazione dei nomi della query (stesso algoritmo di 'Disambiguator.nounSenseDisambiguate')
+con la similarità di Wu-Palmer calcolata con NumPy per tutte le coppie di significati della query,
+invece che con una chiamata a 'wup_similarity' per ogni coppia.
+
+Per ogni significato servono gli iperonimi (con la distanza minima) e la profondità min/max, che
+vengono calcolati da WordNet la prima volta che servono ('WordNetHypernyms') oppure letti dagli array
+precalcolati nella tabella di espansione ('TableHypernyms').
+"""
+
+from collections import deque
+import threading
+import time
+
+import numpy as np
+
+
+# Il reader di WordNet di nltk non è thread-safe: il LazyCorpusLoader si sostituisce con il corpus
+# alla prima chiamata (AttributeError '_LazyCorpusLoader__args') e i synset vengono letti dal file
+# dei dati con seek + readline sullo stesso file aperto, quindi due thread che leggono insieme un
+# synset possono leggerne uno sbagliato. Ogni accesso a WordNet che può leggere dal file (synset,
+# iperonimi, profondità, similarità) avviene con questo lock (es: warm up in background e prima
+# ricerca, oppure i thread di 'SearchPool').
+wordnet_lock = threading.RLock()
+
+# corpus di nltk già caricati (vedi 'nltkCorpus()')
+_corpora = {}
+
+
+def nltkCorpus(name):
+    """
+    Corpus di nltk (es: 'wordnet', 'stopwords') caricato al primo utilizzo, una sola volta anche se
+    più thread lo richiedono insieme (vedi 'wordnet_lock').
+
+    :param name: nome del corpus in 'nltk.corpus'
+    return corpus caricato
+    """
+    corpus = _corpora.get(name)
+    if corpus is None:
+        with wordnet_lock:
+            corpus = _corpora.get(name)
+            if corpus is None:
+                import nltk.corpus
+                corpus = getattr(nltk.corpus, name)
+                corpus.ensure_loaded()
+                _corpora[name] = corpus
+    return corpus
+
+
+def hypernymDistances(synset):
+    """
+    Distanza minima del synset da ogni suo iperonimo (anche 'instance'), lui compreso,
+    come in 'Synset._shortest_hypernym_paths()' di nltk.
+
+    :param synset: synset di WordNet
+    return dict synset -> distanza
+    """
+    queue = deque([(synset, 0)])
+    path = {}
+    while queue:
+        s, depth = queue.popleft()
+        if s in path:
+            continue
+        path[s] = depth
+        for hyp in s.hypernyms() + s.instance_hypernyms():
+            queue.append((hyp, depth+1))
+    return path
+
+
+class WordNetHypernyms():
+    """
+    Iperonimi e profondità dei significati letti da WordNet e memorizzati, con una chiave intera
+    assegnata ad ogni significato la prima volta che viene usato.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = {}
+        self.names = []
+        self.synsets = []
+        self.min_depth = []
+        self.max_depth = []
+        self.ancestors_cache = {}
+
+
+    def key(self, sense):
+        """
+        :param self
+        :param sense: synset o nome del synset
+        return chiave del significato
+        """
+        name = sense if isinstance(sense, str) else sense.name()
+        key = self.ids.get(name)
+        if key is None:
+            with wordnet_lock:
+                if isinstance(sense, str):
+                    synset = nltkCorpus('wordnet').synset(name)
+                else:
+                    synset = sense
+                min_depth, max_depth = synset.min_depth(), synset.max_depth()
+            with self.lock:
+                key = self.ids.get(name)
+                if key is None:
+                    key = len(self.names)
+                    self.names.append(name)
+                    self.synsets.append(synset)
+                    self.min_depth.append(min_depth)
+                    self.max_depth.append(max_depth)
+                    self.ids[name] = key
+        return key
+
+
+    def ancestors(self, key):
+        """
+        :param self
+        :param key: chiave del significato
+        return array delle chiavi degli iperonimi (lui compreso), array delle distanze
+        """
+        res = self.ancestors_cache.get(key)
+        if res is None:
+            with wordnet_lock:
+                path = hypernymDistances(self.synsets[key])
+            res = (np.array([self.key(s) for s in path], dtype=np.int64),
+                   np.array(list(path.values()), dtype=np.float32))
+            self.ancestors_cache[key] = res
+        return res
+
+
+    def depths(self, keys):
+        """
+        :param self
+        :param keys: array di chiavi
+        return array delle profondità min, array delle profondità max
+        """
+        return (np.array([self.min_depth[k] for k in keys], dtype=np.int64),
+                np.array([self.max_depth[k] for k in keys], dtype=np.int64))
+
+
+    def name(self, key):
+        return self.names[key]
+
+
+class TableHypernyms():
+    """
+    Iperonimi e profondità di tutti i nomi di WordNet precalcolati (vedi 'ExpansionTable.build()'):
+    gli iperonimi del significato i sono anc_ids[anc_indptr[i]:anc_indptr[i+1]], con le distanze
+    in anc_dist. La chiave di un significato è il suo id nella tabella.
+    """
+
+    def __init__(self, names, ids, min_depth, max_depth, anc_indptr, anc_ids, anc_dist):
+        self.names = names
+        self.ids = ids
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.anc_indptr = anc_indptr
+        self.anc_ids = anc_ids
+        self.anc_dist = anc_dist
+
+
+    @classmethod
+    def buildArrays(cls, synsets, ids):
+        """
+        :param cls
+        :param synsets: synset nell'ordine degli id
+        :param ids: dict nome del synset -> id
+        return dict con gli array 'min_depth', 'max_depth', 'anc_indptr', 'anc_ids', 'anc_dist'
+        """
+        indptr = np.zeros(len(synsets)+1, dtype=np.int64)
+        anc_ids = []
+        anc_dist = []
+        for i, synset in enumerate(synsets):
+            path = hypernymDistances(synset)
+            anc_ids.extend(ids[s.name()] for s in path)
+            anc_dist.extend(path.values())
+            indptr[i+1] = len(anc_ids)
+
+        return {'min_depth': np.array([s.min_depth() for s in synsets], dtype=np.int16),
+                'max_depth': np.array([s.max_depth() for s in synsets], dtype=np.int16),
+                'anc_indptr': indptr,
+                'anc_ids': np.array(anc_ids, dtype=np.int32),
+                'anc_dist': np.array(anc_dist, dtype=np.int16),
+                }
+
+
+    def key(self, sense):
+        return self.ids[sense if isinstance(sense, str) else sense.name()]
+
+
+    def ancestors(self, key):
+        start, end = self.anc_indptr[key], self.anc_indptr[key+1]
+        return self.anc_ids[start:end].astype(np.int64), self.anc_dist[start:end].astype(np.float32)
+
+
+    def depths(self, keys):
+        return self.min_depth[keys].astype(np.int64), self.max_depth[keys].astype(np.int64)
+
+
+    def name(self, key):
+        return self.names[key]
+
+
+class WupDisambiguator():
+    """
+    Per ogni token da disambiguare viene calcolata la matrice di similarità tra i suoi significati
+    e quelli degli altri token, con le stesse regole di 'Synset.wup_similarity()':
+        - LCS: iperonimo comune con profondità min maggiore (a parità, il primo per nome),
+               oppure il significato stesso se è tra questi;
+        - depth = profondità max dell'LCS + 1;
+        - len1, len2 = distanza minima dei due significati dall'LCS, + depth;
+        - similarità = 2 * depth / (len1 + len2), 0 se non c'è un iperonimo comune.
+
+    Il calcolo è limitato a 'max_pairs' coppie di significati e a 'max_time' secondi per query:
+    ai token che superano il limite viene assegnato il primo significato (il più frequente).
+    """
+
+    def __init__(self, hypernyms, max_pairs=5000, max_time=0.2):
+        """
+        :param self
+        :param hypernyms: WordNetHypernyms o TableHypernyms
+        :param max_pairs: numero max di coppie di significati confrontate per query
+        :param max_time: secondi max per la disambiguazione di una query (None per nessun limite)
+        """
+        self.hypernyms = hypernyms
+        self.max_pairs = max_pairs
+        self.max_time = max_time
+
+
+    def __universe(self, keys):
+        """
+        Iperonimi di tutti i significati della query, ordinati per profondità min decrescente e
+        poi per nome, con la matrice delle distanze tra di essi.
+
+        :param self
+        :param keys: chiavi dei significati della query
+        return dict chiave -> posizione, matrice delle distanze (inf se non è un iperonimo),
+               profondità min e max (nell'ordine delle posizioni)
+        """
+        ancestors = {}
+        todo = list(keys)
+        while todo:
+            key = todo.pop()
+            if key not in ancestors:
+                ancestors[key] = self.hypernyms.ancestors(key)
+                todo.extend(int(k) for k in ancestors[key][0] if int(k) not in ancestors)
+
+        universe = np.array(sorted(ancestors), dtype=np.int64)
+        min_depth, max_depth = self.hypernyms.depths(universe)
+        order = sorted(range(len(universe)),
+                       key=lambda i: (-min_depth[i], self.hypernyms.name(universe[i])))
+        universe = universe[order]
+        min_depth, max_depth = min_depth[order], max_depth[order]
+
+        pos = {int(key): i for i, key in enumerate(universe)}
+        dist = np.full((len(universe), len(universe)), np.inf, dtype=np.float32)
+        for i, key in enumerate(universe):
+            anc_keys, anc_dist = ancestors[int(key)]
+            dist[i, [pos[int(k)] for k in anc_keys]] = anc_dist
+
+        return pos, dist, min_depth, max_depth
+
+
+    @classmethod
+    def similarity(cls, rows, cols, dist, min_depth, max_depth):
+        """
+        Similarità di Wu-Palmer tra i significati 'rows' e 'cols' (posizioni nella matrice 'dist').
+
+        :param cls
+        :param rows: array delle posizioni dei significati da disambiguare
+        :param cols: array delle posizioni dei significati del contesto
+        :param dist: matrice delle distanze (vedi '__universe()')
+        :param min_depth: profondità min
+        :param max_depth: profondità max
+        return matrice len(rows) x len(cols)
+        """
+        row_dist = dist[rows][:, None, :]
+        col_dist = dist[cols][None, :, :]
+        common = np.isfinite(row_dist) & np.isfinite(col_dist)
+        found = common.any(axis=2)
+
+        # le posizioni sono ordinate per profondità min decrescente e nome: il primo comune è l'LCS
+        lcs = common.argmax(axis=2)
+        is_self = common[np.arange(len(rows)), :, rows] & (min_depth[rows][:, None] == min_depth[lcs])
+        lcs = np.where(is_self, rows[:, None], lcs)
+
+        lcs_dist = dist[lcs]
+        len1 = (row_dist + lcs_dist).min(axis=2).astype(np.float64)
+        len2 = (col_dist + lcs_dist).min(axis=2).astype(np.float64)
+        depth = max_depth[lcs] + 1.0
+
+        with np.errstate(invalid='ignore'):
+            sim = (2.0 * depth) / (len1 + len2 + 2.0 * depth)
+        return np.where(found, sim, 0.0)
+
+
+    def disambiguate(self, tokens, senses, targets):
+        """
+        :param self
+        :param tokens: token della query
+        :param senses: per ogni token la tuple dei suoi significati (synset o nomi)
+        :param targets: indici dei token da disambiguare
+        return lista con il significato scelto per ogni token (None se non disambiguato),
+               False se è stato superato il limite di coppie o di tempo
+        """
+        start = time.monotonic()
+        res = [None] * len(tokens)
+        complete = True
+
+        keys = [[self.hypernyms.key(s) for s in token_senses] for token_senses in senses]
+        all_keys = {k for token_keys in keys for k in token_keys}
+        if not all_keys:
+            return res, complete
+
+        pos, dist, min_depth, max_depth = self.__universe(all_keys)
+        positions = [np.array([pos[k] for k in token_keys], dtype=np.int64) for token_keys in keys]
+
+        spent = 0
+        for t in targets:
+            if len(senses[t]) == 0:  # se token non riconosciuto
+                continue
+
+            context = [positions[j] for j in range(len(tokens)) if tokens[j] != tokens[t] and len(positions[j])]
+            n_cols = sum(len(p) for p in context)
+            if n_cols == 0:
+                res[t] = senses[t][0]
+                continue
+
+            spent += len(positions[t]) * n_cols
+            if spent > self.max_pairs or (self.max_time is not None and time.monotonic() - start > self.max_time):
+                complete = False
+                res[t] = senses[t][0]
+                continue
+
+            sim = WupDisambiguator.similarity(positions[t], np.concatenate(context), dist, min_depth, max_depth)
+
+            # somma (nell'ordine dei token) del max di similarità con i significati di ogni token
+            score = np.zeros(len(positions[t]))
+            offset = 0
+            for p in context:
+                score += sim[:, offset:offset+len(p)].max(axis=1)
+                offset += len(p)
+
+            res[t] = senses[t][int(np.argmax(score))]
+
+        return res, complete
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+DOCS : https://whoosh.readthedocs.io/en/latest/api/scoring.html#whoosh.scoring.WeightingModel.final
+
+Combinazione dello score testuale con un prior statico per documento (il pagerank) durante la
+raccolta dei risultati, e non sui soli primi 'limit' risultati già ordinati per score testuale.
+"""
+
+import numpy as np
+
+from whoosh import scoring, collectors
+
+
+class StaticPriorWeighting(scoring.WeightingModel):
+    """
+    Weighting che usa il modello 'weighting' per lo score testuale e poi, nel 'final()' chiamato
+    dal collector per ogni documento trovato, moltiplica lo score per il prior del documento.
+    Il collector mantiene solo i primi 'limit' documenti per score combinato, quindi anche un documento
+    con score testuale più basso ma con prior alto può entrare nei risultati.
+
+    Per il pruning (vedi 'StaticPriorTopCollector') viene calcolato anche 'prior_bound': l'elemento i
+    è il prior max dei documenti con docnum >= i * bound_block_size.
+    """
+
+    use_final = True
+
+    bound_block_size = 1024
+
+    def __init__(self, weighting, prior):
+        """
+        :param self
+        :param weighting: WeightingModel usato per lo score testuale (es: BM25F())
+        :param prior: array con il prior (> 0) di ogni docnum del reader
+        """
+        self.weighting = weighting
+        self.prior = prior
+
+        if len(prior):
+            block_max = np.maximum.reduceat(prior, np.arange(0, len(prior), self.bound_block_size))
+            self.prior_bound = np.maximum.accumulate(block_max[::-1])[::-1]
+        else:
+            self.prior_bound = np.ones(1, dtype=np.float32)
+
+
+    def idf(self, searcher, fieldname, text):
+        return self.weighting.idf(searcher, fieldname, text)
+
+
+    def scorer(self, searcher, fieldname, text, qf=1):
+        return self.weighting.scorer(searcher, fieldname, text, qf=qf)
+
+
+    def final(self, searcher, docnum, score):
+        """
+        Score finale del documento.
+
+        :param self
+        :param searcher: searcher che esegue la ricerca
+        :param docnum: docnum del documento
+        :param score: score testuale del documento
+        return score combinato con il prior
+        """
+        if self.weighting.use_final:
+            score = self.weighting.final(searcher, docnum, score)
+        return score * float(self.prior[docnum])
+
+
+    def priorBound(self, docnum):
+        """
+        :param self
+        :param docnum: docnum del documento
+        return limite superiore del prior dei documenti con docnum >= 'docnum'
+        """
+        return float(self.prior_bound[docnum // self.bound_block_size])
+
+
+class StaticPriorTopCollector(collectors.TopCollector):
+    """
+    DOCS : https://whoosh.readthedocs.io/en/latest/api/collectors.html
+
+    TopCollector per la ricerca con 'StaticPriorWeighting', che non calcola lo score di tutti i
+    documenti trovati (max-score / block-max):
+        - 'matcher.replace(minquality)' elimina i matcher (es: i rami di un OR) la cui qualità max
+          (bound per termine dello score testuale) non permette di superare lo score minimo dei
+          primi 'limit' documenti;
+        - 'matcher.skip_to_quality(minquality)' salta i blocchi delle posting list la cui qualità
+          max non permette di superarlo.
+    Il TopCollector di whoosh disabilita il salto dei blocchi se il weighting usa 'final()', perchè
+    la qualità dei matcher è calcolata sullo score testuale e non su quello finale.
+
+    I matcher avanzano solo per docnum crescenti, quindi un documento con score testuale s trovato
+    dopo il docnum d ha score finale al più s * priorBound(d). La qualità minima passata ai matcher
+    è quindi lo score minimo dei risultati diviso per il prior max dei documenti rimanenti, che
+    diminuisce man mano che si supera la posizione dei documenti con pagerank alto.
+    """
+
+    def prepare(self, top_searcher, q, context):
+        collectors.TopCollector.prepare(self, top_searcher, q, context)
+        self.threshold = None
+
+
+    def _use_block_quality(self):
+        return self.usequality and self.matcher.supports_block_quality()
+
+
+    def _collect(self, global_docnum, score):
+        sort_key = collectors.TopCollector._collect(self, global_docnum, score)
+        if len(self.items) >= self.limit:
+            self.threshold = self.items[0][0]
+        return sort_key
+
+
+    def __minQuality(self, sub_docnum):
+        """
+        :param self
+        :param sub_docnum: docnum (nel segmento corrente) del matcher
+        return qualità minima che un documento successivo deve avere per entrare nei risultati
+        """
+        if self.threshold is None:
+            return 0
+        return self.threshold / self.top_searcher.weighting.priorBound(self.offset + sub_docnum)
+
+
+    def matches(self):
+        """
+        Come 'ScoredCollector.matches()' di whoosh, ma la qualità minima dipende anche dal docnum
+        corrente (vedi '__minQuality()').
+        """
+        matcher = self.matcher
+        usequality = self._use_block_quality()
+        replace = self.replace
+        replacecounter = 0
+        minquality = 0
+        checkquality = True
+
+        while matcher.is_active():
+            current = self.__minQuality(matcher.id())
+
+            if replace:
+                if replacecounter == 0 or current != minquality:
+                    self.matcher = matcher = matcher.replace(current)
+                    self.replaced_times += 1
+                    if not matcher.is_active():
+                        break
+                    usequality = self._use_block_quality()
+                    replacecounter = self.replace
+
+                replacecounter -= 1
+
+            if current != minquality:
+                checkquality = True
+                minquality = current
+
+            if usequality and checkquality and minquality:
+                self.skipped_times += matcher.skip_to_quality(minquality)
+                if not matcher.is_active():
+                    break
+
+            yield matcher.id()
+
+            checkquality = matcher.next()
+
+
+def search(searcher, query, limit=10, prune=True):
+    """
+    Ricerca con un searcher che ha come weighting 'StaticPriorWeighting'.
+
+    :param searcher: WhooshSearcher con weighting 'StaticPriorWeighting'
+    :param query: query da eseguire
+    :param limit: numero max di documenti ritornati (None per tutti)
+    :param prune: se False viene calcolato lo score di tutti i documenti trovati (utile per
+                  verificare i risultati ottenuti con il pruning)
+    return whoosh Results
+    """
+    if not limit or limit >= searcher.doc_count():
+        collector = collectors.UnlimitedCollector()
+    else:
+        collector = StaticPriorTopCollector(limit, usequality=prune, replace=10 if prune else 0)
+
+    searcher.search_with_collector(query, collector)
+    return collector.results()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Misura dei tempi di avvio di un processo che apre l'indice ed esegue le prime ricerche, divisi per
+componente. Deve essere eseguito in un processo nuovo (vedi 'python benchmark.py startup'), così
+anche gli import sono misurati 'a freddo':
+
+    python -m indexing.startupProfile --index_dir files/indexdir --pagerank files/table.rank
+
+L'ultima riga stampata è il json con i secondi di ogni fase.
+"""
+
+import argparse
+import importlib
+import json
+import time
+
+
+def profile(args_paths, text, text_expanded):
+    """
+    Le fasi vengono eseguite in sequenza nello stesso ordine in cui avvengono al primo utilizzo, ma
+    le risorse di nltk sono caricate prima della prima ricerca con espansione, così il tempo della
+    ricerca non le comprende. Le cache dei risultati e delle espansioni sono disabilitate.
+
+    :param args_paths: argomenti di WikiIndex (index_dir, pagerank, expansion_table)
+    :param text: query eseguita senza espansione
+    :param text_expanded: query eseguita con espansione
+    return dict con i secondi di ogni fase (nell'ordine di esecuzione)
+    """
+    args_paths.cache_size = 0
+    args_paths.expansion_cache = None
+
+    timings = {}
+    state = {}
+
+    def importIndex():
+        state['index'] = importlib.import_module('indexing.index')
+
+    def openIndex():
+        state['wiki_index'] = state['index'].WikiIndex(args_paths)
+        state['wiki_index'].open()
+
+    def importNltk():
+        state['nltk'] = importlib.import_module('nltk')
+
+    def loadWordnet():
+        from nltk.corpus import wordnet as wn
+        wn.ensure_loaded()
+
+    stages = [('import_index', importIndex),
+              ('open_index', openIndex),
+              ('first_search', lambda: state['wiki_index'].query(text, exp=False)),
+              ('import_nltk', importNltk),
+              ('stopwords', lambda: state['nltk'].corpus.stopwords.words('english')),
+              ('tokenizer', lambda: state['nltk'].word_tokenize(text)),
+              ('wordnet', loadWordnet),
+              ('first_expanded_search', lambda: state['wiki_index'].query(text, exp=True)),
+              ('expanded_search', lambda: state['wiki_index'].query(text_expanded, exp=True)),
+              ]
+
+    for name, fn in stages:
+        start = time.perf_counter()
+        fn()
+        timings[name] = time.perf_counter() - start
+
+    state['wiki_index'].close()
+    return timings
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Tempi di avvio divisi per componente.')
+    p.add_argument('--index_dir', type=str, default='files/indexdir', help='Folder indice whoosh.')
+    p.add_argument('--pagerank', type=str, default='files/table.rank', help='File del pagerank.')
+    p.add_argument('--expansion_table', type=str, default=None, help='File della tabella di espansione.')
+    p.add_argument('--text', type=str, default='roman empire', help='Query eseguita senza espansione.')
+    p.add_argument('--text_expanded', type=str, default='ancient greek city', help='Query eseguita con espansione.')
+
+    args_paths = p.parse_args()
+    print(json.dumps(profile(args_paths, args_paths.text, args_paths.text_expanded)))
@@ -1,6 +1,3 @@
-# https://www.geeksforgeeks.org/performing-google-search-using-python-code/ 
-from googlesearch import search 
-
 # .
 from .xmlParsing import interwikiLink
 from .xmlParsing.saxReader import NS_NOT_VALID
@@ -84,6 +81,9 @@ def computeTestSet(queries, google_file_path, interwiki_file_path, n_per_query,
     :param n_relevant: per ogni query eleziono solo i primi n_relevant links
     return dict con nome query e lista di n link rilevanti
     """
+    # https://www.geeksforgeeks.org/performing-google-search-using-python-code/
+    from googlesearch import search     # solo se il test set non è già salvato (es: non serve nell'evaluation)
+
     n_google_res = int(n_per_query * 1.5)  # n_google_res deve essere > di n_per_query dato che poi effettuo un filtraggio dei link
 
     print('Calcolo i risultati del test set eseguendo richieste da Google ...')
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+DOCS : https://meta.wikimedia.org/wiki/Data_dumps/Dump_format
+
+Apertura dei file di dump, anche compressi, senza doverli prima decomprimere su disco.
+
+Il formato MULTISTREAM (es: 'enwiki-...-pages-articles-multistream.xml.bz2') è composto da
+tanti stream bz2 concatenati, ognuno con al più 100 pagine. Il file di indice associato
+('...-multistream-index.txt.bz2') ha una riga 'offset:id_pagina:titolo' per ogni pagina, dove
+'offset' è la posizione in byte dello stream che contiene la pagina. Ogni stream può quindi
+essere letto e decompresso in modo indipendente dagli altri.
+"""
+
+import bz2
+import gzip
+import os
+
+
+def openDump(path_file):
+    """
+    Apre il file del dump in lettura binaria. In base all'estensione il file viene
+    decompresso durante la lettura.
+    bz2 gestisce anche più stream concatenati, quindi anche il formato multistream può
+    essere letto in modo sequenziale.
+
+    :param path_file: path del dump ('.xml', '.xml.bz2' o '.xml.gz')
+    return file object
+    """
+    if path_file.endswith('.bz2'):
+        return bz2.open(path_file, 'rb')
+    if path_file.endswith('.gz'):
+        return gzip.open(path_file, 'rb')
+    return open(path_file, 'rb')
+
+
+def readMultistreamIndex(path_index):
+    """
+    Lettura degli offset degli stream dal file di indice di un dump multistream.
+
+    :param path_index: path del file di indice (anche compresso)
+    return lista ordinata degli offset (senza duplicati) degli stream che contengono pagine
+    """
+    offsets = set()
+    with openDump(path_index) as fp:
+        for line in fp:
+            offset, _, _ = line.partition(b':')
+            if offset.strip():
+                offsets.add(int(offset))
+    return sorted(offsets)
+
+
+def findStreamOffset(path_index, id_page):
+    """
+    Offset dello stream che contiene la pagina, letto dal file di indice di un dump multistream.
+
+    :param path_index: path del file di indice (anche compresso)
+    :param id_page: id della pagina
+    return offset dello stream, None se la pagina non è presente nell'indice
+    """
+    id_page = str(id_page).strip().encode('utf-8')
+    with openDump(path_index) as fp:
+        for line in fp:
+            offset, _, rest = line.partition(b':')
+            if rest.partition(b':')[0] == id_page:
+                return int(offset)
+    return None
+
+
+def getStreamRanges(path_dump, offsets):
+    """
+    Ricavo l'intervallo di byte di ogni stream. L'ultimo stream termina alla fine del file.
+
+    :param path_dump: path del dump multistream
+    :param offsets: offset ordinati degli stream
+    return lista di tuple (inizio, fine)
+    """
+    ends = offsets[1:] + [os.path.getsize(path_dump)]
+    return list(zip(offsets, ends))
+
+
+def readStream(path_dump, start, end):
+    """
+    Lettura e decompressione dello stream compreso tra 'start' e 'end'.
+    Lo stream contiene solo una sequenza di elementi <page>, quindi viene racchiuso in un
+    elemento radice per essere un xml valido. L'ultimo stream del dump contiene anche la chiusura
+    del tag radice originale, che viene tolta.
+
+    :param path_dump: path del dump multistream
+    :param start: offset di inizio dello stream
+    :param end: offset di fine dello stream
+    return xml (bytes) con le pagine dello stream
+    """
+    with open(path_dump, 'rb') as fp:
+        fp.seek(start)
+        data = bz2.decompress(fp.read(end-start))
+
+    return b'<mediawiki>' + data.replace(b'</mediawiki>', b'') + b'</mediawiki>'
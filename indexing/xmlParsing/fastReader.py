@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reader alternativi al parser SAX per la lettura delle pagine del dump.
+
+Entrambi i reader leggono solo gli elementi che servono (titolo, namespace, id della pagina e testo)
+e scartano tutto il resto (revision, contributor, comment..), chiamando la funzione passata con lo
+stesso record grezzo (title, id, text) del 'saxReader.PageRecordHandler' (e, se specificata, la
+funzione 'fn_tombstone' con l'id delle pagine non valide):
+
+    - 'expat': usa direttamente 'xml.parsers.expat' senza passare dai ContentHandler di xml.sax.
+               Il testo viene bufferizzato da expat, quindi ogni elemento arriva in pochi chunk.
+    - 'lxml':  usa 'lxml.etree.iterparse'; ogni pagina viene eliminata dall'albero dopo essere
+               stata letta in modo che la memoria usata rimanga costante.
+"""
+
+import xml.parsers.expat
+
+from . import saxReader
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+
+def isValidPage(ns, text):
+    """
+    Controllo che la pagina sia valida: namespace valido e testo che non è un redirect.
+    Sono gli stessi controlli del 'saxReader.BaseContentHandler'.
+
+    :param ns: namespace della pagina (None se non presente)
+    :param text: testo della pagina
+    return True se la pagina è valida
+    """
+    if ns is not None and ns.strip() in saxReader.NS_NOT_VALID:
+        return False
+    return not text.startswith('#REDIRECT')
+
+
+class ExpatPageReader():
+    """
+    DOCS : https://docs.python.org/3/library/pyexpat.html
+
+    Lettura delle pagine con expat. Il contenuto viene salvato solo per gli elementi
+    'title', 'ns', 'id' (della pagina e non della revision) e 'text'.
+    """
+
+    page_fields = ('title', 'ns', 'id', 'text')
+
+    def __init__(self, fn, buffer_size=1 << 16, fn_tombstone=None):
+        """
+        Creazione del parser expat.
+
+        :param self
+        :param fn: funzione chiamata con il record grezzo (title, id, text) di ogni pagina valida
+        :param buffer_size: dimensione del buffer di expat e dei blocchi letti dal file
+        :param fn_tombstone: funzione chiamata con l'id di ogni pagina non valida (None per ignorarle)
+        """
+        self.fn = fn
+        self.fn_tombstone = fn_tombstone
+        self.buffer_size = buffer_size
+
+        self.parser = xml.parsers.expat.ParserCreate()
+        self.parser.buffer_text = True
+        self.parser.buffer_size = buffer_size
+        self.parser.StartElementHandler = self.startElement
+        self.parser.EndElementHandler = self.endElement
+        self.parser.CharacterDataHandler = self.characters
+
+        self.page = {}
+        self.in_revision = False
+        self.chunks = None      # lista dei chunk dell'elemento corrente, None se non lo salvo
+
+
+    def startElement(self, tag, attributes):
+        """
+        Inizio di un elemento: se è uno dei campi della pagina inizio a salvarne il contenuto.
+
+        :param self
+        :param tag: nome dell'elemento
+        :param attributes: attributi dell'elemento
+        """
+        if tag == 'page':
+            self.page = {}
+            self.in_revision = False
+        elif tag == 'revision':
+            self.in_revision = True
+        elif tag in self.page_fields and not (tag == 'id' and self.in_revision):
+            self.chunks = []
+
+
+    def characters(self, content):
+        """
+        Contenuto di un elemento.
+
+        :param self
+        :param content: contenuto letto
+        """
+        if self.chunks is not None:
+            self.chunks.append(content)
+
+
+    def endElement(self, tag):
+        """
+        Fine di un elemento: salvo il contenuto del campo oppure, se è terminata la pagina,
+        controllo che sia valida e la passo alla funzione.
+
+        :param self
+        :param tag: nome dell'elemento
+        """
+        if self.chunks is not None:
+            self.page[tag] = ''.join(self.chunks)
+            self.chunks = None
+
+        elif tag == 'revision':
+            self.in_revision = False
+
+        elif tag == 'page':
+            text = self.page.get('text', '')
+            if isValidPage(self.page.get('ns'), text):
+                self.fn(title=self.page.get('title', '').strip(),
+                        id=self.page.get('id', ''),
+                        text=text)
+            elif self.fn_tombstone is not None and self.page.get('id', '').strip():
+                self.fn_tombstone(id=self.page['id'])
+
+
+    def parse(self, fp):
+        """
+        Lettura del file a blocchi.
+
+        :param self
+        :param fp: file object (binario) da leggere
+        """
+        while True:
+            data = fp.read(self.buffer_size)
+            if not data:
+                break
+            self.parser.Parse(data, False)
+        self.parser.Parse(b'', True)
+
+
+def readPagesExpat(fp, fn, fn_tombstone=None):
+    """
+    Lettura delle pagine valide con expat.
+
+    :param fp: file object (binario) da leggere
+    :param fn: funzione chiamata con il record grezzo (title, id, text) di ogni pagina valida
+    :param fn_tombstone: funzione chiamata con l'id di ogni pagina non valida (None per ignorarle)
+    """
+    ExpatPageReader(fn, fn_tombstone=fn_tombstone).parse(fp)
+
+
+def readPagesLxml(fp, fn, fn_tombstone=None):
+    """
+    DOCS : https://lxml.de/parsing.html#iterparse-and-iterwalk
+
+    Lettura delle pagine valide con lxml. Il namespace xml del dump viene ignorato ('{*}').
+    Dopo aver letto una pagina, questa e quelle precedenti vengono eliminate dall'albero.
+
+    :param fp: file object (binario) da leggere
+    :param fn: funzione chiamata con il record grezzo (title, id, text) di ogni pagina valida
+    :param fn_tombstone: funzione chiamata con l'id di ogni pagina non valida (None per ignorarle)
+    """
+    if etree is None:
+        raise ImportError('Il reader \'lxml\' richiede il pacchetto lxml')
+
+    for _, page in etree.iterparse(fp, events=('end',), tag='{*}page'):
+        text = page.findtext('{*}revision/{*}text')
+        if text is None:
+            text = page.findtext('{*}text', '')
+
+        if isValidPage(page.findtext('{*}ns'), text):
+            fn(title=page.findtext('{*}title', '').strip(),
+               id=page.findtext('{*}id', ''),
+               text=text)
+        elif fn_tombstone is not None and page.findtext('{*}id', '').strip():
+            fn_tombstone(id=page.findtext('{*}id'))
+
+        page.clear()
+        while page.getprevious() is not None:
+            del page.getparent()[0]
+
+
+readers = {'expat': readPagesExpat,
+           'lxml': readPagesLxml,
+           }
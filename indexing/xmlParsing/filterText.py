@@ -1,9 +1,59 @@
 
 import re
-from . import interwikiLink, saxReader
+import hashlib
+from . import interwikiLink
+from .linkResolver import LinkResolver
+from .. import instrumentation
 
 class FilterWikiText():
 
+    # Tabella delle sostituzioni eseguite da 'getCleaned', nell'ordine in cui vengono applicate.
+    # Per ogni reg exp è indicato anche un letterale che deve essere presente nel testo perchè la 
+    # reg exp possa fare match: se non è presente la sostituzione viene saltata senza scandire il testo.
+    replacements = [
+        
+        (r'{{[^}{]*?url=.*?}}', '', 'url='),           # rimuovo {{..url=..}}
+        (r'{{[^}{]*?lang.*?}}', '', 'lang'),           # rimuovo {{..lang..}}
+        (r'{{[^}{]*?reflist.*?}}', '', 'reflist'),     # rimuovo {{..ref..}}
+        (r'{{[^}{]*?commons.*?}}', '', 'commons'),     # rimuovo {{..commons..}}
+        (r'{{[^}{]*?coord.*?}}', '', 'coord'),         # rimuovo {{..coord..}}
+    
+        (r'\[http.+?\]', '', '[http'),          # rimuovo link esterni [http..]
+        (r'\shttp.+?\s', '', 'http'),           # rimuovo link esterni
+        (r'\s[^\s]+\.com\s?', '', '.com'),      # rimuovo ogni parola che termina con '.com' |
+        (r'\s[^\s]+\.org\s?', '', '.org'),      # rimuovo ogni parola che termina con '.org' |
+        (r'\s[^\s]+\.it\s?', '', '.it'),        # rimuovo ogni parola che termina con '.it'  | --> Li elimino perchè sono link esterni a wikipedia e non li considero importanti per l'applicazione
+        (r'\s[^\s]+\.en\s?', '', '.en'),        # rimuovo ogni parola che termina con '.en'  |
+        
+                                     
+        (r'<gallery.*?</gallery>', '', '<gallery'),   # Qua vengono di solito messe le liste di file che non salvo
+        (r'\[\[File:.*?\]\]', '', '[[File:'),        # Se non è presente '|' , CANCELLO FINO A '\n'
+        (r'\[\[Media:.*?\]\]', '', '[[Media:'),      # da 'Media:...|txt_name' -> rimane 'txt_name'
+        
+        (r'<[^<]*?>', '', '<'),           # rimuovo tag html 
+    ]
+
+    # Sostituzioni di singoli caratteri eseguite dopo 'replacements'. 
+    # Nessuna sostituzione introduce un carattere gestito da un'altra, quindi possono essere
+    # eseguite tutte insieme con un'unica 'str.translate'.
+    char_replacements = [
+        ('[', ''),            # Rimuovo [
+        (']', ''),            # Rimuovo ]
+        ('{', ''),            # Rimuovo {
+        ('}', ''),            # Rimuovo }
+        ('/', ''),            # Rimuovo /
+        (':', ' '),           # Rimuovo :
+        ('|', ' '),           # Rimuovo |
+        ('=', ' '),           # Rimuovo =
+        ('*', ''),            # Rimuovo *
+    ]
+
+    # reg exp compilate una sola volta. DOTALL perchè il '.' non fa match con newline 
+    compiled_replacements = [(re.compile(old, flags=re.DOTALL), new, literal) 
+                             for old, new, literal in replacements]
+    char_table = str.maketrans(dict(char_replacements))
+
+
     def __init__(self, path_interwiki_links):
         """
         Inizializzazione interwiki_prefix_set che corrisponde ad un set contenente tutti i prefix 
@@ -13,6 +63,7 @@ class FilterWikiText():
         :param dir_storage: directory dove salvare i prefix degli interwiki link
         """
         self.interwiki_prefix_set = interwikiLink.getPrefixSet(path_interwiki_links)
+        self.link_resolver = LinkResolver(self.interwiki_prefix_set)
 
 
     def getLinkAndCategory(self, text, title):
@@ -37,86 +88,16 @@ class FilterWikiText():
 
         Le categorie non sono state usate ai fini del progetto.
 
+        La risoluzione viene eseguita dal 'LinkResolver', che compila le reg exp e normalizza i 
+        prefissi da scartare una sola volta.
+
         :param self
         :param text: il testo da cui estrarre i link
         :param title: il titolo del teso, che corrisponde al link della pagina 
         
         return res_dict: dizionario con 2 liste, una per le categorie e una per i link
         """
-        res_dict ={'links': [], 'categories': []}
-        
-        # reg exp per determinare i link da text wiki '[[link]]'
-        pattern = re.compile(r'\[\[([^\]]+?)\]\]') 
-        
-        for match in re.finditer(pattern, text):
-            # [[Link name| display name]]   -->  res = 'Link name'   -> non considero il display name perchè non fa parte del link
-            res = match.group(1).split("|")[0].strip() 
-            
-            # link a una sezione nella stessa pagina non lo considero (startswith('#'))
-            # se il link è uguale a titolo delle pagina, allora NON è un link ma viene solo messo in grassetto il testo in fase di visualizzazione
-            if not res.startswith('#') and res!=title :
-                is_category = False                  
-                                  
-                # Da fare sempre se link valido                  
-                res = re.sub(r'#.*', '', res)        # elimina da '#' fino alla fine SE '#' PRESENTE
-                res = re.sub(r'/\s*?$', '', res)     # elimina ultimo '/' nell'url SE PRESENTE 
-                
-                # link alla sotto-pagina e quindi devo aggiungere come prefisso il titolo della 
-                # pagina corrente                                     
-                if res.startswith('/'):
-                    res = title+res
-                    
-                # Data la pag 'p/test1' --> 'test1 è sotto-pagina di 'p'. 
-                # Nella pag 'p/test1' ho un link che inizia con '../test2', questo significa che 
-                # il link risultante deve essere 'p/test2'
-                elif res.startswith('../'):
-                    father_page = re.sub(r'/[^/]+?$', '', title)    # da 'p/test1' a 'p/' oopure da 'p/test1/test2' a       'p/test1
-                    res = father_page + re.sub(r'..', '', res)      # Se link è '../test3' tolgo solo '..' così diventa --> 'p/test1/test3
-                    
-                # Se definito, indica una delle categorie di cui fa parte la pagina corrente, quindi
-                # la aggiungo alla lista delle categorie
-                elif res.startswith('Category'):
-                    is_category = True
-
-                # NON risolviamo link che contengono variabili {{''}} dato che 
-                # servono principalmente per riferirsi a Talk pages oppure risolvere link di
-                # help pages per ricondursi a link di base
-                elif res.startswith('{{'):
-                    res = None
-
-                # Prefissi che non sono NAMESPACE non li considero
-                elif res.startswith('Image:') or res.startswith('Manual:') or res.startswith('Extension:'):
-                    res = None
-
-                # match_ è NOT NONE se il link ha queste forme :   ':x:y'  o  'x:y'  o  ':x:y:z'  o  'x:y:z'  ...
-                # ovvero se è un candidato INTERWIKI LINK o LINK a pagine in cui è specificato il NAMESAPCE.
-                # Se è NOT NONE allora ricavo il prefix :   ':x:y:z' --> 'x'  o  'x:y' --> 'x'    (toglie ':')
-                  # Una volta ricavata la 'x' (prefix), controllo se 
-                    #  1) è un INTERWIKI LINK  --> res = None
-                    #  2) è link a pagina che ha NAMESPACE non valido  -->  res = None
-                    #  Se non soddisfa 1) e 2) allora significa che è un link che ha ':' nel titolo ma non corrisponde a interwiki o namespace non validi --> link valido
-                # Se invece match_ è NONE, significa che il link non è INTERWIKILINK e non fa parte di NAMESPACE non validi --> link PROBABILMENTE valido
-                else:
-                    match_ = re.search(r'^:?[^:]+?:', res)
-                    if match_ is not None:
-                        pref = re.sub(r':', '', match_[0]) 
-                        if pref in self.interwiki_prefix_set:
-                            res = None
-                        else:
-                            for ns_not_valid in saxReader.NS_NOT_VALID.values():  
-                                if pref == ns_not_valid.replace("_", " "):
-                                    res = None
-                    
-                # Se res == None --> tipo di link non considerato e non faccio niente
-                # Se non è una categoria, è possibile che un titolo inizi con ':', ma il titolo effettivo è senza ':', quindi li tolgo.
-                # es :   [[:Article]] è equivalente con [[Article]], ma mi salvo solo 'Article'
-                if res is not None:
-                    if is_category:
-                        res_dict['categories'].append(res)
-                    else:
-                        res = re.sub(r':', '', res)  
-                        res_dict['links'].append(res)
-        return res_dict 
+        return self.link_resolver.resolve(text, title)
 
 
     @classmethod
@@ -133,50 +114,24 @@ class FilterWikiText():
         
         In questa fase vengono eliminati i caratteri non attinenti come '[({..' in modo da ottenere
         highlights dei documenti ritornati più puliti.
+
+        Le sostituzioni di 'replacements' devono essere eseguite in sequenza (una sostituzione può 
+        creare o eliminare un match delle successive), ma vengono saltate quando il loro letterale 
+        non è presente nel testo. Le sostituzioni di singoli caratteri sono eseguite in un unico passaggio.
+        Il risultato è identico a quello che si ottiene eseguendo ogni sostituzione con un 're.sub'
+        sull'intero testo (vedi 'tests/test_filterText.py').
         
         :param cls
         :param text: testo da pulire
         
         return testo pulito
         """
-        
-        replacements = [
-            
-            (r'{{[^}{]*?url=.*?}}', ''),      # rimuovo {{..url=..}}
-            (r'{{[^}{]*?lang.*?}}', ''),      # rimuovo {{..lang..}}
-            (r'{{[^}{]*?reflist.*?}}', ''),   # rimuovo {{..ref..}}
-            (r'{{[^}{]*?commons.*?}}', ''),   # rimuovo {{..commons..}}
-            (r'{{[^}{]*?coord.*?}}', ''),     # rimuovo {{..coord..}}
-        
-            (r'\[http.+?\]', ''),          # rimuovo link esterni [http..]
-            (r'\shttp.+?\s', ''),          # rimuovo link esterni
-            (r'\s[^\s]+\.com\s?', ''),     # rimuovo ogni parola che termina con '.com' |
-            (r'\s[^\s]+\.org\s?', ''),     # rimuovo ogni parola che termina con '.org' |
-            (r'\s[^\s]+\.it\s?', ''),      # rimuovo ogni parola che termina con '.it'  | --> Li elimino perchè sono link esterni a wikipedia e non li considero importanti per l'applicazione
-            (r'\s[^\s]+\.en\s?', ''),      # rimuovo ogni parola che termina con '.en'  |
-            
-                                         
-            (r'<gallery.*?</gallery>', ''),   # Qua vengono di solito messe le liste di file che non salvo
-            (r'\[\[File:.*?\]\]', ''),        # Se non è presente '|' , CANCELLO FINO A '\n'
-            (r'\[\[Media:.*?\]\]', ''),       # da 'Media:...|txt_name' -> rimane 'txt_name'
-            
-            (r'<[^<]*?>', ''),           # rimuovo tag html 
-
-            (r'\[', ''),            # Rimuovo [
-            (r'\]', ''),            # Rimuovo ]
-            (r'\{', ''),            # Rimuovo {
-            (r'\}', ''),            # Rimuovo }
-            (r'\/', ''),            # Rimuovo /
-            (r'\:', ' '),           # Rimuovo :
-            (r'\|', ' '),           # Rimuovo |
-            (r'\=', ' '),           # Rimuovo =
-            (r'\*', ''),            # Rimuovo *
-        ]
         res = text
-        for old, new in replacements:
-            res = re.sub(old, new, res, flags=re.DOTALL) # perchè il '.' non fa match con newline 
+        for pattern, new, literal in cls.compiled_replacements:
+            if literal in res:
+                res = pattern.sub(new, res)
 
-        return res  
+        return res.translate(cls.char_table)
 
 
     def startFilter(self, text, title):
@@ -191,6 +146,42 @@ class FilterWikiText():
         res['text'] = FilterWikiText.getCleaned(text)
         return res
 
+
+    def filterPage(self, title, id_page, text):
+        """
+        Effettuo il filtraggio di una pagina letta dal dump e costruisco il dict che viene
+        passato alla funzione di indicizzazione.
+
+        :param self
+        :param title: titolo della pagina
+        :param id_page: id della pagina
+        :param text: testo (non filtrato) della pagina
+        return dict con titolo, id, testo filtrato, link interni e digest della pagina
+        """
+        with instrumentation.timer('filter_page_seconds'):
+            filtered = self.startFilter(text, title)
+
+        return {'title': title,
+                'id': id_page.strip(),
+                'text': filtered['text'],
+                'internal_link': filtered['links'],
+                'digest': FilterWikiText.getDigest(title, text),
+                }
+
+
+    @classmethod
+    def getDigest(cls, title, text):
+        """
+        Digest del titolo e del testo (non filtrato) della pagina. Permette di capire se una pagina 
+        è cambiata rispetto a quella indicizzata senza doverla filtrare di nuovo.
+
+        :param cls
+        :param title: titolo della pagina
+        :param text: testo (non filtrato) della pagina
+        return digest esadecimale
+        """
+        return hashlib.sha1((title+'\n'+text).encode('utf-8')).hexdigest()
+
                     
                     
                     
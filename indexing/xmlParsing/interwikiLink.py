@@ -5,7 +5,6 @@ Created on Wed Sep 16 08:13:44 2020
 
 @author: gabrielesavoia
 """
-import requests
 import os, os.path
 import pickle
 
@@ -39,6 +38,8 @@ def getPrefixSet(path_interwiki_links):
         format='json',
     )
     
+    import requests     # solo se il file non esiste, per non importarlo ad ogni avvio
+
     resp = requests.get(url=url, params=params).json()
     
     pref = set()
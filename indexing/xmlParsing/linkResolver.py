@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Risoluzione e filtraggio dei link interni presenti nel testo di una pagina di wikipedia.
+"""
+
+import re
+
+from . import saxReader
+
+
+class LinkResolver():
+    """
+    Gestisce la risoluzione dei link di una pagina.
+
+    Le reg exp sono compilate una sola volta, mentre i prefissi da scartare (interwiki e namespace
+    non validi) sono normalizzati una sola volta nell'__init__ e salvati in set, in modo che il
+    controllo per ogni link sia O(1).
+    """
+
+    # reg exp per determinare i link da text wiki '[[link]]'
+    link_pattern = re.compile(r'\[\[([^\]]+?)\]\]')
+
+    section_pattern = re.compile(r'#.*')            # da '#' fino alla fine
+    last_slash_pattern = re.compile(r'/\s*?$')      # ultimo '/' nell'url
+    last_subpage_pattern = re.compile(r'/[^/]+?$')  # ultima sotto-pagina nel titolo
+    parent_pattern = re.compile(r'..')              # '..' del link alla pagina padre
+    prefix_pattern = re.compile(r'^:?[^:]+?:')      # prefisso ':x:y' --> ':x:'
+
+    # Prefissi che non sono NAMESPACE e che non considero
+    not_namespace_prefix = ('Image:', 'Manual:', 'Extension:')
+
+
+    def __init__(self, interwiki_prefix_set):
+        """
+        Inizializzazione dei set dei prefissi da scartare.
+
+        :param self
+        :param interwiki_prefix_set: set dei prefissi degli interwiki link
+        """
+        self.interwiki_prefix_set = set(interwiki_prefix_set)
+        self.ns_not_valid_set = {ns.replace("_", " ") for ns in saxReader.NS_NOT_VALID.values()}
+
+
+    def isPrefixNotValid(self, pref):
+        """
+        Controllo se il prefisso corrisponde ad un INTERWIKI LINK o a un NAMESPACE non valido.
+
+        :param self
+        :param pref: prefisso del link senza ':'
+        return True se il link con questo prefisso non deve essere considerato
+        """
+        return pref in self.interwiki_prefix_set or pref in self.ns_not_valid_set
+
+
+    def resolve(self, text, title):
+        """
+        Rilevamento e risoluzione dei link e delle categorie presenti nel testo.
+        Per la descrizione vedere 'FilterWikiText.getLinkAndCategory'.
+
+        :param self
+        :param text: il testo da cui estrarre i link
+        :param title: il titolo del teso, che corrisponde al link della pagina
+
+        return res_dict: dizionario con 2 liste, una per le categorie e una per i link
+        """
+        res_dict ={'links': [], 'categories': []}
+        links = res_dict['links']
+        categories = res_dict['categories']
+
+        for match in self.link_pattern.finditer(text):
+            # [[Link name| display name]]   -->  res = 'Link name'   -> non considero il display name perchè non fa parte del link
+            res = match.group(1).split("|", 1)[0].strip()
+
+            # link a una sezione nella stessa pagina non lo considero (startswith('#'))
+            # se il link è uguale a titolo delle pagina, allora NON è un link ma viene solo messo in grassetto il testo in fase di visualizzazione
+            if res.startswith('#') or res == title:
+                continue
+
+            is_category = False
+
+            # Da fare sempre se link valido. Le reg exp sono eseguite solo se possono fare match
+            if '#' in res:
+                res = self.section_pattern.sub('', res)      # elimina da '#' fino alla fine SE '#' PRESENTE
+            if '/' in res:
+                res = self.last_slash_pattern.sub('', res)   # elimina ultimo '/' nell'url SE PRESENTE
+
+            # link alla sotto-pagina e quindi devo aggiungere come prefisso il titolo della
+            # pagina corrente
+            if res.startswith('/'):
+                res = title+res
+
+            # Data la pag 'p/test1' --> 'test1 è sotto-pagina di 'p'.
+            # Nella pag 'p/test1' ho un link che inizia con '../test2', questo significa che
+            # il link risultante deve essere 'p/test2'
+            elif res.startswith('../'):
+                father_page = self.last_subpage_pattern.sub('', title)    # da 'p/test1' a 'p/' oopure da 'p/test1/test2' a       'p/test1
+                res = father_page + self.parent_pattern.sub('', res)      # Se link è '../test3' tolgo solo '..' così diventa --> 'p/test1/test3
+
+            # Se definito, indica una delle categorie di cui fa parte la pagina corrente, quindi
+            # la aggiungo alla lista delle categorie
+            elif res.startswith('Category'):
+                is_category = True
+
+            # NON risolviamo link che contengono variabili {{''}} dato che
+            # servono principalmente per riferirsi a Talk pages oppure risolvere link di
+            # help pages per ricondursi a link di base
+            elif res.startswith('{{'):
+                res = None
+
+            # Prefissi che non sono NAMESPACE non li considero
+            elif res.startswith(self.not_namespace_prefix):
+                res = None
+
+            # match_ è NOT NONE se il link ha queste forme :   ':x:y'  o  'x:y'  o  ':x:y:z'  o  'x:y:z'  ...
+            # ovvero se è un candidato INTERWIKI LINK o LINK a pagine in cui è specificato il NAMESAPCE.
+            # Se è NOT NONE allora ricavo il prefix :   ':x:y:z' --> 'x'  o  'x:y' --> 'x'    (toglie ':')
+            # e controllo se è un INTERWIKI LINK o un link a pagina che ha NAMESPACE non valido --> res = None
+            # Se invece match_ è NONE, significa che il link non è INTERWIKILINK e non fa parte di NAMESPACE non validi --> link PROBABILMENTE valido
+            elif ':' in res:
+                match_ = self.prefix_pattern.search(res)
+                if match_ is not None and self.isPrefixNotValid(match_[0].replace(':', '')):
+                    res = None
+
+            # Se res == None --> tipo di link non considerato e non faccio niente
+            # Se non è una categoria, è possibile che un titolo inizi con ':', ma il titolo effettivo è senza ':', quindi li tolgo.
+            # es :   [[:Article]] è equivalente con [[Article]], ma mi salvo solo 'Article'
+            if res is not None:
+                if is_category:
+                    categories.append(res)
+                else:
+                    links.append(res.replace(':', ''))
+        return res_dict
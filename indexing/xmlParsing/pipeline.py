@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pipeline multiprocesso per la lettura del dump.
+
+Il parser SAX (processo principale) si limita a leggere i record grezzi delle pagine
+(titolo, id, testo) che vengono raggruppati in batch e inviati ad un pool di processi worker.
+Ogni worker esegue il filtraggio del testo (pulizia e estrazione dei link) e ritorna le
+pagine filtrate, che vengono poi passate nell'ordine di lettura alla funzione di indicizzazione
+(writer e grafo) nel processo principale.
+
+Se la strumentazione è abilitata, le metriche registrate dal worker durante un task (es: 
+'filter_page_seconds') vengono ritornate insieme alle pagine e unite a quelle del processo principale.
+"""
+
+import multiprocessing
+from collections import deque
+import io
+
+from . import filterText, dumpInput, saxReader
+from .. import instrumentation
+
+
+# FilterWikiText del processo worker, creato una sola volta in '_initWorker'
+_filter = None
+
+
+def _initWorker(path_interwiki_links, metrics=False):
+    """
+    Inizializzazione del processo worker: il set degli interwiki link viene caricato
+    una sola volta per processo e non per ogni batch.
+
+    :param path_interwiki_links: path del file degli interwiki link
+    :param metrics: True se la strumentazione è abilitata nel processo principale
+    """
+    global _filter
+    _filter = filterText.FilterWikiText(path_interwiki_links)
+
+    if metrics:
+        instrumentation.enableWorker()
+
+
+def _filterPages(batch):
+    """
+    :param batch: lista di dict (title, id, text) delle pagine lette dal dump
+    return lista di dict delle pagine filtrate
+    """
+    return [_filter.filterPage(page['title'], page['id'], page['text']) for page in batch]
+
+
+def _filterBatch(batch):
+    """
+    Filtraggio di un batch di pagine. Eseguita nel processo worker.
+
+    :param batch: lista di dict (title, id, text) delle pagine lette dal dump
+    return tuple (lista di dict delle pagine filtrate, metriche del task)
+    """
+    return _filterPages(batch), instrumentation.drain()
+
+
+def _parseStream(path_dump, start, end, reader):
+    """
+    Lettura, decompressione e filtraggio delle pagine di uno stream di un dump multistream.
+    Eseguita nel processo worker.
+
+    :param path_dump: path del dump multistream
+    :param start: offset di inizio dello stream
+    :param end: offset di fine dello stream
+    :param reader: backend usato per la lettura delle pagine (vedi 'saxReader.readPages')
+    return tuple (lista di dict delle pagine filtrate, metriche del task)
+    """
+    batch = []
+    data = dumpInput.readStream(path_dump, start, end)
+    saxReader.readPages(io.BytesIO(data), lambda **page: batch.append(page), reader)
+
+    return _filterPages(batch), instrumentation.drain()
+
+
+class PagePipeline():
+    """
+    Gestisce l'invio delle pagine lette ai worker e la raccolta dei risultati.
+
+    Le pagine in attesa di essere filtrate sono limitate a 'max_pending' task (batch di pagine o
+    stream di un dump multistream): quando il limite viene superato il parser attende il task
+    più vecchio, in modo che la memoria usata non cresca se la lettura è più veloce del filtraggio.
+    """
+
+    def __init__(self, path_interwiki_links, n_workers, fn, *args_fn, batch_size=64, max_pending=None, **kwargs_fn):
+        """
+        Inizializzazione della pipeline e creazione del pool di worker.
+
+        :param self
+        :param path_interwiki_links: path del file degli interwiki link
+        :param n_workers: numero di processi worker
+        :param fn: la funzione da eseguire per ogni pagina filtrata
+        :param args_fn: argomenti da passare alla funzione
+        :param batch_size: numero di pagine per batch
+        :param max_pending: numero max di task in attesa (default 2 per worker)
+        :param kwargs_fn: argomenti da passare alla funzione
+        """
+        self.fn = fn
+        self.args_fn = args_fn
+        self.kwargs_fn = kwargs_fn
+
+        self.batch_size = batch_size
+        self.max_pending = max_pending if max_pending is not None else 2 * n_workers
+
+        self.batch = []
+        self.pending = deque()
+
+        self.pool = multiprocessing.Pool(n_workers, initializer=_initWorker,
+                                         initargs=(path_interwiki_links, instrumentation.enabled()))
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.pool.terminate()
+            self.pool.join()
+        return False
+
+
+    def addPage(self, **page):
+        """
+        Aggiungo una pagina grezza al batch corrente. Quando il batch è completo viene inviato
+        ai worker.
+
+        :param self
+        :param page: dict (title, id, text) della pagina letta dal dump
+        """
+        self.batch.append(page)
+        if len(self.batch) >= self.batch_size:
+            self.__submitBatch()
+
+
+    def addStream(self, path_dump, start, end, reader='sax'):
+        """
+        Invio ai worker uno stream di un dump multistream. La lettura e la decompressione
+        dello stream vengono eseguite dal worker.
+
+        :param self
+        :param path_dump: path del dump multistream
+        :param start: offset di inizio dello stream
+        :param end: offset di fine dello stream
+        :param reader: backend usato per la lettura delle pagine
+        """
+        self.__submitBatch()
+        self.__submit(_parseStream, (path_dump, start, end, reader))
+
+
+    def __submitBatch(self):
+        """
+        Invio il batch corrente ai worker.
+
+        :param self
+        """
+        if self.batch:
+            self.__submit(_filterBatch, (self.batch,))
+            self.batch = []
+
+
+    def __submit(self, task, args):
+        """
+        Invio un task ai worker. Se ci sono troppi task in attesa, consumo i risultati del
+        più vecchio prima di proseguire con la lettura.
+
+        :param self
+        :param task: funzione eseguita dal worker che ritorna le pagine filtrate e le metriche
+        :param args: argomenti del task
+        """
+        self.pending.append(self.pool.apply_async(task, args))
+
+        while len(self.pending) > self.max_pending:
+            self.__consume()
+
+
+    def __consume(self):
+        """
+        Attendo il task più vecchio, unisco le sue metriche a quelle del processo corrente e passo
+        le sue pagine filtrate alla funzione.
+
+        :param self
+        """
+        pages, metrics = self.pending.popleft().get()
+        instrumentation.merge(metrics)
+        for res in pages:
+            self.fn(*self.args_fn, **self.kwargs_fn, **res)
+
+
+    def close(self):
+        """
+        Invio l'ultimo batch, attendo tutti i risultati e chiudo il pool.
+
+        :param self
+        """
+        self.__submitBatch()
+        while self.pending:
+            self.__consume()
+
+        self.pool.close()
+        self.pool.join()
@@ -11,8 +11,10 @@ from xml.sax.xmlreader import Locator
 
 from xml.sax.expatreader import ExpatParser
 
-from . import filterText
+from . import filterText, pipeline, dumpInput, fastReader
+from .. import instrumentation
 
+import io
 import sys
 
 import os
@@ -74,6 +76,8 @@ class BaseContentHandler(ContentHandler):
         self.title = ''
         self.id_page = ''
         self.text = ''
+        self.title_chunks = []
+        self.text_chunks = []
         
         self.valid_block = True
         self.valid_id_page = True
@@ -101,26 +105,34 @@ class BaseContentHandler(ContentHandler):
         In questo caso 'content' = 'Nome Film'.
         Il content si riferisce al tag corrispondente a 'self.currentTag', ovvero
         l'ULTIMO TAG aperto e non ancora chiuso.
+
+        Il testo di una pagina arriva in molti chunk: questi vengono salvati in una lista e uniti
+        una sola volta alla chiusura del tag (concatenare le stringhe ad ogni chunk ha costo
+        quadratico sulla lunghezza del testo). Il controllo del redirect è fatto sul primo chunk.
+        Anche il titolo viene unito alla chiusura del tag, in modo che gli spazi all'interno del 
+        titolo vengano mantenuti anche se il titolo arriva in più chunk (es: 'A &amp; B').
         
         : param self
         :param content: contenuto di un elemento.
         """ 
-        if self.valid_block:
+        if self.current_tag == 'id':
+            # l'id viene letto anche per le pagine non valide (vedi 'PageRecordHandler')
+            if self.__validId():
+                self.id_page += content
+
+        elif self.valid_block:
             
             if self.current_tag == 'title':
-                self.title += content.strip()
+                self.title_chunks.append(content)
 
             elif self.current_tag == 'ns':
                 self.valid_block = self.__validNs(content)
-
-            elif self.current_tag == 'id':
-                if self.__validId():
-                    self.id_page += content
                 
             elif self.current_tag == 'text':
-                self.valid_block = self.__validText(content)
+                if not self.text_chunks:
+                    self.valid_block = self.__validText(content)
                 if self.valid_block:
-                    self.text += content 
+                    self.text_chunks.append(content)
 
                 
     def __validNs(self, ns):
@@ -160,12 +172,34 @@ class BaseContentHandler(ContentHandler):
 
     def endElement(self, tag):
         """
-        Da implementare per ogni instanza.
+        Ogni volta che termina un ELEMENTO (</TAG>) viene chiamata questa funzione.
+        Alla chiusura del testo unisco i chunk letti. Il controllo del redirect viene ripetuto sul 
+        testo completo dato che il primo chunk potrebbe contenere solo una parte di '#REDIRECT'.
+        Il contenuto che si trova dopo la chiusura di un tag (es: spazi tra due tag) non viene
+        più associato al tag chiuso.
+
+        ATTENZIONE, differenza rispetto alle versioni precedenti: prima il controllo del redirect
+        veniva fatto su OGNI chunk e il parser divide il testo ad ogni riga, quindi veniva scartata
+        anche una pagina con una riga interna che inizia con '#REDIRECT'. Ora viene scartata solo
+        se il testo inizia con '#REDIRECT': queste pagine sono indicizzate (e partecipano al
+        PageRank), quindi i ranking possono differire da un indice costruito prima.
+        Inoltre il testo non contiene più gli spazi che seguono '</text>'.
+        Le pagine con namespace non valido (Category, Template, File, ...) sono scartate come prima.
+
+        Da estendere per ogni instanza, chiamando prima questa funzione.
         
         :param self
         :param tag : ovvero il nome dell'elemento es: ' <movie> </movie> ' -> tag è 'movie'
         """
-        raise NotImplementedError
+        self.current_tag = ''
+
+        if tag == 'title':
+            self.title = ''.join(self.title_chunks).strip()
+
+        elif tag == 'text' and self.valid_block:
+            self.text = ''.join(self.text_chunks)
+            self.valid_block = self.__validText(self.text)
+
 
     def reset(self):
         """
@@ -176,6 +210,8 @@ class BaseContentHandler(ContentHandler):
         self.title = ''
         self.id_page = ''
         self.text = ''
+        self.title_chunks = []
+        self.text_chunks = []
 
         self.valid_block = True
         self.valid_id_page = True
@@ -254,6 +290,8 @@ class FilterDumpHandler(BaseContentHandler):
         :param self
         :param tag : ovvero il nome dell'elemento es: ' <movie> </movie> ' -> tag è 'movie'
         """
+        super().endElement(tag)
+
         if tag == self.block_tag: 
             if self.valid_block:
                 res = self.checkAndSelect()
@@ -293,16 +331,13 @@ class WikiDumpHandler(BaseContentHandler):
         :param self
         :param tag : ovvero il nome dell'elemento es: ' <movie> </movie> ' -> tag è 'movie'
         """
+        super().endElement(tag)
+
         if tag == self.block_tag: 
             if self.valid_block:
 
-                filtered = self.filter.startFilter(self.text, self.title)
-        
-                res ={'title': self.title,
-                      'id': self.id_page.strip(),
-                      'text': filtered['text'],
-                      'internal_link': filtered['links'],
-                      }
+                res = self.filter.filterPage(self.title, self.id_page, self.text)
+                instrumentation.count('dump_pages_total')
 
                 # Usa il risultato
                 self.fn(*self.args_fn, **self.kwargs_fn, **res)
@@ -310,34 +345,294 @@ class WikiDumpHandler(BaseContentHandler):
             self.reset() 
 
 
+class PageRecordHandler(BaseContentHandler):
+    """
+    Sottoclasse di xml.sax.ContentHandler
+
+    Non esegue il filtraggio del testo: per ogni pagina valida passa alla funzione il
+    record grezzo (title, id, text), in modo che il filtraggio possa essere eseguito
+    dai processi worker della pipeline.
+    Per le pagine non valide (redirect o namespace non valido) viene chiamata, se specificata,
+    la funzione 'fn_tombstone' con il solo id: serve all'aggiornamento dell'indice per eliminare
+    le pagine che sono diventate redirect o sono state spostate (vedi 'WikiIndex.update()').
+    """
+
+    def __init__(self, fn, *args_fn, fn_tombstone=None, **kwargs_fn):
+        """
+        :param self
+        :param fn: funzione chiamata con il record grezzo di ogni pagina valida
+        :param fn_tombstone: funzione chiamata con l'id di ogni pagina non valida (None per ignorarle)
+        """
+        super().__init__(fn, *args_fn, **kwargs_fn)
+        self.fn_tombstone = fn_tombstone
+
+
+    def endElement(self, tag):
+        """
+        Ogni volta che termina un ELEMENTO (</TAG>) viene chiamata questa funzione.
+        Se il tag chiuso è una pagina valida, passo alla funzione i dati letti senza filtrarli.
+        
+        :param self
+        :param tag : ovvero il nome dell'elemento es: ' <movie> </movie> ' -> tag è 'movie'
+        """
+        super().endElement(tag)
+
+        if tag == self.block_tag: 
+            if self.valid_block:
+                res = {'title': self.title,
+                       'id': self.id_page,
+                       'text': self.text,
+                       }
+
+                self.fn(*self.args_fn, **self.kwargs_fn, **res)
+
+            elif self.fn_tombstone is not None and self.id_page.strip():
+                self.fn_tombstone(id=self.id_page)
+
+            self.reset() 
+
+
+class SkipUntil():
+    """
+    Funzione che scarta le pagine fino a quella con id 'last_id' compresa (es: pagine già
+    indicizzate prima dell'ultimo checkpoint, vedi 'WikiIndex.build()') e chiama 'fn' per le
+    pagine successive.
+    """
+
+    def __init__(self, fn, last_id):
+        """
+        :param self
+        :param fn: funzione chiamata per le pagine dopo 'last_id'
+        :param last_id: id dell'ultima pagina da scartare
+        """
+        self.fn = fn
+        self.last_id = str(last_id).strip()
+        self.skipping = True
+        self.skipped = 0
+
+
+    def __call__(self, *args, **page):
+        if self.skipping:
+            self.skipped += 1
+            if page['id'].strip() == self.last_id:
+                self.skipping = False
+            return
+        self.fn(*args, **page)
+
+
+    def check(self):
+        """
+        Controllo, alla fine della lettura, che la pagina 'last_id' sia stata trovata.
+
+        :param self
+        """
+        if self.skipping:
+            raise ValueError('Pagina con id '+self.last_id+' non trovata nel dump: impossibile riprendere la lettura')
+        print('Pagine già indicizzate scartate : '+str(self.skipped))
+
+
 def startParse(path_file, handler):  
+    """
+    Parsing del file xml con l'handler passato. Il file può essere anche compresso 
+    ('.bz2' o '.gz', vedi 'dumpInput.openDump').
+
+    :param path_file: path del file xml
+    :param handler: ContentHandler da usare
+    """
+    with dumpInput.openDump(path_file) as fp:
+        parseFile(fp, handler)
+
+
+def parseFile(fp, handler):
+    """
+    Parsing del file object con l'handler passato.
+
+    :param fp: file object da leggere
+    :param handler: ContentHandler da usare
+    """
     parser = xml.sax.make_parser() 
     parser.setFeature(xml.sax.handler.feature_namespaces, 0) 
 
     parser.setContentHandler(handler) 
-    parser.parse(path_file)        
+    parser.parse(fp)        
+
+
+def readPages(fp, fn, reader='sax', fn_tombstone=None):
+    """
+    Lettura dei record grezzi (title, id, text) delle pagine valide, senza filtraggio del testo.
+
+    :param fp: file object da leggere
+    :param fn: funzione chiamata per ogni pagina valida
+    :param reader: backend da usare per la lettura: 'sax' ('PageRecordHandler'), 'expat' o 'lxml'
+                   (vedi 'fastReader')
+    :param fn_tombstone: funzione chiamata con l'id di ogni pagina non valida, ovvero redirect o
+                         namespace non valido (None per ignorarle)
+    """
+    if instrumentation.enabled():
+        fn_page = fn
+
+        def fn(**page):
+            instrumentation.count('dump_pages_total')
+            fn_page(**page)
+
+    if reader == 'sax':
+        parseFile(fp, PageRecordHandler(fn, fn_tombstone=fn_tombstone))
+    else:
+        fastReader.readers[reader](fp, fn, fn_tombstone)
         
             
-def readXML(args_paths, fn, *args_fn, **kwargs_fn):
+def resumeStreams(args_paths, skip_until):
+    """
+    Stream da leggere per riprendere la lettura di un dump multistream dalla pagina 'skip_until'.
+
+    :param args_paths: path del corpus e del suo file di indice ('corpus_index')
+    :param skip_until: id dell'ultima pagina già letta
+    return lista di tuple (inizio, fine) a partire dallo stream che contiene la pagina, None se il
+           dump non ha un file di indice o la pagina non è presente
+    """
+    path_index = getattr(args_paths, 'corpus_index', None)
+    if not path_index or skip_until is None:
+        return None
+
+    start = dumpInput.findStreamOffset(path_index, skip_until)
+    if start is None:
+        return None
+
+    offsets = dumpInput.readMultistreamIndex(path_index)
+    return [(begin, end) for begin, end in dumpInput.getStreamRanges(args_paths.corpus, offsets) if begin >= start]
+
+
+def indexStreams(args_paths, skip_until=None):
+    """
+    Stream da leggere di un dump multistream con file di indice ('args_paths.corpus_index'): tutti
+    gli stream, oppure con 'skip_until' quelli a partire dallo stream che contiene la pagina
+    (vedi 'resumeStreams').
+
+    :param args_paths: path del corpus e del suo file di indice
+    :param skip_until: id dell'ultima pagina già letta (None per leggere tutto il dump)
+    return lista di tuple (inizio, fine), None se il dump va letto per intero come un unico file
+           (nessun file di indice, oppure pagina 'skip_until' non presente nell'indice)
+    """
+    path_index = getattr(args_paths, 'corpus_index', None)
+    if not path_index:
+        return None
+
+    if skip_until is not None:
+        return resumeStreams(args_paths, skip_until)
+
+    offsets = dumpInput.readMultistreamIndex(path_index)
+    return dumpInput.getStreamRanges(args_paths.corpus, offsets)
+
+
+def readRecords(args_paths, fn, reader='sax', skip_until=None):
+    """
+    Lettura dei record grezzi (title, id, text) delle pagine valide del corpus.
+    Se il dump è multistream con file di indice ('args_paths.corpus_index') gli stream vengono
+    letti uno alla volta (vedi 'indexStreams').
+    Con 'skip_until' le pagine fino a quella con questo id (compresa) vengono scartate senza
+    essere filtrate; con il file di indice la lettura parte direttamente dallo stream che
+    contiene la pagina.
+
+    :param args_paths: path del corpus (ed eventualmente del suo file di indice)
+    :param fn: funzione chiamata per ogni pagina valida
+    :param reader: backend da usare per la lettura (vedi 'readPages')
+    :param skip_until: id dell'ultima pagina da scartare (None per leggere tutto il dump)
+    """
+    if skip_until is not None:
+        fn = SkipUntil(fn, skip_until)
+
+    streams = indexStreams(args_paths, skip_until)
+    if streams is not None:
+        for start, end in streams:
+            readPages(io.BytesIO(dumpInput.readStream(args_paths.corpus, start, end)), fn, reader)
+    else:
+        with dumpInput.openDump(args_paths.corpus) as fp:
+            readPages(fp, fn, reader)
+
+    if skip_until is not None:
+        fn.check()
+        
+            
+def readXML(args_paths, fn, *args_fn, skip_until=None, **kwargs_fn):
     """
     Definisco il parser, instanzio il mio ContentHandler e poi eseguo il vero e proprio parsing.
     
-    :param path_file: il path relativo per il file xml.
+    :param path_file: il path relativo per il file xml (anche '.bz2' o '.gz').
     :param fn: la funzione da eseguire quando il parser ha riconosciuto 
                 una certo blocco che mi interessa
     :param args_fn: argomenti da passare alla funzione
+    :param skip_until: id dell'ultima pagina già letta, le pagine fino a questa (compresa) vengono
+                       scartate senza essere filtrate (vedi 'readRecords')
     :param kwargs_fn: argomenti da passare alla funzione
+
+    Il backend usato per la lettura è specificato da 'args_paths.reader' (default 'sax').
+    Se è specificato il file di indice di un dump multistream ('args_paths.corpus_index') anche
+    senza worker gli stream vengono letti e decompressi uno alla volta (vedi 'readRecords').
     """
-    handler = WikiDumpHandler(args_paths.interwiki_links, fn, *args_fn, **kwargs_fn)
+    n_workers = getattr(args_paths, 'workers', 0)
+    if n_workers > 0:
+        readXMLPipeline(args_paths, n_workers, fn, *args_fn, skip_until=skip_until, **kwargs_fn)
+        return
+
+    reader = getattr(args_paths, 'reader', 'sax')
+    if reader == 'sax' and skip_until is None and not getattr(args_paths, 'corpus_index', None):
+        handler = WikiDumpHandler(args_paths.interwiki_links, fn, *args_fn, **kwargs_fn)
+
+        startParse(args_paths.corpus, handler)
+    else:
+        page_filter = filterText.FilterWikiText(args_paths.interwiki_links)
+
+        def filterAndCall(title, id, text):
+            fn(*args_fn, **kwargs_fn, **page_filter.filterPage(title, id, text))
+
+        readRecords(args_paths, filterAndCall, reader, skip_until)
+
+
+def readXMLPipeline(args_paths, n_workers, fn, *args_fn, skip_until=None, **kwargs_fn):
+    """
+    Come 'readXML' ma il filtraggio delle pagine viene eseguito da 'n_workers' processi.
+    Il parser legge solo i record grezzi delle pagine che vengono inviati ai worker tramite 
+    la 'PagePipeline'. La funzione viene chiamata nel processo corrente, nell'ordine di lettura
+    delle pagine.
+
+    Se è specificato il file di indice di un dump multistream ('args_paths.corpus_index'), il
+    dump non viene letto dal processo corrente: ogni stream viene letto, decompresso e filtrato 
+    in modo indipendente da un worker.
+
+    :param args_paths: path del corpus e degli interwiki link
+    :param n_workers: numero di processi usati per il filtraggio
+    :param fn: la funzione da eseguire per ogni pagina filtrata
+    :param args_fn: argomenti da passare alla funzione
+    :param skip_until: id dell'ultima pagina già letta (vedi 'readXML'). Con un dump multistream
+                       la lettura riparte dallo stream che la contiene, e le pagine precedenti dello
+                       stream vengono scartate dopo il filtraggio
+    :param kwargs_fn: argomenti da passare alla funzione
+    """
+    reader = getattr(args_paths, 'reader', 'sax')
+
+    streams = indexStreams(args_paths, skip_until)
+
+    skip_filtered = None
+    if streams is not None and skip_until is not None:
+        fn = skip_filtered = SkipUntil(fn, skip_until)
+
+    with pipeline.PagePipeline(args_paths.interwiki_links, n_workers, 
+                               fn, *args_fn, **kwargs_fn) as pipe:
+        if streams is not None:
+            for start, end in streams:
+                pipe.addStream(args_paths.corpus, start, end, reader)
+        else:
+            readRecords(args_paths, pipe.addPage, reader, skip_until)
 
-    startParse(args_paths.corpus, handler)
+    if skip_filtered is not None:
+        skip_filtered.check()
 
 
 def filterXML(path_file, total_docs_noise, titles_to_select, fn, *args_fn, **kwargs_fn):
     """
     Definisco il parser, instanzio il mio ContentHandler e poi eseguo il vero e proprio parsing.
     
-    :param path_file: il path relativo per il file xml
+    :param path_file: il path relativo per il file xml (anche '.bz2' o '.gz')
     :param total_docs_noise: num totale di doc di rumore
     :param titles_to_select: iterabile di titoli da filtrare
     :param fn: la funzione da eseguire quando il parser ha riconosciuto 
@@ -0,0 +1,404 @@
+from indexing.searching.searchPool import SearchPool
+
+import argparse
+import asyncio
+import json
+import os
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qsl
+
+
+"""
+Servizio HTTP/JSON per la ricerca, senza interfaccia grafica (es: dietro un load balancer).
+
+    GET  /search?q=roman+empire&limit=10&page_rank=true
+    POST /search      {"q": "roman empire", "limit": 10, "page_rank": true}
+    GET  /health      (stato del servizio e contatori della cache dei risultati)
+
+I parametri della ricerca sono gli stessi di 'WikiSearcher.search'. Le ricerche sono eseguite da un
+pool di processi (o thread) worker (vedi 'SearchPool'), quindi l'event loop rimane libero di accettare
+richieste. Se le ricerche in corso sono già 'max_pending' la richiesta viene rifiutata subito (503),
+se la ricerca non termina entro 'timeout' secondi viene ritornato 504.
+"""
+
+
+def parseBool(value):
+    """
+    :param value: bool oppure stringa ('true', '1', 'yes', 'false', '0', 'no')
+    return bool
+    """
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in ('true', '1', 'yes'):
+        return True
+    if value in ('false', '0', 'no'):
+        return False
+    raise ValueError('Valore booleano non valido: '+value)
+
+
+# parametri della ricerca accettati e funzione di conversione
+SETTINGS = {'limit': int,
+            'exp': parseBool,
+            'page_rank': parseBool,
+            'text_boost': float,
+            'title_boost': float,
+            'weighting': str,
+            'group': str,
+            'highlight': parseBool,
+            }
+
+
+class HttpError(Exception):
+    """
+    Errore da ritornare al client con il relativo status code.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parseSearchRequest(params, max_limit=100):
+    """
+    Controllo e conversione dei parametri della richiesta di ricerca.
+
+    :param params: dict dei parametri (query string o body json)
+    :param max_limit: valore max del parametro 'limit' (una ricerca già avviata non può essere
+                      interrotta dal timeout, quindi ogni ricerca deve avere un costo limitato)
+    return testo della query, dict dei settings
+    """
+    text = params.get('q')
+    if not isinstance(text, str) or not text.strip():
+        raise HttpError(HTTPStatus.BAD_REQUEST, 'Parametro \'q\' mancante')
+
+    settings = {}
+    for name, value in params.items():
+        if name == 'q':
+            continue
+        if name not in SETTINGS:
+            raise HttpError(HTTPStatus.BAD_REQUEST, 'Parametro non valido: '+name)
+        try:
+            settings[name] = SETTINGS[name](value)
+        except (TypeError, ValueError):
+            raise HttpError(HTTPStatus.BAD_REQUEST, 'Valore non valido per \''+name+'\'')
+
+    if settings.get('limit', 10) <= 0:
+        raise HttpError(HTTPStatus.BAD_REQUEST, 'Il parametro \'limit\' deve essere > 0')
+    if settings.get('limit', 10) > max_limit:
+        raise HttpError(HTTPStatus.BAD_REQUEST, 'Il parametro \'limit\' deve essere <= '+str(max_limit))
+
+    return text, settings
+
+
+class SearchService():
+    """
+    Server HTTP asyncio. Ogni connessione gestisce una sola richiesta.
+    """
+
+    max_header_size = 16 * 1024
+    max_body_size = 64 * 1024
+
+    def __init__(self, pool, timeout=10.0, max_pending=64, read_timeout=5.0, max_limit=100):
+        """
+        :param self
+        :param pool: SearchPool che esegue le ricerche
+        :param timeout: secondi max per una ricerca
+        :param max_pending: numero max di ricerche in corso o in attesa nel pool
+        :param read_timeout: secondi max per leggere la richiesta
+        :param max_limit: numero max di documenti ritornati per ricerca (vedi 'parseSearchRequest')
+        """
+        self.pool = pool
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.read_timeout = read_timeout
+        self.max_limit = max_limit
+
+        self.pending = 0
+        self.stats = {'requests': 0, 'rejected': 0, 'timeouts': 0, 'errors': 0}
+
+
+    async def handle(self, reader, writer):
+        """
+        Gestione di una connessione: lettura della richiesta, esecuzione e risposta.
+
+        :param self
+        :param reader: asyncio.StreamReader
+        :param writer: asyncio.StreamWriter
+        """
+        try:
+            try:
+                method, target, body = await asyncio.wait_for(self.readRequest(reader), self.read_timeout)
+                status, response = await self.route(method, target, body)
+            except HttpError as e:
+                status, response = e.status, {'error': str(e)}
+            except asyncio.TimeoutError:
+                status, response = HTTPStatus.REQUEST_TIMEOUT, {'error': 'Timeout lettura richiesta'}
+            except (ConnectionError, asyncio.IncompleteReadError):
+                raise
+            except Exception as e:
+                # errore non previsto: il client riceve comunque una risposta
+                self.stats['errors'] += 1
+                status, response = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': 'Errore interno: '+str(e)}
+
+            await self.writeResponse(writer, status, response)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+    async def readRequest(self, reader):
+        """
+        Lettura della request line, degli header e del body (se presente).
+
+        :param self
+        :param reader: asyncio.StreamReader
+        return metodo, target, body (bytes)
+        """
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, 'Header troppo grandi')
+        if len(head) > SearchService.max_header_size:
+            raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, 'Header troppo grandi')
+
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            raise HttpError(HTTPStatus.BAD_REQUEST, 'Request line non valida')
+
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HttpError(HTTPStatus.BAD_REQUEST, 'Content-Length non valido')
+        if length > SearchService.max_body_size:
+            raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'Body troppo grande')
+
+        body = await reader.readexactly(length) if length > 0 else b''
+        return method.upper(), target, body
+
+
+    async def route(self, method, target, body):
+        """
+        :param self
+        :param method: metodo HTTP
+        :param target: path e query string
+        :param body: body della richiesta
+        return status, dict della risposta
+        """
+        url = urlsplit(target)
+
+        if url.path == '/health':
+            return HTTPStatus.OK, {'status': 'ok', 'pending': self.pending, **self.stats,
+                                   'result_cache': self.pool.getCacheInfo()}
+
+        if url.path != '/search':
+            raise HttpError(HTTPStatus.NOT_FOUND, 'Risorsa non trovata')
+
+        if method == 'GET':
+            params = dict(parse_qsl(url.query))
+        elif method == 'POST':
+            try:
+                params = json.loads(body.decode('utf-8'))
+            except (UnicodeDecodeError, ValueError):
+                raise HttpError(HTTPStatus.BAD_REQUEST, 'Body json non valido')
+            if not isinstance(params, dict):
+                raise HttpError(HTTPStatus.BAD_REQUEST, 'Il body deve essere un oggetto json')
+        else:
+            raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, 'Metodo non supportato')
+
+        text, settings = parseSearchRequest(params, self.max_limit)
+        return HTTPStatus.OK, await self.search(text, settings)
+
+
+    async def search(self, text, settings):
+        """
+        Esecuzione della ricerca nel pool.
+        Il posto nel pool viene liberato quando la ricerca termina davvero (anche dopo un timeout),
+        così 'pending' rappresenta il carico effettivo dei worker.
+
+        :param self
+        :param text: testo della query
+        :param settings: parametri della ricerca
+        return dict con i risultati
+        """
+        self.stats['requests'] += 1
+
+        if self.pending >= self.max_pending:
+            self.stats['rejected'] += 1
+            raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, 'Troppe ricerche in corso')
+
+        loop = asyncio.get_running_loop()
+        future = self.pool.submit(text, **settings)
+        self.pending += 1
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self.__release))
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            self.stats['timeouts'] += 1
+            raise HttpError(HTTPStatus.GATEWAY_TIMEOUT, 'Timeout della ricerca')
+        except Exception as e:
+            self.stats['errors'] += 1
+            raise HttpError(HTTPStatus.INTERNAL_SERVER_ERROR, 'Errore durante la ricerca: '+str(e))
+
+
+    def __release(self):
+        self.pending -= 1
+
+
+    async def writeResponse(self, writer, status, response):
+        """
+        :param self
+        :param writer: asyncio.StreamWriter
+        :param status: HTTPStatus della risposta
+        :param response: dict da ritornare in json
+        """
+        body = json.dumps(response).encode('utf-8')
+        head = ('HTTP/1.1 {} {}\r\n'
+                'Content-Type: application/json; charset=utf-8\r\n'
+                'Content-Length: {}\r\n'
+                'Connection: close\r\n').format(status.value, status.phrase, len(body))
+        if status == HTTPStatus.SERVICE_UNAVAILABLE:
+            head += 'Retry-After: 1\r\n'
+
+        writer.write(head.encode('latin-1')+b'\r\n'+body)
+        await writer.drain()
+
+
+async def serve(service, host, port):
+    """
+    Avvio del server.
+
+    :param service: SearchService
+    :param host: indirizzo su cui ascoltare
+    :param port: porta su cui ascoltare
+    """
+    server = await asyncio.start_server(service.handle, host, port,
+                                        limit=SearchService.max_header_size+SearchService.max_body_size)
+    print('In ascolto su http://{}:{}'.format(host, port))
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Servizio HTTP/JSON per la ricerca sull\'indice.')
+    p.add_argument(
+        '--index_dir',
+        type=str,
+        default='files/indexdir',
+        help='Folder indice whoosh (l\'indice deve essere già stato creato).')
+    p.add_argument(
+        '--pagerank',
+        type=str,
+        default='files/table.rank',
+        help='File del pagerank calcolato.')
+    p.add_argument(
+        '--host',
+        type=str,
+        default='127.0.0.1',
+        help='Indirizzo su cui ascoltare.')
+    p.add_argument(
+        '--port',
+        type=int,
+        default=8080,
+        help='Porta su cui ascoltare.')
+    p.add_argument(
+        '--cache_size',
+        type=int,
+        default=1024,
+        help='Numero max di risultati salvati nella cache delle ricerche (0 per disabilitarla).')
+    p.add_argument(
+        '--cache_ttl',
+        type=float,
+        default=300.0,
+        help='Secondi dopo i quali un risultato della cache scade.')
+    p.add_argument(
+        '--expansion_table',
+        type=str,
+        default='files/expansion.table',
+        help='File della tabella dei sinonimi presenti nell\'indice (vedi \'buildExpansionTable.py\'). Se non esiste viene usato solo WordNet.')
+    p.add_argument(
+        '--wsd_max_pairs',
+        type=int,
+        default=5000,
+        help='Numero max di coppie di significati confrontate nella disambiguazione di una query.')
+    p.add_argument(
+        '--wsd_max_time',
+        type=float,
+        default=0.2,
+        help='Secondi max per la disambiguazione di una query (oltre viene usato il primo significato).')
+    p.add_argument(
+        '--expansion_cache',
+        type=str,
+        default='files/expansion.cache',
+        help='File della cache su disco delle espansioni delle query (stringa vuota per disabilitarla).')
+    p.add_argument(
+        '--expansion_cache_size',
+        type=int,
+        default=10000,
+        help='Numero max di espansioni salvate nella cache.')
+    p.add_argument(
+        '--warm_up',
+        action='store_true',
+        help='Caricamento in background di pagerank, nltk e WordNet subito dopo l\'apertura dell\'indice, invece che alla prima ricerca.')
+    p.add_argument(
+        '--metrics',
+        type=str,
+        default=None,
+        choices=['log', 'prometheus'],
+        help='Sink delle metriche di indicizzazione e ricerca (vedi \'indexing/instrumentation.py\'), se non specificato sono disabilitate.')
+    p.add_argument(
+        '--metrics_file',
+        type=str,
+        default='files/metrics.{pid}.prom',
+        help='File delle metriche per il sink \'prometheus\' (\'{pid}\' viene sostituito con il pid del processo).')
+    p.add_argument(
+        '--metrics_interval',
+        type=float,
+        default=10.0,
+        help='Secondi tra due invii delle metriche al sink.')
+    p.add_argument(
+        '--workers',
+        type=int,
+        default=os.cpu_count(),
+        help='Numero di worker che eseguono le ricerche.')
+    p.add_argument(
+        '--mode',
+        type=str,
+        default='process',
+        choices=SearchPool.modes,
+        help='Pool di processi o di thread.')
+    p.add_argument(
+        '--timeout',
+        type=float,
+        default=10.0,
+        help='Secondi max per una ricerca.')
+    p.add_argument(
+        '--max_pending',
+        type=int,
+        default=64,
+        help='Numero max di ricerche in corso, oltre il quale le richieste vengono rifiutate (503).')
+    p.add_argument(
+        '--max_limit',
+        type=int,
+        default=100,
+        help='Valore max del parametro \'limit\' di una ricerca (oltre la richiesta viene rifiutata, 400).')
+
+    args_paths = p.parse_args()
+
+    with SearchPool(args_paths, args_paths.workers, args_paths.mode) as pool:
+        service = SearchService(pool, args_paths.timeout, args_paths.max_pending, max_limit=args_paths.max_limit)
+        try:
+            asyncio.run(serve(service, args_paths.host, args_paths.port))
+        except KeyboardInterrupt:
+            print('Chiusura del server')
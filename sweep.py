@@ -0,0 +1,166 @@
+from indexing import parameterSweep
+
+import argparse
+import os
+
+
+"""
+Ricerca dei parametri della ricerca (griglia o campione casuale) valutati con le query dell'evaluation,
+senza interfaccia grafica, es:
+
+    python sweep.py --title_boost 1,2,4 --weighting BM25F,TF_IDF --exp false --workers 4
+
+La tabella con MAP, NDCG, R-precision e F-measure di ogni configurazione viene salvata in csv.
+"""
+
+
+def parseList(value, convert):
+    """
+    :param value: valori separati da virgola
+    :param convert: funzione di conversione di ogni valore
+    return lista dei valori convertiti
+    """
+    return [convert(v.strip()) for v in value.split(',') if v.strip()]
+
+
+def parseBool(value):
+    """
+    :param value: stringa ('true', '1', 'yes', 'false', '0', 'no')
+    return bool
+    """
+    value = value.lower()
+    if value in ('true', '1', 'yes'):
+        return True
+    if value in ('false', '0', 'no'):
+        return False
+    raise argparse.ArgumentTypeError('Valore booleano non valido: '+value)
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Ricerca dei parametri della ricerca con le query dell\'evaluation.')
+    p.add_argument(
+        '--index_dir',
+        type=str,
+        default='files/indexdir',
+        help='Folder indice whoosh (l\'indice deve essere già stato creato).')
+    p.add_argument(
+        '--pagerank',
+        type=str,
+        default='files/table.rank',
+        help='File del pagerank calcolato.')
+    p.add_argument(
+        '--google_links',
+        type=str,
+        default='files/google_links.json',
+        help='File dei link di Google usati come test set.')
+    p.add_argument(
+        '--interwiki_links',
+        type=str,
+        default='files/interwiki.prefix',
+        help='File per gli interwiki links.')
+    p.add_argument(
+        '--expansion_table',
+        type=str,
+        default='files/expansion.table',
+        help='File della tabella dei sinonimi presenti nell\'indice (vedi \'buildExpansionTable.py\').')
+    p.add_argument(
+        '--expansion_cache',
+        type=str,
+        default='files/expansion.cache',
+        help='File della cache su disco delle espansioni, condivisa dai worker (stringa vuota per disabilitarla).')
+    p.add_argument(
+        '--cache_size',
+        type=int,
+        default=0,
+        help='Numero max di risultati salvati nella cache delle ricerche di ogni worker.')
+    p.add_argument(
+        '--limit',
+        type=int,
+        default=10,
+        help='Numero di documenti ritornati per query.')
+    p.add_argument(
+        '--text_boost',
+        type=lambda v: parseList(v, float),
+        default=[1.0],
+        help='Valori del boosting del campo testo, separati da virgola.')
+    p.add_argument(
+        '--title_boost',
+        type=lambda v: parseList(v, float),
+        default=[1.0, 2.0, 4.0],
+        help='Valori del boosting del campo titolo, separati da virgola.')
+    p.add_argument(
+        '--weighting',
+        type=lambda v: parseList(v, str),
+        default=['BM25F', 'TF_IDF', 'FREQUENCY'],
+        help='Metodi di weighting, separati da virgola.')
+    p.add_argument(
+        '--group',
+        type=lambda v: parseList(v, str),
+        default=['AND', 'OR'],
+        help='Concatenazione dei token della query (AND, OR), separati da virgola.')
+    p.add_argument(
+        '--exp',
+        type=lambda v: parseList(v, parseBool),
+        default=[False, True],
+        help='Query expansion (true, false), separati da virgola.')
+    p.add_argument(
+        '--page_rank',
+        type=lambda v: parseList(v, parseBool),
+        default=[False, True],
+        help='Pagerank (true, false), separati da virgola.')
+    p.add_argument(
+        '--search',
+        type=str,
+        default='grid',
+        choices=('grid', 'random'),
+        help='Tutte le combinazioni dei valori o un campione casuale di \'samples\' combinazioni.')
+    p.add_argument(
+        '--samples',
+        type=int,
+        default=20,
+        help='Numero di configurazioni provate con la ricerca casuale.')
+    p.add_argument(
+        '--seed',
+        type=int,
+        default=None,
+        help='Seed della ricerca casuale.')
+    p.add_argument(
+        '--workers',
+        type=int,
+        default=os.cpu_count(),
+        help='Numero di processi che valutano le configurazioni.')
+    p.add_argument(
+        '--output',
+        type=str,
+        default='files/sweep.csv',
+        help='File csv della tabella dei risultati.')
+    p.add_argument(
+        '--top',
+        type=int,
+        default=10,
+        help='Numero di configurazioni migliori stampate alla fine.')
+
+    args_paths = p.parse_args()
+
+    grid = {name: getattr(args_paths, name) for name in parameterSweep.PARAMETERS}
+    if args_paths.search == 'grid':
+        configurations = parameterSweep.gridConfigurations(grid)
+    else:
+        configurations = parameterSweep.randomConfigurations(grid, args_paths.samples, args_paths.seed)
+    for settings in configurations:
+        settings['limit'] = args_paths.limit
+
+    print('Configurazioni da valutare : {}  |  worker : {}'.format(len(configurations), args_paths.workers))
+
+    def progress(row):
+        progress.done += 1
+        print('[{}/{}] MAP {}  NDCG {}  ({}s)  {}'.format(progress.done, len(configurations), row['map'], row['ndcg'],
+                                                           row['seconds'], {name: row[name] for name in grid}))
+    progress.done = 0
+
+    rows = parameterSweep.sweep(args_paths, configurations, args_paths.workers, callback=progress)
+    rows = parameterSweep.writeTable(args_paths.output, rows)
+
+    print('Tabella dei risultati salvata in '+args_paths.output)
+    for row in rows[:args_paths.top]:
+        print('MAP {}  NDCG {}  {}'.format(row['map'], row['ndcg'], {name: row[name] for name in grid}))
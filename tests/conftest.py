@@ -0,0 +1,8 @@
+import os
+import sys
+
+
+# I test importano i moduli del progetto ('indexing', ...) dalla root del repository.
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
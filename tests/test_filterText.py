@@ -0,0 +1,67 @@
+from indexing.xmlParsing.filterText import FilterWikiText
+from indexing.xmlParsing import saxReader
+
+import os
+import re
+
+import pytest
+
+
+"""
+Verifica che 'FilterWikiText.getCleaned' dia un risultato identico all'implementazione di
+riferimento, che esegue ogni sostituzione con un 're.sub' sull'intero testo.
+"""
+
+
+PATH_CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'files', 'filtered.xml')
+
+
+def getCleanedReference(text):
+    """
+    Pulizia del testo eseguendo ogni sostituzione con un 're.sub' sull'intero testo.
+
+    :param text: testo da pulire
+    return testo pulito
+    """
+    replacements = [(old, new) for old, new, _ in FilterWikiText.replacements] + \
+                   [(re.escape(old), new) for old, new in FilterWikiText.char_replacements]
+    res = text
+    for old, new in replacements:
+        res = re.sub(old, new, res, flags=re.DOTALL) # perchè il '.' non fa match con newline
+
+    return res
+
+
+def loadPages(path_corpus):
+    """
+    Lettura delle pagine valide (non filtrate) del corpus.
+
+    :param path_corpus: path del file xml
+    return lista di dict (title, id, text)
+    """
+    pages = []
+    saxReader.startParse(path_corpus, saxReader.PageRecordHandler(lambda **page: pages.append(page)))
+    return pages
+
+
+@pytest.mark.skipif(not os.path.exists(PATH_CORPUS), reason='files/filtered.xml non presente')
+def test_cleanedCorpus():
+    pages = loadPages(PATH_CORPUS)
+    assert pages
+
+    different = [page['title'] for page in pages
+                 if FilterWikiText.getCleaned(page['text']) != getCleanedReference(page['text'])]
+    assert different == []
+
+
+@pytest.mark.parametrize('text', [
+    '',
+    'testo senza markup',
+    '{{cite web|url=http://a.com|title=x}} resto',
+    '{{a {{lang|en|b}} c}} [[File:x.jpg|thumb|[[Link]] interno]] fine',
+    '<gallery>\nFile:a.jpg\n</gallery> [[Media:b.ogg|suono]] <ref name="a">x</ref>',
+    ' vedi http://example.org/x e www.site.it oppure sito.com\n',
+    '[[Categoria:Test]] a|b=c*d/e {{coord|1|2}} {{Reflist}} {{commons}}',
+])
+def test_cleanedText(text):
+    assert FilterWikiText.getCleaned(text) == getCleanedReference(text)
@@ -0,0 +1,77 @@
+from indexing.searching.queryExpansion import Disambiguator
+from indexing.searching.senseSimilarity import WordNetHypernyms, TableHypernyms, WupDisambiguator, \
+                                               hypernymDistances, nltkCorpus
+
+import pytest
+
+
+"""
+Verifica che 'WupDisambiguator.disambiguate' (senza limiti di coppie e di tempo) scelga per ogni
+token lo stesso significato di 'Disambiguator.nounSenseDisambiguate'.
+Richiede WordNet di nltk: se non è installato i test vengono saltati.
+"""
+
+
+QUERIES = [
+    ['bank', 'river', 'water'],
+    ['bank', 'money', 'loan'],
+    ['apple', 'fruit', 'tree'],
+    ['apple', 'computer', 'software'],
+    ['jaguar', 'car', 'engine', 'speed'],
+    ['python', 'snake', 'venom'],
+    ['bass', 'fish', 'lake', 'fishing'],
+    ['crane', 'bird', 'crane', 'wing'],
+    ['star', 'film', 'actor'],
+    ['mercury', 'planet', 'orbit', 'xyzzy'],
+    ['cell', 'prison'],
+    ['cell'],
+]
+
+
+def wordnetAvailable():
+    """
+    return True se nltk e il corpus WordNet sono installati
+    """
+    try:
+        nltkCorpus('wordnet')
+    except (ImportError, LookupError):
+        return False
+    return True
+
+
+pytestmark = pytest.mark.skipif(not wordnetAvailable(), reason='WordNet di nltk non installato')
+
+
+def tableHypernyms(queries):
+    """
+    TableHypernyms con i soli significati (e i loro iperonimi) dei token delle query.
+
+    :param queries: liste di token
+    return TableHypernyms
+    """
+    synsets = {}
+    for tokens in queries:
+        for token in tokens:
+            for synset in Disambiguator.nounSynsets(token):
+                synsets.update(dict.fromkeys(hypernymDistances(synset)))
+
+    synsets = sorted(synsets, key=lambda s: s.name())
+    ids = {s.name(): i for i, s in enumerate(synsets)}
+    arrays = TableHypernyms.buildArrays(synsets, ids)
+    return TableHypernyms([s.name() for s in synsets], ids, **arrays)
+
+
+@pytest.fixture(scope='module', params=['wordnet', 'table'])
+def wup(request):
+    hypernyms = WordNetHypernyms() if request.param == 'wordnet' else tableHypernyms(QUERIES)
+    return WupDisambiguator(hypernyms, max_pairs=float('inf'), max_time=None)
+
+
+@pytest.mark.parametrize('tokens', QUERIES, ids=' '.join)
+def test_sameSenses(wup, tokens):
+    senses = [Disambiguator.nounSynsets(t) for t in tokens]
+    res, complete = wup.disambiguate(tokens, senses, range(len(tokens)))
+
+    assert complete
+    expected = [Disambiguator.nounSenseDisambiguate(tokens, t) for t in tokens]
+    assert res == expected
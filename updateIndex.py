@@ -0,0 +1,98 @@
+from indexing import index
+
+import argparse
+
+
+def loadDeletedIds(path_deleted):
+    """
+    Lettura degli id delle pagine da eliminare (un id per riga).
+
+    :param path_deleted: path del file, None se non ci sono pagine da eliminare
+    return lista di id
+    """
+    if path_deleted is None:
+        return []
+
+    with open(path_deleted, 'r') as fp:
+        return [line.strip() for line in fp if line.strip()]
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Aggiornamento incrementale dell\'indice a partire da un dump più recente.')
+    p.add_argument(
+        '--index_dir',
+        type=str,
+        default='files/indexdir',
+        help='Folder indice whoosh.')
+    p.add_argument(
+        '--corpus',
+        type=str,
+        default=None,
+        help='Dump più recente (anche compresso \'.bz2\' o \'.gz\') oppure dump con solo le pagine aggiunte/modificate.')
+    p.add_argument(
+        '--partial',
+        action='store_true',
+        help='Il dump contiene solo le pagine aggiunte/modificate: le pagine non presenti non vengono eliminate.')
+    p.add_argument(
+        '--deleted',
+        type=str,
+        default=None,
+        help='File con gli id delle pagine da eliminare (un id per riga).')
+    p.add_argument(
+        '--reader',
+        type=str,
+        default='sax',
+        choices=['sax', 'expat', 'lxml'],
+        help='Backend usato per la lettura del dump.')
+    p.add_argument(
+        '--interwiki_links',
+        type=str,
+        default='files/interwiki.prefix',
+        help='File per gli interwiki links.')
+    p.add_argument(
+        '--pagerank',
+        type=str,
+        default='files/table.rank',
+        help='File dove salvo il pagerank calcolato')
+    p.add_argument(
+        '--pagerank_engine',
+        type=str,
+        default='snap',
+        choices=['snap', 'numpy'],
+        help='Calcolo del pagerank con snap oppure con NumPy/SciPy sulla matrice CSR del grafo.')
+    p.add_argument(
+        '--graph',
+        type=str,
+        default='files/graph.state',
+        help='File con lo stato del grafo salvato alla creazione dell\'indice.')
+    p.add_argument(
+        '--expansion_table',
+        type=str,
+        default=None,
+        help='Se specificato, dopo l\'aggiornamento viene ricreata la tabella dei sinonimi presenti nell\'indice.')
+    p.add_argument(
+        '--metrics',
+        type=str,
+        default=None,
+        choices=['log', 'prometheus'],
+        help='Sink delle metriche di indicizzazione e ricerca (vedi \'indexing/instrumentation.py\'), se non specificato sono disabilitate.')
+    p.add_argument(
+        '--metrics_file',
+        type=str,
+        default='files/metrics.prom',
+        help='File delle metriche per il sink \'prometheus\' (\'{pid}\' viene sostituito con il pid del processo).')
+    p.add_argument(
+        '--metrics_interval',
+        type=float,
+        default=10.0,
+        help='Secondi tra due invii delle metriche al sink.')
+
+    args_paths = p.parse_args()
+
+    if args_paths.corpus is None:
+        print('Specificare il dump con cui aggiornare l\'indice')
+    else:
+        wiki_index = index.WikiIndex(args_paths)
+        wiki_index.update(loadDeletedIds(args_paths.deleted), args_paths.partial)
+        if args_paths.expansion_table is not None:
+            wiki_index.buildExpansionTable()